@@ -0,0 +1,210 @@
+from App.database import db
+from App.config import config
+from App.models import Journey, RouteStop, Route
+from App.controllers.synth import generate_synthetic_data
+from App.query_guard import track_queries
+from contextvars import copy_context
+from datetime import datetime
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+# Synthetic dataset sizes, passed to generate_synthetic_data
+SCALES = {
+    'small': {'areas': 5, 'routes': 10, 'stops': (6, 15), 'buses_per_route': 2, 'days': 1, 'trips_per_day': 4, 'active': 1},
+    'medium': {'areas': 10, 'routes': 40, 'stops': (8, 25), 'buses_per_route': 3, 'days': 3, 'trips_per_day': 6, 'active': 2},
+    'large': {'areas': 20, 'routes': 100, 'stops': (8, 30), 'buses_per_route': 3, 'days': 7, 'trips_per_day': 6, 'active': 2}
+}
+
+# Metrics compared between runs, and the smallest change of each that counts as a regression
+REGRESSION_METRICS = {'p95_ms': 0.5, 'queries': 0.5, 'peak_kb': 64}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def measure(function, iterations, warmup=2):
+    """
+    Latency percentiles (ms), statements per call and peak Python allocations (KiB) of
+    function(i) for i in range(iterations). Every call starts with a fresh session, as a request would.
+    """
+    for i in range(warmup):
+        db.session.remove()
+        function(i)
+    latencies = []
+    queries = 0
+    for i in range(iterations):
+        db.session.remove()
+        with track_queries() as log:
+            started = time.perf_counter()
+            function(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries += log.count
+
+    # tracemalloc slows everything down, so memory is measured on a separate call
+    db.session.remove()
+    tracemalloc.start()
+    try:
+        function(iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'iterations': iterations,
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': max(latencies),
+        'queries': queries / iterations,
+        'peak_kb': peak / 1024
+    }
+
+
+def build_cases(seed=0):
+    """The hot paths to time, each a function of the iteration number"""
+    from flask import current_app
+    from App.controllers.journey import create_journey_board_event, create_journey_track_event
+
+    rng = random.Random(seed)
+    active = [(journey.id, journey.route_id, journey.current_stop_index)
+              for journey in Journey.query.filter(Journey.endTime.is_(None)).order_by(Journey.id)]
+    completed = [journey.id for journey in Journey.query.filter(Journey.endTime.isnot(None)).order_by(Journey.id).limit(500)]
+    route_ids = [route.id for route in Route.query.order_by(Route.id)]
+    if not active or not completed:
+        raise ValueError("The benchmark needs completed and in-progress journeys, seed with active journeys")
+    rng.shuffle(completed)
+
+    # The stop each active bus is heading to, and the stop it is at
+    approaching = []
+    at_stop = []
+    for journey_id, route_id, index in active:
+        stops = {stop.stop_index: stop for stop in RouteStop.query.filter_by(route_id=route_id)}
+        if index + 1 in stops:
+            approaching.append((stops[index + 1].location_id, route_id))
+        at_stop.append((journey_id, stops[index].id))
+    queries = ['Stop 1', 'Terminal', 'Route 2', 'Area 3', 'zz']
+    client = current_app.test_client()
+
+    def get_buses(i):
+        from App.models import Location
+        location_id, route_id = approaching[i % len(approaching)]
+        return Location.query.get(location_id).getBuses(route_id)
+
+    def board(i):
+        # Each bus gets a boarding then an alighting, so it never fills up or runs empty
+        journey_id, stop_id = at_stop[i // 2 % len(at_stop)]
+        return create_journey_board_event(journey_id, "Exit" if i % 2 else "Enter", 1, stop_id)
+
+    def track(i):
+        journey_id, _ = at_stop[i % len(at_stop)]
+        return create_journey_track_event(journey_id, 10.5 + rng.uniform(-0.1, 0.1), -61.3 + rng.uniform(-0.1, 0.1))
+
+    return {
+        'location_get_buses': get_buses,
+        'journey_get_stats': lambda i: Journey.query.get(completed[i % len(completed)]).getStats(),
+        'journey_calculate_progress': lambda i: Journey.query.get(active[i % len(active)][0]).calculateProgress(),
+        'search_stops': lambda i: client.get(f'/api/stops/search?q={queries[i % len(queries)]}'),
+        'get_route_api': lambda i: client.get(f'/api/routes/{route_ids[i % len(route_ids)]}'),
+        'create_board_event': board,
+        'gps_ingest': track
+    }
+
+def benchmark_scale(params, iterations=30, seed=0):
+    """Generate a synthetic dataset into the current database and time every case on it"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    generated = generate_synthetic_data(seed=seed, **params)
+    results = {'rows': generated['total'], 'generate_s': generated['seconds'], 'cases': {}}
+    for name, function in build_cases(seed).items():
+        results['cases'][name] = measure(function, iterations)
+    db.session.remove()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(scales=('small',), iterations=30, seed=0, database='sqlite:///bench_{scale}.db'):
+    """
+    Run the benchmark cases at each scale, each on its own database (never the configured
+    one, the datasets are recreated). Returns the results document.
+    """
+    from App.main import create_app
+    previous = dict(config)
+    results = {
+        'commit': git_commit(),
+        'created': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'seed': seed,
+        'scales': {}
+    }
+    for scale in scales:
+        # create_app pushes a context of its own, kept out of ours by creating the app in a copy
+        app = copy_context().run(create_app, {'SQLALCHEMY_DATABASE_URI': database.format(scale=scale),
+                                               'ADMIN_ENABLED': False})
+        try:
+            with app.app_context():
+                try:
+                    results['scales'][scale] = benchmark_scale(SCALES[scale], iterations, seed)
+                    db.drop_all()
+                finally:
+                    db.session.remove()
+                    for engine in db.engines.values():
+                        engine.dispose()
+        finally:
+            config.clear()
+            config.update(previous)
+    return results
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, threshold=0.2, floors=None):
+    """
+    Metric changes between two result documents. A change is a regression (or improvement)
+    when it is more than `threshold` relative and more than the metric's floor in absolute terms.
+    """
+    floors = floors or REGRESSION_METRICS
+    rows = []
+    for scale, results in current['scales'].items():
+        base_cases = baseline.get('scales', {}).get(scale, {}).get('cases', {})
+        for case, metrics in results['cases'].items():
+            if case not in base_cases:
+                continue
+            for metric, floor in floors.items():
+                before, after = base_cases[case].get(metric), metrics.get(metric)
+                if before is None or after is None:
+                    continue
+                change = (after - before) / before if before else (float('inf') if after else 0.0)
+                status = 'ok'
+                if abs(after - before) > floor and abs(change) > threshold:
+                    status = 'regression' if after > before else 'improvement'
+                rows.append({'scale': scale, 'case': case, 'metric': metric, 'baseline': before,
+                             'current': after, 'change': change, 'status': status})
+    return rows
+
+def format_report(rows):
+    lines = [f"{'scale':<8} {'case':<28} {'metric':<8} {'baseline':>10} {'current':>10} {'change':>8}  status"]
+    for row in rows:
+        change = f"{row['change'] * 100:+.0f}%" if row['change'] != float('inf') else 'new'
+        lines.append(f"{row['scale']:<8} {row['case']:<28} {row['metric']:<8} {row['baseline']:>10.2f} "
+                     f"{row['current']:>10.2f} {change:>8}  {row['status']}")
+    regressions = sum(row['status'] == 'regression' for row in rows)
+    lines.append(f"{regressions} regression(s), {sum(row['status'] == 'improvement' for row in rows)} improvement(s)")
+    return '\n'.join(lines)
@@ -0,0 +1,316 @@
+from App.config import config
+from App import json_provider
+from App.log import get_logger
+from App.metrics import count_cache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from itertools import chain
+import os
+import random
+import sqlite3
+import threading
+import time
+
+log = get_logger(__name__)
+
+# Defaults of each namespace: entries kept per worker and seconds entries live
+L1_ENTRIES = 256
+TTL = 300
+# Seconds a worker trusts the namespace generations it last read from the shared store
+GENERATION_TTL = 0.5
+# One set in this many also removes expired entries from the shared store
+PURGE_EVERY = 200
+
+MISSING = object()
+
+
+class SharedStore:
+    """
+    The L2 of every namespace: a SQLite file on the local disk that all the workers of the
+    machine read and write. It also holds a generation counter per namespace, bumped to
+    invalidate the namespace in every worker at once. Values are stored as JSON, so whoever
+    can write the file can at most poison the cache, not run code in the workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_generation '
+                               '(namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+            self._connection = connection
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute('SELECT value, expires FROM cache_entry WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return MISSING, None
+        try:
+            return json_provider.loads(row[0]), row[1]
+        except ValueError:
+            # Written by an older version, or not by us
+            return MISSING, None
+
+    def set(self, key, value, expires):
+        data = json_provider.dumps(value)
+        with self._lock:
+            connection = self._connect()
+            connection.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)',
+                               (key, data, expires))
+            if random.randrange(PURGE_EVERY) == 0:
+                connection.execute('DELETE FROM cache_entry WHERE expires < ?', (time.time(),))
+
+    def delete(self, key):
+        with self._lock:
+            self._connect().execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+
+    def generations(self):
+        with self._lock:
+            return dict(self._connect().execute('SELECT namespace, generation FROM cache_generation').fetchall())
+
+    def bump(self, namespaces):
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                'INSERT INTO cache_generation (namespace, generation) VALUES (?, 1) '
+                'ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1',
+                [(namespace,) for namespace in namespaces]
+            )
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute('DELETE FROM cache_entry')
+            connection.execute('DELETE FROM cache_generation')
+
+    def close(self):
+        # Called in a forked child too: the parent's connection must not be used there
+        self._connection = None
+
+
+class Cache:
+    """
+    A namespace of cached values: an LRU in each worker in front of the machine-wide store.
+    Keys may carry a version (e.g. data versions from App.versioning), and the namespace is
+    invalidated in every worker when a commit changes one of its `tables`. Values go through
+    JSON in the store: `decode` turns what comes back (string keys, lists for tuples) into
+    the values callers stored.
+    """
+
+    def __init__(self, namespace, ttl=TTL, tables=(), l1_entries=L1_ENTRIES, decode=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.tables = frozenset(tables)
+        self.l1_entries = l1_entries
+        self.decode = decode
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, key, version):
+        key = f'{self.namespace}:{generation(self.namespace)}:{key}'
+        return key if version is None else f'{key}:{version}'
+
+    def get(self, key, version=None, default=None):
+        full_key = self._key(key, version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(full_key)
+                count_cache(f'{self.namespace}.l1', True)
+                return entry[1]
+        count_cache(f'{self.namespace}.l1', False)
+        store = shared_store()
+        if store is None:
+            return default
+        try:
+            value, expires = store.get(full_key)
+        except sqlite3.Error as e:
+            log.warning("Shared cache read failed: %s", e, namespace=self.namespace)
+            return default
+        count_cache(f'{self.namespace}.l2', value is not MISSING)
+        if value is MISSING:
+            return default
+        if self.decode is not None:
+            value = self.decode(value)
+        self._remember(full_key, value, expires)
+        return value
+
+    def set(self, key, value, version=None, ttl=None):
+        full_key = self._key(key, version)
+        expires = time.time() + (ttl or self.ttl)
+        self._remember(full_key, value, expires)
+        store = shared_store()
+        if store is not None:
+            try:
+                store.set(full_key, value, expires)
+            except (sqlite3.Error, TypeError) as e:
+                log.warning("Shared cache write failed: %s", e, namespace=self.namespace)
+
+    def delete(self, key, version=None):
+        full_key = self._key(key, version)
+        with self._lock:
+            self._entries.pop(full_key, None)
+        store = shared_store()
+        if store is not None:
+            store.delete(full_key)
+
+    def get_or_compute(self, key, compute, version=None, ttl=None):
+        """The cached value, or compute() stored for the next caller in any worker"""
+        value = self.get(key, version, MISSING)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value, version, ttl)
+        return value
+
+    def invalidate(self):
+        """Drop every entry of the namespace, in this worker and all the others"""
+        invalidate_namespaces([self.namespace])
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, full_key, value, expires):
+        with self._lock:
+            self._entries[full_key] = (expires, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.l1_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        full_key = self._key(key, None)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            return entry is not None and entry[0] >= time.time()
+
+
+_caches = {}
+_store = None
+# Namespace generations as last read from the shared store, and when
+_generations = {}
+_generations_read = 0.0
+
+def get_cache(namespace, ttl=TTL, tables=(), l1_entries=L1_ENTRIES, decode=None):
+    """The cache of a namespace, created on first use"""
+    cache = _caches.get(namespace)
+    if cache is None:
+        cache = _caches[namespace] = Cache(namespace, ttl, tables, l1_entries, decode)
+    return cache
+
+def shared_store():
+    """The machine-wide store at CACHE_PATH, or None when CACHE_PATH is empty (per-worker caching only)"""
+    global _store
+    path = config.get('CACHE_PATH')
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        _store = SharedStore(path)
+    return _store
+
+def generation(namespace):
+    global _generations, _generations_read
+    store = shared_store()
+    if store is None:
+        return _generations.get(namespace, 0)
+    now = time.monotonic()
+    if now - _generations_read >= config.get('CACHE_GENERATION_TTL', GENERATION_TTL):
+        try:
+            _generations = store.generations()
+        except sqlite3.Error as e:
+            log.warning("Could not read cache generations: %s", e)
+        _generations_read = now
+    return _generations.get(namespace, 0)
+
+def invalidate_namespaces(namespaces):
+    """
+    Bump the generations of `namespaces`: the keys of their old entries are never asked for again,
+    and those entries age out of every worker's LRU and of the shared store.
+    """
+    global _generations_read
+    namespaces = sorted(set(namespaces))
+    if not namespaces:
+        return
+    store = shared_store()
+    if store is None:
+        for namespace in namespaces:
+            _generations[namespace] = _generations.get(namespace, 0) + 1
+        return
+    try:
+        store.bump(namespaces)
+    except sqlite3.Error as e:
+        log.warning("Could not invalidate %s: %s", ', '.join(namespaces), e)
+    # This worker sees its own invalidation straight away
+    _generations_read = 0.0
+    log.debug("Invalidated caches", namespaces=namespaces)
+
+def invalidate_tables(tables):
+    invalidate_namespaces([cache.namespace for cache in _caches.values() if cache.tables & set(tables)])
+
+def clear_caches():
+    """Empty every namespace, for tests and benchmarks"""
+    global _generations_read
+    for cache in _caches.values():
+        cache.clear_local()
+    store = shared_store()
+    if store is not None:
+        store.clear()
+    _generations.clear()
+    _generations_read = 0.0
+
+def _after_fork():
+    if _store is not None:
+        _store.close()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _changed(session):
+    return session.info.setdefault('cache_tables', set())
+
+def _before_flush(session, flush_context, instances):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(type(obj), '__table__', None)
+        if table is not None and (obj not in session.dirty or session.is_modified(obj)):
+            _changed(session).add(table.name)
+
+def _do_orm_execute(state):
+    # Bulk query.update() and query.delete() skip the flush
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None:
+        _changed(state.session).add(state.bind_mapper.local_table.name)
+
+def _after_commit(session):
+    tables = session.info.pop('cache_tables', None)
+    if tables:
+        invalidate_tables(tables)
+
+def _after_rollback(session):
+    session.info.pop('cache_tables', None)
+
+def setup_cache(app):
+    """
+    Invalidate the caches depending on the tables a commit changed. CACHE_PATH (default
+    instance/cache.sqlite, none when testing) is the store shared by the workers, empty to
+    keep caches per worker.
+    """
+    if 'CACHE_PATH' not in app.config:
+        # Test apps come and go with their databases, so they do not share a store by default
+        app.config['CACHE_PATH'] = '' if app.testing else os.path.join(app.instance_path, 'cache.sqlite')
+    config['CACHE_PATH'] = app.config['CACHE_PATH']
+    if event.contains(Session, 'before_flush', _before_flush):
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
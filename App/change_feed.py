@@ -0,0 +1,232 @@
+from App.database import db
+from App.models import ChangeFeed
+from App.log import get_logger
+from flask import current_app, has_app_context
+from sqlalchemy import create_engine, event, exc, func, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from datetime import datetime, timedelta
+from itertools import chain
+import os
+import select as io_select
+import socket
+import threading
+import time
+
+log = get_logger(__name__)
+
+# Tables whose commits other app nodes hear about
+FEED_TABLES = frozenset(('route', 'route_stop', 'location', 'schedule', 'bus'))
+# Seconds between polls, and between polls when Postgres notifications wake the node up
+INTERVAL = 1.0
+LISTEN_INTERVAL = 30.0
+# Rows older than this are deleted, and how often each process looks for them
+RETENTION = timedelta(days=1)
+PRUNE_EVERY = 3600
+CHANNEL = 'change_feed'
+# Ids below the highest seen that are read again: ids are taken at insert but rows become
+# visible at commit, so a lower id can appear after a higher one was read
+LOOKBACK = 200
+
+
+def record_change(connection, tables, node):
+    """Append a change record in the transaction of `connection`; on Postgres also notify listeners on commit"""
+    table = ChangeFeed.__table__
+    names = ','.join(sorted(tables))
+    connection.execute(table.insert().values(tables=names, node=node, created=datetime.utcnow()))
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_notify(:channel, :tables)'), {'channel': CHANNEL, 'tables': names})
+
+def _node():
+    feed = current_app.extensions.get('change_feed') if has_app_context() else None
+    return feed.node if feed else socket.gethostname()
+
+def _before_flush(session, flush_context, instances):
+    tables = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(type(obj), '__table__', None)
+        if table is None or table.name not in FEED_TABLES:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        tables.add(table.name)
+    if tables:
+        session.info['feed_tables'] = tables
+
+def _after_flush(session, flush_context):
+    tables = session.info.pop('feed_tables', None)
+    if tables:
+        record_change(session.connection(), tables, _node())
+
+def _do_orm_execute(state):
+    # Bulk query.update() and query.delete() skip the flush
+    if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    name = state.bind_mapper.local_table.name
+    if name in FEED_TABLES:
+        record_change(state.session.connection(), {name}, _node())
+
+def _after_rollback(session):
+    session.info.pop('feed_tables', None)
+
+
+class ChangeFeedReader:
+    """
+    Reads the change feed of one app instance: the rows other nodes wrote that it has not applied
+    yet, handing their tables to each subscriber. Ids up to LOOKBACK below the highest seen are
+    read again, for transactions that committed after a later one. Polls at most every `interval`
+    seconds, or straight away after a Postgres notification.
+    """
+
+    def __init__(self, node, interval=INTERVAL, listen=False):
+        self.node = node
+        self.interval = interval
+        self.listen = listen
+        self.high_water = None
+        # Ids of the lookback window already applied
+        self.applied = set()
+        self.subscribers = []
+        self.pending = False
+        self._polled = 0.0
+        self._pruned = time.monotonic()
+        # The process whose listener thread is running, and whether it is connected right now
+        self._listener_pid = None
+        self._listening = False
+
+    def subscribe(self, callback):
+        """Call callback(tables) with the set of tables other nodes changed"""
+        self.subscribers.append(callback)
+        return callback
+
+    def start(self, engine):
+        """Begin at the current end of the feed, the caches of a new process are empty anyway"""
+        try:
+            with engine.connect() as connection:
+                self.high_water = connection.execute(select(func.max(ChangeFeed.id))).scalar() or 0
+                # Rows already there are done with, rows committing later below the mark are not
+                self.applied = set(connection.execute(
+                    select(ChangeFeed.id).where(ChangeFeed.id > self.high_water - LOOKBACK)).scalars())
+        except exc.SQLAlchemyError as e:
+            # The table does not exist before the database is created
+            log.debug("Change feed not readable yet: %s", e)
+
+    def poll(self, engine=None, force=False):
+        """Apply the changes other nodes made since the last poll, returns their tables"""
+        now = time.monotonic()
+        listening = self._listening and self._listener_pid == os.getpid()
+        interval = LISTEN_INTERVAL if listening else self.interval
+        if not (force or self.pending or now - self._polled >= interval):
+            return set()
+        self._polled = now
+        self.pending = False
+        engine = engine or db.engine
+        if self.listen and self._listener_pid != os.getpid() and engine.dialect.name == 'postgresql':
+            self._start_listener(engine)
+        if self.high_water is None:
+            self.start(engine)
+            return set()
+
+        table = ChangeFeed.__table__
+        low = self.high_water - LOOKBACK
+        try:
+            with engine.connect() as connection:
+                rows = connection.execute(select(table.c.id, table.c.tables, table.c.node)
+                                          .where(table.c.id > low).order_by(table.c.id)).all()
+        except exc.SQLAlchemyError as e:
+            log.warning("Could not read the change feed: %s", e)
+            return set()
+        if now - self._pruned >= PRUNE_EVERY:
+            self._pruned = now
+            self.prune(engine)
+        rows = [row for row in rows if row.id not in self.applied]
+        if not rows:
+            return set()
+        self.high_water = max(self.high_water, rows[-1].id)
+        self.applied.update(row.id for row in rows)
+        self.applied = {applied for applied in self.applied if applied > self.high_water - LOOKBACK}
+        tables = set()
+        for row in rows:
+            if row.node != self.node:
+                tables.update(row.tables.split(','))
+        if tables:
+            log.info("Applying changes from other nodes", tables=sorted(tables), high_water=self.high_water)
+            for callback in self.subscribers:
+                callback(tables)
+        return tables
+
+    def prune(self, engine):
+        try:
+            with engine.begin() as connection:
+                connection.execute(ChangeFeed.__table__.delete().where(
+                    ChangeFeed.__table__.c.created < datetime.utcnow() - RETENTION))
+        except exc.SQLAlchemyError as e:
+            log.warning("Could not prune the change feed: %s", e)
+
+    def _start_listener(self, engine):
+        # A thread per process: threads do not survive the fork into workers
+        self._listener_pid = os.getpid()
+        self._listening = False
+        listener = create_engine(engine.url, poolclass=NullPool)
+        threading.Thread(target=self._listen, args=(listener,), daemon=True, name='change-feed').start()
+
+    def _listen(self, engine):
+        # The one listener thread of the process: it reconnects itself, nothing starts another
+        while True:
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {CHANNEL}')
+                self._listening = True
+                while True:
+                    if io_select.select([connection], [], [], 60) != ([], [], []):
+                        connection.poll()
+                        if connection.notifies:
+                            connection.notifies.clear()
+                            self.pending = True
+            except Exception as e:
+                log.warning("Change feed listener failed, polling every %ss: %s", self.interval, e)
+                # Until it reconnects, fall back to polling at the normal interval
+                self._listening = False
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                time.sleep(5)
+
+
+def _poll_changes():
+    current_app.extensions['change_feed'].poll()
+
+def setup_change_feed(app):
+    """
+    Record commits to FEED_TABLES in the change_feed table and apply other nodes' changes
+    before requests: their tables' caches are invalidated and data versions read again.
+    CHANGE_FEED_NODE names this node (the host name by default, shared by its workers,
+    which already see each other's changes through the shared cache).
+    """
+    if not app.config.get('CHANGE_FEED_ENABLED', True):
+        return None
+    from App.cache import invalidate_tables
+    from App.versioning import expire_versions
+
+    feed = ChangeFeedReader(
+        app.config.get('CHANGE_FEED_NODE') or socket.gethostname(),
+        app.config.get('CHANGE_FEED_INTERVAL', INTERVAL),
+        app.config.get('CHANGE_FEED_LISTEN', True)
+    )
+    feed.subscribe(invalidate_tables)
+    feed.subscribe(lambda tables: expire_versions())
+    app.extensions['change_feed'] = feed
+    with app.app_context():
+        feed.start(db.engine)
+
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'do_orm_execute', _do_orm_execute)
+        event.listen(Session, 'after_rollback', _after_rollback)
+    app.before_request(_poll_changes)
+    return feed
@@ -3,6 +3,9 @@ from flask_jwt_extended import create_access_token, jwt_required, JWTManager, ge
 from flask_jwt_extended.exceptions import NoAuthorizationError, InvalidHeaderError, JWTExtendedException
 
 from App.models import User
+from App.log import get_logger
+
+log = get_logger(__name__)
 
 def jwt_authenticate(username, password):
     """
@@ -149,7 +152,7 @@ def add_auth_context(app):
               current_user = None
               is_authenticated = False
       except Exception as e:
-          print(f"Auth context error: {e}")
+          log.warning("Auth context error: %s", e)
           is_authenticated = False
           current_user = None
       return dict(is_authenticated=is_authenticated, current_user=current_user)
\ No newline at end of file
@@ -0,0 +1,264 @@
+from App.models import Journey, JourneyEvent, BoardEvent, RouteStop
+from App.models.Location import haversine, AVG_BUS_SPEED, ROAD_FACTOR
+from App.config import config
+from App.log import get_logger
+from sqlalchemy.orm import joinedload
+from datetime import datetime
+import json
+import os
+import random
+import time
+
+log = get_logger(__name__)
+
+# A bus within this distance of a stop is considered to be at the stop
+STOP_RADIUS = 100  # meters
+# Fewer samples than this for an hour falls back to the all-day distribution
+MIN_HOUR_SAMPLES = 3
+ALL_HOURS = -1
+MODEL_VERSION = 1
+
+
+class EtaModel:
+    """
+    Per-segment travel time distributions learned from journey history.
+    A segment is a pair of consecutive route stops, keyed by (route_id, from_index).
+    Each segment keeps (median, p90, samples) per hour of day and for the whole day.
+    """
+
+    def __init__(self, segments=None, trained_at=None):
+        self.segments = segments or {}
+        self.trained_at = trained_at
+
+    @classmethod
+    def train(cls, arrivals):
+        """Build a model from {journey_id: (route_id, {stop_index: arrival datetime})}"""
+        samples = {}
+        for route_id, stop_times in arrivals.values():
+            for index in sorted(stop_times):
+                arrived = stop_times.get(index + 1)
+                if arrived is None:
+                    continue
+                seconds = (arrived - stop_times[index]).total_seconds()
+                if seconds <= 0:
+                    continue
+                hours = samples.setdefault((route_id, index), {})
+                hours.setdefault(stop_times[index].hour, []).append(seconds)
+                hours.setdefault(ALL_HOURS, []).append(seconds)
+
+        segments = {}
+        for key, hours in samples.items():
+            segments[key] = {hour: _summarize(values) for hour, values in hours.items()}
+        return cls(segments, datetime.utcnow())
+
+    def segment_stats(self, route_id, from_index, hour):
+        """(median, p90, samples) for a segment at an hour of day, or None without history"""
+        hours = self.segments.get((route_id, from_index))
+        if not hours:
+            return None
+        stats = hours.get(hour)
+        if stats and stats[2] >= MIN_HOUR_SAMPLES:
+            return stats
+        return hours.get(ALL_HOURS)
+
+    def predict_segment(self, route_id, from_index, when, progress=0.0, distance=None, typical=None):
+        """
+        Seconds left until a bus on segment (from_index, from_index + 1) reaches the next stop.
+        `progress` is the fraction of the segment already covered. Segments without history use
+        `typical` (seconds, e.g. from the segment matrix) or else the length `distance` in meters.
+        """
+        stats = self.segment_stats(route_id, from_index, when.hour)
+        if stats:
+            total = stats[0]
+        elif typical is not None:
+            total = typical
+        elif distance is not None:
+            total = distance * ROAD_FACTOR / AVG_BUS_SPEED
+        else:
+            return None
+        return total * (1.0 - min(max(progress, 0.0), 1.0))
+
+    def save(self, path):
+        data = {
+            'version': MODEL_VERSION,
+            'trained_at': self.trained_at.isoformat() if self.trained_at else None,
+            'segments': {
+                f"{route_id}:{index}": {str(hour): list(stats) for hour, stats in hours.items()}
+                for (route_id, index), hours in self.segments.items()
+            }
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != MODEL_VERSION:
+            raise ValueError(f"Unsupported ETA model version {data.get('version')}")
+        segments = {}
+        for key, hours in data['segments'].items():
+            route_id, index = key.split(':')
+            segments[(int(route_id), int(index))] = {int(hour): tuple(stats) for hour, stats in hours.items()}
+        trained_at = datetime.fromisoformat(data['trained_at']) if data.get('trained_at') else None
+        return cls(segments, trained_at)
+
+
+def _summarize(values):
+    values = sorted(values)
+    return (values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.9))], len(values))
+
+
+_model = None
+_model_checked = 0.0
+_model_mtime = None
+
+def get_model_path():
+    return config.get('ETA_MODEL_PATH', 'eta_model.json')
+
+def get_eta_model():
+    """The process-wide ETA model, reloaded when the model file changes (checked at most every 30s)"""
+    global _model, _model_checked, _model_mtime
+    now = time.monotonic()
+    if _model is not None and now - _model_checked < 30:
+        return _model
+    _model_checked = now
+
+    path = get_model_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if _model is None or mtime != _model_mtime:
+        try:
+            _model = EtaModel.load(path) if mtime is not None else EtaModel()
+        except (OSError, ValueError) as e:
+            log.warning("Could not load ETA model: %s", e, path=path)
+            _model = EtaModel()
+        _model_mtime = mtime
+    return _model
+
+def set_eta_model(model):
+    """Replace the process-wide ETA model (used after training and in tests)"""
+    global _model, _model_checked
+    _model = model
+    _model_checked = time.monotonic()
+
+
+def segment_progress(from_location, to_location, lat, lng):
+    """Fraction of the way a position is between two locations"""
+    covered = haversine(from_location.lat, from_location.lng, lat, lng)
+    remaining = haversine(lat, lng, to_location.lat, to_location.lng)
+    if covered + remaining == 0:
+        return 1.0
+    return covered / (covered + remaining)
+
+def estimate_arrival(route_id, from_stop, to_stop, lat, lng, when=None):
+    """
+    Estimate the remaining distance (meters) and time (seconds) for a bus at (lat, lng)
+    travelling from one route stop to the next. Runs entirely in-process.
+    """
+    from App.controllers.route import get_travel_estimate
+
+    when = when or datetime.utcnow()
+    progress = segment_progress(from_stop.location, to_stop.location, lat, lng)
+    segment = get_travel_estimate(route_id, from_stop.stop_index, to_stop.stop_index)
+    if segment:
+        segment_distance, typical = segment
+    else:
+        segment_distance = haversine(from_stop.location.lat, from_stop.location.lng,
+                                     to_stop.location.lat, to_stop.location.lng) * ROAD_FACTOR
+        typical = segment_distance / AVG_BUS_SPEED
+    seconds = get_eta_model().predict_segment(route_id, from_stop.stop_index, when, progress, typical=typical)
+    return segment_distance * (1.0 - progress), seconds
+
+def estimate_next_stop(journey, current_stop, next_stop):
+    """Estimate the distance and time for a journey to reach its next stop from its last known position"""
+    latest_event = JourneyEvent.query.filter_by(
+        journey_id=journey.id
+    ).order_by(JourneyEvent.time.desc()).first()
+
+    if latest_event:
+        lat, lng = latest_event.lat, latest_event.lng
+    else:
+        lat, lng = current_stop.location.lat, current_stop.location.lng
+    return estimate_arrival(journey.route_id, current_stop, next_stop, lat, lng)
+
+
+def collect_arrivals(journeys):
+    """Arrival time at each stop index for the given journeys, from board events and GPS trails"""
+    journey_ids = [journey.id for journey in journeys]
+    if not journey_ids:
+        return {}
+
+    route_ids = {journey.route_id for journey in journeys}
+    route_stops = {}
+    for route_stop in RouteStop.query.options(joinedload(RouteStop.location)).filter(
+            RouteStop.route_id.in_(route_ids)):
+        route_stops.setdefault(route_stop.route_id, []).append(route_stop)
+
+    arrivals = {journey.id: (journey.route_id, {}) for journey in journeys}
+
+    def record(journey_id, index, at):
+        stop_times = arrivals[journey_id][1]
+        if index not in stop_times or at < stop_times[index]:
+            stop_times[index] = at
+
+    stop_index = {route_stop.id: route_stop.stop_index for stops in route_stops.values() for route_stop in stops}
+    for event in BoardEvent.query.filter(BoardEvent.journey_id.in_(journey_ids)):
+        if event.stop_id in stop_index:
+            record(event.journey_id, stop_index[event.stop_id], event.time)
+
+    for event in JourneyEvent.query.filter(JourneyEvent.journey_id.in_(journey_ids)):
+        for route_stop in route_stops.get(arrivals[event.journey_id][0], []):
+            if haversine(event.lat, event.lng, route_stop.location.lat, route_stop.location.lng) <= STOP_RADIUS:
+                record(event.journey_id, route_stop.stop_index, event.time)
+
+    return arrivals
+
+def get_history_journeys():
+    return Journey.query.filter(Journey.status == "Completed").all()
+
+def train_eta_model(path=None):
+    """Train the ETA model on completed journeys and store it for the app workers"""
+    model = EtaModel.train(collect_arrivals(get_history_journeys()))
+    model.save(path or get_model_path())
+    set_eta_model(model)
+    return model
+
+def backtest_eta_model(holdout=0.2, seed=0):
+    """
+    Train on part of the completed journeys and report the mean absolute error (seconds)
+    of segment predictions on the held-out journeys, next to the fixed-speed fallback.
+    """
+    arrivals = collect_arrivals(get_history_journeys())
+    journey_ids = sorted(arrivals)
+    random.Random(seed).shuffle(journey_ids)
+    held_out = set(journey_ids[:int(len(journey_ids) * holdout)])
+
+    model = EtaModel.train({jid: arrivals[jid] for jid in journey_ids if jid not in held_out})
+    baseline = EtaModel()
+
+    locations = {(route_stop.route_id, route_stop.stop_index): route_stop.location
+                 for route_stop in RouteStop.query.options(joinedload(RouteStop.location))}
+
+    errors, baseline_errors = [], []
+    for journey_id in held_out:
+        route_id, stop_times = arrivals[journey_id]
+        for index, departed in stop_times.items():
+            arrived = stop_times.get(index + 1)
+            start, end = locations.get((route_id, index)), locations.get((route_id, index + 1))
+            if arrived is None or not start or not end:
+                continue
+            actual = (arrived - departed).total_seconds()
+            distance = haversine(start.lat, start.lng, end.lat, end.lng)
+            errors.append(abs(model.predict_segment(route_id, index, departed, 0.0, distance) - actual))
+            baseline_errors.append(abs(baseline.predict_segment(route_id, index, departed, 0.0, distance) - actual))
+
+    return {
+        'train_journeys': len(journey_ids) - len(held_out),
+        'test_journeys': len(held_out),
+        'segments': len(errors),
+        'mae_seconds': sum(errors) / len(errors) if errors else None,
+        'baseline_mae_seconds': sum(baseline_errors) / len(baseline_errors) if baseline_errors else None
+    }
@@ -12,10 +12,15 @@ from App.models.BoardEvent import BoardEvent
 from App.models.Schedule import Schedule
 from datetime import datetime, timedelta
 from .user import create_user
+from App.log import get_logger
+from App.cache import clear_caches
+
+log = get_logger(__name__)
 
 def initialize():
     db.drop_all()
     db.create_all()
+    clear_caches()
     
     # Create demo data
     create_demo_data()
@@ -200,7 +205,7 @@ def create_demo_data():
     db.session.add(admin)
     db.session.commit()
     
-    print("Demo data created successfully!")
+    log.info("Demo data created")
 
 def init_app(app):
     """Initialize the application with required settings and data"""
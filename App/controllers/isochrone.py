@@ -0,0 +1,179 @@
+from App.models import Location, RouteStop, RouteSegment
+from App.models.Location import haversine, AVG_BUS_SPEED, ROAD_FACTOR
+from App.controllers.planner import build_transfer_index
+from sqlalchemy.orm import joinedload
+from heapq import heappush, heappop
+import time
+
+# Expected wait when changing onto another route
+TRANSFER_PENALTY = 300  # seconds
+DEFAULT_BANDS = (30, 45, 60)  # minutes
+# Seconds a worker keeps the stop graph before building it again
+GRAPH_TTL = 300
+
+
+class StopGraph:
+    """
+    Stop graph for reachability queries. Every location is a node, and every route stop is a
+    ride node linked to the next stop of its route by the segment travel time. Boarding a route
+    costs the transfer penalty, alighting is free, and nearby locations are linked by walking.
+    """
+
+    def __init__(self):
+        self.locations = {}  # location_id -> (name, lat, lng)
+        self.nodes = {}      # location_id or (route_id, stop_index) -> node number
+        self.keys = []       # node number -> location_id or (route_id, stop_index)
+        self.edges = []      # node number -> [(node number, seconds)]
+
+    def node(self, key):
+        number = self.nodes.get(key)
+        if number is None:
+            number = self.nodes[key] = len(self.edges)
+            self.keys.append(key)
+            self.edges.append([])
+        return number
+
+    def add_edge(self, source, target, seconds):
+        self.edges[self.node(source)].append((self.node(target), seconds))
+
+    def add_location(self, location_id, name, lat, lng):
+        self.locations[location_id] = (name, lat, lng)
+        self.node(location_id)
+
+    def add_route(self, route_id, stops):
+        """stops is [(stop_index, location_id, seconds from the previous stop)] in route order"""
+        previous = None
+        for stop_index, location_id, seconds in stops:
+            ride = (route_id, stop_index)
+            self.add_edge(location_id, ride, TRANSFER_PENALTY)
+            self.add_edge(ride, location_id, 0)
+            if previous is not None:
+                self.add_edge(previous, ride, seconds)
+            previous = ride
+
+    def add_walks(self, transfers):
+        for location_id, walks in transfers.items():
+            for other, seconds in walks:
+                self.add_edge(location_id, other, seconds)
+
+    def reach(self, sources, limit):
+        """{location_id: seconds} for every location reachable from the sources within limit seconds"""
+        best = {}
+        heap = []
+        for location_id in sources:
+            if location_id not in self.locations:
+                continue
+            start = self.nodes[location_id]
+            best[start] = 0
+            heappush(heap, (0, start))
+            # No transfer penalty for the first boarding at an origin, walks from it cost their time
+            for ride, _ in self.edges[start]:
+                if not isinstance(self.keys[ride], tuple):
+                    continue
+                if ride not in best or best[ride] > 0:
+                    best[ride] = 0
+                    heappush(heap, (0, ride))
+
+        while heap:
+            seconds, number = heappop(heap)
+            if seconds > best.get(number, seconds):
+                continue
+            for target, cost in self.edges[number]:
+                arrival = seconds + cost
+                if arrival <= limit and arrival < best.get(target, limit + 1):
+                    best[target] = arrival
+                    heappush(heap, (arrival, target))
+
+        return {self.keys[number]: seconds for number, seconds in best.items()
+                if self.keys[number] in self.locations}
+
+
+def build_stop_graph():
+    """Build the stop graph from route stops and the stored segment matrix"""
+    graph = StopGraph()
+    for location in Location.query.all():
+        graph.add_location(location.id, location.name, location.lat, location.lng)
+
+    travel_times = {(segment.route_id, segment.stop_index): segment.travel_time
+                    for segment in RouteSegment.query.all()}
+
+    routes = {}
+    for route_stop in RouteStop.query.options(joinedload(RouteStop.location)).order_by(
+            RouteStop.route_id, RouteStop.stop_index):
+        routes.setdefault(route_stop.route_id, []).append(route_stop)
+
+    for route_id, route_stops in routes.items():
+        stops = []
+        for position, stop in enumerate(route_stops):
+            seconds = travel_times.get((route_id, stop.stop_index))
+            if seconds is None and position > 0:
+                previous = route_stops[position - 1].location
+                seconds = haversine(previous.lat, previous.lng, stop.location.lat, stop.location.lng) \
+                    * ROAD_FACTOR / AVG_BUS_SPEED
+            stops.append((stop.stop_index, stop.location_id, seconds or 0))
+        graph.add_route(route_id, stops)
+
+    graph.add_walks(build_transfer_index(graph.locations))
+    return graph
+
+
+_graph = None
+_graph_built = 0.0
+
+def get_stop_graph():
+    """The stop graph, built at most once per GRAPH_TTL in each worker"""
+    global _graph, _graph_built
+    if _graph is None or time.monotonic() - _graph_built >= GRAPH_TTL:
+        _graph = build_stop_graph()
+        _graph_built = time.monotonic()
+    return _graph
+
+
+def convex_hull(points):
+    """Convex hull of (lng, lat) points as a closed ring, or None for fewer than three distinct points"""
+    points = sorted(set(points))
+    if len(points) < 3:
+        return None
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for point in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+    for point in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+    ring = lower[:-1] + upper[:-1]
+    if len(ring) < 3:
+        return None
+    return [list(point) for point in ring + ring[:1]]
+
+def get_isochrones(stop_ids, bands=DEFAULT_BANDS, hull=False):
+    """Stops reachable from the given stops within each time band (minutes), with optional hulls"""
+    graph = get_stop_graph()
+    bands = sorted(bands)
+    reached = sorted(graph.reach(stop_ids, bands[-1] * 60).items(), key=lambda item: item[1])
+
+    result = []
+    for minutes in bands:
+        stops = []
+        for location_id, seconds in reached:
+            if seconds > minutes * 60:
+                break
+            name, lat, lng = graph.locations[location_id]
+            stops.append({'id': location_id, 'name': name, 'lat': lat, 'lng': lng, 'seconds': round(seconds)})
+
+        band = {'minutes': minutes, 'stops': stops}
+        if hull:
+            ring = convex_hull([(stop['lng'], stop['lat']) for stop in stops])
+            band['hull'] = {
+                'type': 'Feature',
+                'properties': {'minutes': minutes},
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]} if ring else None
+            }
+        result.append(band)
+    return {'origin': list(stop_ids), 'bands': result}
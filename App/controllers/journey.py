@@ -3,52 +3,44 @@ from App.models.JourneyEvent import JourneyEvent
 from App.models.BoardEvent import BoardEvent, BoardType
 from App.models.RouteStop import RouteStop
 from App.database import db
+from App.log import get_logger
+from App.tracing import span
+from App.singleflight import SingleFlight
 from datetime import datetime, time
-import traceback
-import sys
+import logging
 
+log = get_logger(__name__)
+
+@SingleFlight('journey_stats', reuse=1.0)
+@span()
 def get_journey_stats(journey_id):
     try:
-        # Debug output
-        print(f"Fetching journey stats for journey_id: {journey_id}")
+        log.debug("Fetching journey stats", journey_id=journey_id)
         
         journey = Journey.query.get(journey_id)
         
         if not journey:
-            print(f"Journey with ID {journey_id} not found")
+            log.info("Journey not found", journey_id=journey_id)
             return None
         
-        print(f"Journey found: {journey.id}, route: {journey.route_id if journey.route else 'None'}")
-        
         try:
-            # Try to access relationships to see if they're loaded correctly
-            if journey.route:
-                print(f"Route name: {journey.route.name}")
-            else:
-                print("Route is None")
-                
-            if journey.driver:
-                print(f"Driver username: {journey.driver.username}")
-            else:
-                print("Driver is None")
-                
-            if journey.bus:
-                print(f"Bus plate: {journey.bus.plate_num}")
-            else:
-                print("Bus is None")
-                
-            # Get board events for debugging
-            board_events = BoardEvent.query.filter(
-                BoardEvent.journey_id == journey.id
-            ).all()
-            print(f"Found {len(board_events)} board events")
+            # Relationship details only cost queries when someone is reading them
+            if log.isEnabledFor(logging.DEBUG):
+                board_events = BoardEvent.query.filter(BoardEvent.journey_id == journey.id).count()
+                log.debug(
+                    "Journey found", journey_id=journey.id, route_id=journey.route_id,
+                    route=journey.route.name if journey.route else None,
+                    driver=journey.driver.username if journey.driver else None,
+                    bus=journey.bus.plate_num if journey.bus else None,
+                    board_events=board_events
+                )
             
             # Get journey stats
             stats = journey.getStats()
             
             # Check if there was an error in getStats
             if 'error' in stats:
-                print(f"Error in getStats for journey {journey_id}: {stats['error']}")
+                log.warning("Error in getStats: %s", stats['error'], journey_id=journey_id)
                 # Remove the error message from the stats before returning
                 error_msg = stats.pop('error', None)
             
@@ -64,9 +56,7 @@ def get_journey_stats(journey_id):
             
             return stats
         except Exception as inner_e:
-            print(f"Error accessing journey relationships: {str(inner_e)}")
-            # Print full traceback for debugging
-            traceback.print_exc(file=sys.stdout)
+            log.exception("Error accessing journey relationships", journey_id=journey_id)
             
             # Return a minimal stats object
             return {
@@ -81,9 +71,7 @@ def get_journey_stats(journey_id):
                 'error_details': str(inner_e)
             }
     except Exception as e:
-        print(f"Error getting journey stats for journey {journey_id}: {str(e)}")
-        # Print full traceback for debugging
-        traceback.print_exc(file=sys.stdout)
+        log.exception("Error getting journey stats", journey_id=journey_id)
         
         # Return a minimal stats object that won't cause template rendering errors
         return {
@@ -112,7 +100,7 @@ def create_journey_board_event(journey_id, event_type, qty, stop_id):
         db.session.commit()
         return event
     except Exception as e:
-        print(f"Error creating board event: {str(e)}")
+        log.warning("Could not create board event: %s", e, journey_id=journey_id, stop_id=stop_id)
         db.session.rollback()
         raise ValueError(str(e))
 
@@ -128,7 +116,7 @@ def create_journey_track_event(journey_id, lat, lng):
         db.session.commit()
         return event
     except Exception as e:
-        print(f"Error creating track event: {str(e)}")
+        log.exception("Error creating track event", journey_id=journey_id)
         db.session.rollback()
         return None
 
@@ -142,7 +130,7 @@ def complete_journey(journey_id):
         journey.completeJourney()
         return journey
     except Exception as e:
-        print(f"Error completing journey: {str(e)}")
+        log.exception("Error completing journey", journey_id=journey_id)
         db.session.rollback()
         return False
         
@@ -156,7 +144,7 @@ def cancel_journey(journey_id):
         journey.cancelJourney()
         return journey
     except Exception as e:
-        print(f"Error cancelling journey: {str(e)}")
+        log.exception("Error cancelling journey", journey_id=journey_id)
         db.session.rollback()
         return False
         
@@ -171,7 +159,7 @@ def move_to_next_stop(journey_id):
             return journey.getCurrentStop()
         return None
     except Exception as e:
-        print(f"Error moving to next stop: {str(e)}")
+        log.exception("Error moving to next stop", journey_id=journey_id)
         db.session.rollback()
         return None
         
@@ -186,7 +174,7 @@ def move_to_previous_stop(journey_id):
             return journey.getCurrentStop()
         return None
     except Exception as e:
-        print(f"Error moving to previous stop: {str(e)}")
+        log.exception("Error moving to previous stop", journey_id=journey_id)
         db.session.rollback()
         return None
         
@@ -1,7 +1,6 @@
 from App.models import Location
 from App.config import config
-import openrouteservice
-import requests
+from App import ors
 
 def get_all_locations():
     return Location.query.all()
@@ -18,7 +17,7 @@ def validate_ors_api_key():
     
     try:
         # Test the API key with a simple request
-        client = openrouteservice.Client(key=ors_api_key)
+        client = ors.get_client(ors_api_key)
         
         # Try a simple geocoding request
         test_coords = [[8.681495, 49.41461], [8.686507, 49.41943]]
@@ -38,7 +37,7 @@ def validate_ors_api_key():
                 'valid': False,
                 'message': 'Invalid response from OpenRouteService'
             }
-    except openrouteservice.exceptions.ApiError as e:
+    except ors.api_error() as e:
         return {
             'valid': False,
             'message': f'API error: {str(e)}'
@@ -0,0 +1,375 @@
+from App.models import Location, Route, Schedule, TripPattern
+from App.models.Location import haversine
+from App.models.ServicePattern import DAY_SECONDS
+from App.controllers.schedule import split_trips, route_stop_indexes
+from sqlalchemy.orm import selectinload
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from math import cos, radians
+import random
+import time
+
+INFINITY = float('inf')
+# Walking transfers are offered between stops closer than this
+TRANSFER_RADIUS = 400  # meters
+WALK_SPEED = 1.2  # meters per second
+# Time needed to change vehicles at the same stop
+MIN_TRANSFER_TIME = 60  # seconds
+MAX_TRANSFERS = 3
+# Seconds a worker keeps a service day's network before building it again
+NETWORK_TTL = 300
+
+
+class TransitNetwork:
+    """
+    Stop, trip and transfer arrays for RAPTOR queries over one service day.
+    Trips are grouped into patterns that visit the same stops without overtaking each other,
+    so the earliest trip that can be boarded at a stop is a binary search on its departures.
+    Times are seconds after midnight of the service day.
+    """
+
+    def __init__(self):
+        self.locations = {}      # location_id -> (name, lat, lng)
+        self.route_names = {}    # route_id -> name
+        self.patterns = []       # pattern -> (route_id, tuple of location ids)
+        self.trips = []          # pattern -> trips, each a list of (arrival, departure) per stop
+        self.departures = []     # pattern -> per stop, departures of the trips in order
+        self.stop_patterns = {}  # location_id -> [(pattern, position)]
+        self.transfers = {}      # location_id -> [(location_id, walking seconds)]
+        self._pending = {}
+
+    def add_location(self, location_id, name, lat, lng):
+        self.locations[location_id] = (name, lat, lng)
+
+    def add_trip(self, key, route_id, stop_ids, times):
+        """Add a trip visiting stop_ids at times [(arrival, departure), ...], grouped by key"""
+        route_stops, trips = self._pending.setdefault(key, ((route_id, tuple(stop_ids)), []))
+        if route_stops[1] != tuple(stop_ids):
+            raise ValueError(f"Trips of pattern {key} must visit the same stops")
+        trips.append(times)
+
+    def finalize(self, radius=TRANSFER_RADIUS):
+        """Sort trips into non-overtaking patterns and build the stop and transfer indexes"""
+        for route_stops, trips in self._pending.values():
+            lanes = []
+            for trip in sorted(trips, key=lambda t: t[0][1]):
+                for lane in lanes:
+                    if all(a[1] <= b[1] for a, b in zip(lane[-1], trip)):
+                        lane.append(trip)
+                        break
+                else:
+                    lanes.append([trip])
+            for lane in lanes:
+                self.patterns.append(route_stops)
+                self.trips.append(lane)
+                self.departures.append([[trip[pos][1] for trip in lane] for pos in range(len(route_stops[1]))])
+        self._pending = {}
+
+        for pattern, (route_id, stop_ids) in enumerate(self.patterns):
+            for position, stop_id in enumerate(stop_ids):
+                self.stop_patterns.setdefault(stop_id, []).append((pattern, position))
+
+        self.transfers = build_transfer_index(self.locations, radius)
+        return self
+
+    def plan(self, origin, target, depart, max_transfers=MAX_TRANSFERS):
+        """
+        Earliest arrival from origin to target leaving at `depart` (seconds after midnight),
+        using the fewest vehicles among the earliest options. Returns (arrival, legs) or None.
+        """
+        if origin not in self.locations or target not in self.locations:
+            return None
+
+        best = {origin: depart}
+        labels = [{origin: depart}]
+        parents = [{origin: None}]
+        marked = {origin}
+
+        for other, walk in self.transfers.get(origin, ()):
+            best[other] = labels[0][other] = depart + walk
+            parents[0][other] = ('walk', origin, walk)
+            marked.add(other)
+
+        for round_number in range(1, max_transfers + 2):
+            previous = labels[-1]
+            current = dict(previous)
+            parent = {}
+
+            queue = {}
+            for stop in marked:
+                for pattern, position in self.stop_patterns.get(stop, ()):
+                    if position < queue.get(pattern, INFINITY):
+                        queue[pattern] = position
+            marked = set()
+
+            for pattern, start in queue.items():
+                stop_ids = self.patterns[pattern][1]
+                trips = self.trips[pattern]
+                departures = self.departures[pattern]
+                trip = None
+                boarded = None
+                for position in range(start, len(stop_ids)):
+                    stop = stop_ids[position]
+                    if trip is not None:
+                        arrival = trip[position][0]
+                        if arrival < best.get(stop, INFINITY) and arrival < best.get(target, INFINITY):
+                            best[stop] = current[stop] = arrival
+                            parent[stop] = ('ride', pattern, trip, boarded, position)
+                            marked.add(stop)
+
+                    ready = previous.get(stop)
+                    if ready is None:
+                        continue
+                    if round_number > 1:
+                        ready += MIN_TRANSFER_TIME
+                    if trip is None or ready <= trip[position][1]:
+                        index = bisect_left(departures[position], ready)
+                        if index < len(trips) and trips[index] is not trip:
+                            trip = trips[index]
+                            boarded = position
+
+            for stop in list(marked):
+                for other, walk in self.transfers.get(stop, ()):
+                    arrival = current[stop] + walk
+                    if arrival < best.get(other, INFINITY) and arrival < best.get(target, INFINITY):
+                        best[other] = current[other] = arrival
+                        parent[other] = ('walk', stop, walk)
+                        marked.add(other)
+
+            labels.append(current)
+            parents.append(parent)
+            if not marked:
+                break
+
+        if target not in best:
+            return None
+        rounds = min(k for k, label in enumerate(labels) if label.get(target) == best[target])
+        return best[target], self._legs(parents, labels, origin, target, rounds)
+
+    def _legs(self, parents, labels, origin, target, rounds):
+        legs = []
+        stop = target
+        while stop != origin:
+            while stop not in parents[rounds]:
+                rounds -= 1
+            step = parents[rounds][stop]
+            if step[0] == 'walk':
+                _, source, walk = step
+                legs.append({
+                    'type': 'walk',
+                    'from_stop': source,
+                    'to_stop': stop,
+                    'departure': labels[rounds][stop] - walk,
+                    'arrival': labels[rounds][stop]
+                })
+                stop = source
+            else:
+                _, pattern, trip, boarded, alighted = step
+                route_id, stop_ids = self.patterns[pattern]
+                legs.append({
+                    'type': 'ride',
+                    'route_id': route_id,
+                    'from_stop': stop_ids[boarded],
+                    'to_stop': stop_ids[alighted],
+                    'departure': trip[boarded][1],
+                    'arrival': trip[alighted][0]
+                })
+                stop = stop_ids[boarded]
+                rounds -= 1
+        legs.reverse()
+        return legs
+
+
+def build_transfer_index(locations, radius=TRANSFER_RADIUS):
+    """Walking transfers between stops within `radius` meters, found through a coarse grid"""
+    if not locations:
+        return {}
+    cell_lat = radius / 111320.0
+    mean_lat = sum(lat for _, lat, _ in locations.values()) / len(locations)
+    cell_lng = radius / (111320.0 * max(cos(radians(mean_lat)), 0.01))
+
+    grid = {}
+    for location_id, (_, lat, lng) in locations.items():
+        grid.setdefault((int(lat // cell_lat), int(lng // cell_lng)), []).append(location_id)
+
+    transfers = {}
+    for location_id, (_, lat, lng) in locations.items():
+        row, col = int(lat // cell_lat), int(lng // cell_lng)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                for other in grid.get((row + d_row, col + d_col), ()):
+                    if other == location_id:
+                        continue
+                    _, other_lat, other_lng = locations[other]
+                    distance = haversine(lat, lng, other_lat, other_lng)
+                    if distance <= radius:
+                        transfers.setdefault(location_id, []).append((other, distance / WALK_SPEED))
+    return transfers
+
+
+def _seconds(moment, midnight):
+    return int((moment - midnight).total_seconds())
+
+def build_network(day):
+    """Build the transit network for a service day from trip patterns and schedule rows"""
+    network = TransitNetwork()
+    for location in Location.query.all():
+        network.add_location(location.id, location.name, location.lat, location.lng)
+    for route in Route.query.all():
+        network.route_names[route.id] = route.name
+
+    patterns = TripPattern.query.options(
+        selectinload(TripPattern.calendar),
+        selectinload(TripPattern.stops),
+        selectinload(TripPattern.frequencies)
+    ).all()
+    previous_day = day - timedelta(days=1)
+    for pattern in patterns:
+        if not pattern.stops:
+            continue
+        stop_ids = [stop.location_id for stop in pattern.stops]
+        # Trips of the previous service day that are still running after midnight
+        for service_day, shift in ((previous_day, -DAY_SECONDS), (day, 0)):
+            if not pattern.calendar.runs_on(service_day):
+                continue
+            for block in pattern.frequencies:
+                for start in block.starts_between(0, DAY_SECONDS - 1):
+                    times = [(start + shift + stop.arrival_offset, start + shift + stop.departure_offset)
+                             for stop in pattern.stops]
+                    if times[-1][0] >= 0:
+                        network.add_trip(('pattern', pattern.id), pattern.route_id, stop_ids, times)
+
+    midnight = datetime.combine(day, datetime.min.time())
+    rows = Schedule.query.filter(
+        Schedule.arrivalTime >= midnight,
+        Schedule.arrivalTime < midnight + timedelta(days=1)
+    ).order_by(Schedule.route_id, Schedule.arrivalTime).all()
+    legacy = {}
+    for row in rows:
+        legacy.setdefault(row.route_id, []).append(row)
+    stop_indexes = route_stop_indexes()
+    for route_id, route_rows in legacy.items():
+        # Rows at locations that are not stops of the route have no place in its trips
+        trips, _ = split_trips(route_rows, stop_indexes.get(route_id, {}))
+        for trip in trips:
+            stop_ids = tuple(row.stop_id for _, row in trip)
+            network.add_trip(('schedule', route_id, stop_ids), route_id, stop_ids,
+                             [(_seconds(row.arrivalTime, midnight), _seconds(row.departureTime, midnight))
+                              for _, row in trip])
+
+    return network.finalize()
+
+
+_networks = {}
+
+def get_network(day):
+    """The transit network of a service day, built at most once per NETWORK_TTL in each worker"""
+    cached = _networks.get(day)
+    if cached and time.monotonic() - cached[0] < NETWORK_TTL:
+        return cached[1]
+    network = build_network(day)
+    if len(_networks) >= 3:
+        _networks.clear()
+    _networks[day] = (time.monotonic(), network)
+    return network
+
+def plan_journey(origin_id, target_id, depart=None, max_transfers=MAX_TRANSFERS):
+    """Plan the earliest arriving journey between two stops, or None when none exists"""
+    depart = depart or datetime.utcnow()
+    day = depart.date()
+    midnight = datetime.combine(day, datetime.min.time())
+    network = get_network(day)
+
+    result = network.plan(origin_id, target_id, _seconds(depart, midnight), max_transfers)
+    if not result:
+        return None
+    arrival, legs = result
+
+    def stop_json(location_id):
+        name, lat, lng = network.locations[location_id]
+        return {'id': location_id, 'name': name, 'lat': lat, 'lng': lng}
+
+    def at(seconds):
+        return (midnight + timedelta(seconds=seconds)).isoformat()
+
+    for leg in legs:
+        leg['from_stop'] = stop_json(leg['from_stop'])
+        leg['to_stop'] = stop_json(leg['to_stop'])
+        leg['departure'] = at(leg['departure'])
+        leg['arrival'] = at(leg['arrival'])
+        if leg['type'] == 'ride':
+            leg['route_name'] = network.route_names.get(leg['route_id'])
+
+    rides = sum(1 for leg in legs if leg['type'] == 'ride')
+    return {
+        'from_stop': stop_json(origin_id),
+        'to_stop': stop_json(target_id),
+        'departure': depart.isoformat(),
+        'arrival': at(arrival),
+        'duration_seconds': arrival - _seconds(depart, midnight),
+        'transfers': max(rides - 1, 0),
+        'legs': legs
+    }
+
+
+def synthetic_network(stops=2000, routes=200, seed=0):
+    """A grid-shaped network with frequent services, used to benchmark the planner"""
+    rng = random.Random(seed)
+    side = int(stops ** 0.5)
+    network = TransitNetwork()
+    for row in range(side):
+        for col in range(side):
+            network.add_location(row * side + col, f"Stop {row}-{col}", 10.0 + row * 0.003, -61.5 + col * 0.003)
+
+    for route_id in range(routes):
+        row, col = rng.randrange(side), rng.randrange(side)
+        stop_ids = [row * side + col]
+        length = rng.randint(15, 40)
+        d_row, d_col = rng.choice(((0, 1), (1, 0), (0, -1), (-1, 0)))
+        for _ in range(length * 4):
+            if len(stop_ids) >= length:
+                break
+            # Mostly straight corridors with the occasional turn
+            if rng.random() < 0.15 or not (0 <= row + d_row < side and 0 <= col + d_col < side):
+                d_row, d_col = rng.choice(((0, 1), (1, 0), (0, -1), (-1, 0)))
+            row, col = min(max(row + d_row, 0), side - 1), min(max(col + d_col, 0), side - 1)
+            if row * side + col not in stop_ids:
+                stop_ids.append(row * side + col)
+        offsets = [0]
+        for _ in stop_ids[1:]:
+            offsets.append(offsets[-1] + rng.randint(60, 120))
+        headway = rng.choice((300, 600, 900, 1200))
+        network.route_names[route_id] = f"Route {route_id}"
+        for start in range(5 * 3600 + rng.randrange(headway), 23 * 3600, headway):
+            network.add_trip(route_id, route_id, stop_ids, [(start + o, start + o + 20) for o in offsets])
+    return network.finalize()
+
+def benchmark_planner(stops=2000, routes=200, queries=200, seed=0):
+    """Build a synthetic network and time random planner queries, latencies in milliseconds"""
+    started = time.perf_counter()
+    network = synthetic_network(stops, routes, seed)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(seed + 1)
+    served = list(network.stop_patterns)
+    latencies, found = [], 0
+    for _ in range(queries):
+        origin, target = rng.sample(served, 2)
+        depart = rng.randrange(6 * 3600, 20 * 3600)
+        started = time.perf_counter()
+        if network.plan(origin, target, depart):
+            found += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    return {
+        'stops': len(network.locations),
+        'patterns': len(network.patterns),
+        'trips': sum(len(trips) for trips in network.trips),
+        'build_ms': build_ms,
+        'queries': queries,
+        'found': found,
+        'p50_ms': latencies[len(latencies) // 2],
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+        'max_ms': latencies[-1]
+    }
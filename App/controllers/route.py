@@ -1,15 +1,144 @@
-from App.models import Route
+from App.models import Route, RouteStop, RouteSegment, RouteGeometry
+from App.models.Location import haversine, AVG_BUS_SPEED, ROAD_FACTOR
+from App.controllers.eta import get_eta_model, ALL_HOURS
 from App.database import db
+from App.replicas import read_only
+from App.cache import get_cache
+from App.log import get_logger
+from sqlalchemy.orm import joinedload
+from App.json_provider import dumps, loads
+import hashlib
 
+log = get_logger(__name__)
+
+# Seconds a worker keeps route offsets before reading them again
+OFFSETS_TTL = 300
+
+@read_only
 def get_all_routes():
     
     try:
         routes = Route.query.all()
     except Exception as e:
-        print(f"Error fetching routes: {e}")
+        log.exception("Error fetching routes")
         return []
     
     if not routes:
         return []
     
     return routes
+
+@read_only
+def get_route_stops(route_id):
+    return RouteStop.query.options(joinedload(RouteStop.location)).filter_by(
+        route_id=route_id
+    ).order_by(RouteStop.stop_index).all()
+
+def route_stops_key(stops):
+    """Fingerprint of the ordered stop coordinates of a route"""
+    coordinates = ";".join(f"{stop.location.lng:.6f},{stop.location.lat:.6f}" for stop in stops)
+    return hashlib.sha1(coordinates.encode()).hexdigest()
+
+def get_route_geometry(route_id, stops):
+    """Stored directions GeoJSON text for a route, if it was computed for the current stops"""
+    geometry = RouteGeometry.query.filter_by(route_id=route_id).first()
+    if geometry and geometry.stops_key == route_stops_key(stops):
+        return geometry.geojson
+    return None
+
+def save_route_geometry(route_id, stops, directions):
+    """Store the directions GeoJSON returned by the routing service for a route"""
+    geojson = dumps(directions)
+    geometry = RouteGeometry.query.filter_by(route_id=route_id).first()
+    if geometry:
+        geometry.stops_key = route_stops_key(stops)
+        geometry.geojson = geojson
+    else:
+        geometry = RouteGeometry(route_id, route_stops_key(stops), geojson)
+        db.session.add(geometry)
+    db.session.commit()
+    return geojson
+
+def _geometry_legs(geojson, stop_count):
+    """(distance, duration) of each leg between consecutive stops in a directions GeoJSON"""
+    try:
+        legs = loads(geojson)['features'][0]['properties']['segments']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+    if len(legs) != stop_count - 1:
+        return None
+    return [(leg.get('distance', 0), leg.get('duration', 0)) for leg in legs]
+
+def build_route_segments(route):
+    """
+    Segment distance and typical travel time between consecutive stops of a route.
+    Times come from journey history, then stored route geometry, then the fixed-speed estimate.
+    """
+    stops = get_route_stops(route.id)
+    geojson = get_route_geometry(route.id, stops) if stops else None
+    legs = _geometry_legs(geojson, len(stops)) if geojson else None
+    model = get_eta_model()
+
+    segments = []
+    cum_distance = cum_time = 0.0
+    for position, stop in enumerate(stops):
+        if position == 0:
+            segments.append(RouteSegment(route.id, stop.stop_index, 0, 0, 0, 0, 'origin'))
+            continue
+
+        previous = stops[position - 1]
+        straight = haversine(previous.location.lat, previous.location.lng, stop.location.lat, stop.location.lng)
+        history = model.segment_stats(route.id, previous.stop_index, ALL_HOURS)
+
+        distance = legs[position - 1][0] if legs else straight * ROAD_FACTOR
+        if history:
+            travel_time, source = history[0], 'history'
+        elif legs:
+            travel_time, source = legs[position - 1][1], 'geometry'
+        else:
+            travel_time, source = straight * ROAD_FACTOR / AVG_BUS_SPEED, 'fallback'
+
+        cum_distance += distance
+        cum_time += travel_time
+        segments.append(RouteSegment(route.id, stop.stop_index, distance, travel_time, cum_distance, cum_time, source))
+    return segments
+
+def build_segment_matrix():
+    """Recompute and store the segment matrix of every route"""
+    count = 0
+    for route in Route.query.all():
+        segments = build_route_segments(route)
+        RouteSegment.query.filter_by(route_id=route.id).delete()
+        db.session.add_all(segments)
+        count += len(segments)
+    # The commit invalidates route_offsets in every worker
+    db.session.commit()
+    return count
+
+
+route_offsets = get_cache('route_offsets', ttl=OFFSETS_TTL, tables=('route_segment',), l1_entries=1024,
+                          decode=lambda offsets: {int(index): tuple(pair) for index, pair in offsets.items()})
+
+def get_route_offsets(route_id):
+    """{stop_index: (cum_distance, cum_time)} for a route, empty until the segment matrix is built"""
+    return route_offsets.get_or_compute(route_id, lambda: {
+        segment.stop_index: (segment.cum_distance, segment.cum_time)
+        for segment in RouteSegment.query.filter_by(route_id=route_id)
+    })
+
+def warm_route_offsets():
+    """Load the offsets of every route in one query"""
+    offsets = {}
+    for segment in RouteSegment.query.all():
+        offsets.setdefault(segment.route_id, {})[segment.stop_index] = (segment.cum_distance, segment.cum_time)
+    routes = Route.query.all()
+    for route in routes:
+        route_offsets.set(route.id, offsets.get(route.id, {}))
+    return len(routes)
+
+def get_travel_estimate(route_id, from_index, to_index):
+    """(distance, seconds) between two stops of a route from the stored prefix sums, or None"""
+    offsets = get_route_offsets(route_id)
+    if from_index not in offsets or to_index not in offsets:
+        return None
+    return (offsets[to_index][0] - offsets[from_index][0], offsets[to_index][1] - offsets[from_index][1])
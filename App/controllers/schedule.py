@@ -1,4 +1,97 @@
-from App.models import Schedule
+from App.models import Schedule, RouteStop, Route, ServiceCalendar, TripPattern
+from App.models.ServicePattern import get_stop_times
+from App.database import db
+from datetime import datetime, timedelta
 
 def get_stop_schedule(stop_id):
-    return Schedule.query.filter_by(stop_id=stop_id).first()
\ No newline at end of file
+    return Schedule.query.filter_by(stop_id=stop_id).first()
+
+def get_stop_timetable(stop_id, route_id, start=None, hours=2):
+    """Get the concrete stop times of a route at a location for the next few hours"""
+    start = start or datetime.utcnow()
+    return get_stop_times(route_id, stop_id, start, start + timedelta(hours=hours))
+
+def split_trips(rows, stop_indexes):
+    """
+    Split a route's Schedule rows, ordered by arrival, into trips: a trip goes on while each row
+    is a later stop of the route than the one before, and the next trip starts when the stop
+    index drops back. stop_indexes maps location ids to their stop indexes on the route.
+    Returns the trips as [(stop_index, row)] lists and the rows of locations not on the route.
+    """
+    trips, skipped = [], []
+    trip, previous = None, None
+    for row in rows:
+        indexes = stop_indexes.get(row.stop_id)
+        if not indexes:
+            skipped.append(row)
+            continue
+        # A location visited twice (a loop back to the terminal) takes its first index after the previous stop
+        later = [index for index in indexes if previous is not None and index > previous]
+        if later:
+            index = min(later)
+        else:
+            index = min(indexes)
+            trip = []
+            trips.append(trip)
+        trip.append((index, row))
+        previous = index
+    return trips, skipped
+
+def route_stop_indexes():
+    """{route_id: {location_id: [stop_index, ...]}} of every route, the stop_indexes of split_trips"""
+    indexes = {}
+    for route_id, location_id, stop_index in (
+            RouteStop.query.with_entities(RouteStop.route_id, RouteStop.location_id, RouteStop.stop_index)
+            .order_by(RouteStop.route_id, RouteStop.stop_index)):
+        indexes.setdefault(route_id, {}).setdefault(location_id, []).append(stop_index)
+    return indexes
+
+def compact_schedules(days="1111111"):
+    """
+    Convert per-trip Schedule rows into trip patterns. The rows of each route are split into trips,
+    trips visiting the same stops at the same offsets from their start share a pattern, and each
+    distinct start time becomes a trip of that pattern on the given service days. Rows of
+    locations that are not stops of their route are left in place.
+    """
+    calendar = ServiceCalendar.query.filter_by(days=days).first()
+    if not calendar:
+        calendar = ServiceCalendar(f"Service {days}", days)
+        db.session.add(calendar)
+
+    compacted = 0
+    stop_indexes = route_stop_indexes()
+    for route in Route.query.all():
+        if route.patterns:
+            continue
+
+        rows = Schedule.query.filter_by(route_id=route.id).order_by(Schedule.arrivalTime).all()
+        trips, _ = split_trips(rows, stop_indexes.get(route.id, {}))
+        if not trips:
+            continue
+        route_stops = {route_stop.stop_index: route_stop for route_stop in RouteStop.query.filter_by(route_id=route.id)}
+
+        # Trips with the same stops and offsets are one pattern run at each of their start times
+        patterns = {}
+        for trip in trips:
+            trip_start = trip[0][1].arrivalTime
+            offsets = tuple((index, int((row.arrivalTime - trip_start).total_seconds()),
+                             int((row.departureTime - trip_start).total_seconds())) for index, row in trip)
+            starts = patterns.setdefault(offsets, set())
+            starts.add(trip_start.hour * 3600 + trip_start.minute * 60 + trip_start.second)
+
+        for number, (offsets, starts) in enumerate(patterns.items(), 1):
+            name = f"{route.name} (daily)" if len(patterns) == 1 else f"{route.name} (daily {number})"
+            pattern = TripPattern(name, route, calendar)
+            db.session.add(pattern)
+            for index, arrival_offset, departure_offset in offsets:
+                pattern.add_stop(route_stops[index], arrival_offset, departure_offset)
+            for start in sorted(starts):
+                pattern.add_frequency(start)
+
+        for trip in trips:
+            for _, row in trip:
+                db.session.delete(row)
+        compacted += 1
+
+    db.session.commit()
+    return compacted
@@ -1,5 +1,13 @@
 from App.models import Location, RouteStop
+from App.replicas import read_only
+from App.log import get_logger
+from App.tracing import span
+from App.singleflight import SingleFlight
 
+log = get_logger(__name__)
+
+@span()
+@read_only
 def get_buses(stop_id, route_id):
     """Get buses approaching a specific stop on a route"""
     try:
@@ -16,5 +24,21 @@ def get_buses(stop_id, route_id):
         # Use the location's getBuses method to get approaching buses
         return location.getBuses(route_id)
     except Exception as e:
-        print(f"Error in get_buses: {str(e)}")
-        return []
\ No newline at end of file
+        log.exception("Error getting buses for stop", stop_id=stop_id)
+        return []
+
+@SingleFlight('arrivals', reuse=1.0)
+def get_arrivals(stop_id, route_id):
+    """
+    Buses approaching a stop as plain data. Riders waiting at one stop ask at once, so they
+    share one computation (and its OpenRouteService matrix) and its result for a second.
+    """
+    return [{
+        'journey_id': bus_info['journey'].id,
+        'bus_id': bus_info['bus'].id,
+        'plate_num': bus_info['bus'].plate_num,
+        'distance': bus_info['distance'],
+        'duration_seconds': bus_info['duration_seconds'],
+        'estimated_arrival': bus_info['estimated_arrival'],
+        'available_seats': bus_info['bus'].get_available_seats()
+    } for bus_info in get_buses(stop_id, route_id)]
@@ -0,0 +1,262 @@
+from App.database import db
+from App.models import (
+    Area, Location, Route, RouteStop, User, Bus, Journey, JourneyEvent, BoardEvent,
+    ServiceCalendar, TripPattern, PatternStop, FrequencyBlock
+)
+from App.models.Location import haversine, AVG_BUS_SPEED, ROAD_FACTOR
+from App.versioning import VERSIONED_TABLES, bump_versions, expire_versions
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, select, text
+from werkzeug.security import generate_password_hash
+import random
+import time
+
+# Insert order, parents before children
+TABLES = [model.__table__ for model in (
+    Area, Location, Route, RouteStop, User, Bus, ServiceCalendar, TripPattern, PatternStop,
+    FrequencyBlock, Journey, JourneyEvent, BoardEvent
+)]
+
+# Where synthetic stops are placed (roughly Trinidad)
+BOUNDS = ((10.05, 10.80), (-61.65, -61.00))
+
+# Degrees of latitude per meter, close enough for jittering coordinates
+DEGREES_PER_METER = 1 / 111320
+
+SERVICE_START = 5 * 3600
+SERVICE_END = 21 * 3600
+LAYOVER = 10 * 60
+
+
+class BulkWriter:
+    """Buffers rows per table and inserts them in chunks with executemany, parents first"""
+
+    def __init__(self, chunk=5000):
+        self.chunk = chunk
+        self.buffers = {table.name: [] for table in TABLES}
+        self.counts = {table.name: 0 for table in TABLES}
+        self.next_ids = {}
+        with db.engine.connect() as connection:
+            for table in TABLES:
+                self.next_ids[table.name] = (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def add(self, table, row):
+        """Queue a row, assigning its id. Returns the id."""
+        row['id'] = self.next_ids[table.name]
+        self.next_ids[table.name] += 1
+        buffer = self.buffers[table.name]
+        buffer.append(row)
+        if len(buffer) >= self.chunk:
+            self.flush()
+        return row['id']
+
+    def flush(self):
+        # A chunk of children can only go in after the parents they reference
+        with db.engine.begin() as connection:
+            for table in TABLES:
+                rows = self.buffers[table.name]
+                if rows:
+                    connection.execute(insert(table), rows)
+                    self.counts[table.name] += len(rows)
+                    self.buffers[table.name] = []
+
+    def close(self):
+        self.flush()
+        with db.engine.begin() as connection:
+            written = {name for name, count in self.counts.items() if count}
+            if written & VERSIONED_TABLES:
+                bump_versions(connection, written & VERSIONED_TABLES)
+            if connection.dialect.name == 'postgresql':
+                # Ids were assigned here, move the sequences past them
+                for table in TABLES:
+                    if table.name in written:
+                        connection.execute(text(
+                            f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                            f"(SELECT MAX(id) FROM \"{table.name}\"))"))
+        expire_versions()
+        return self.counts
+
+
+def _jitter(rng, lat, lng, meters):
+    return (lat + rng.uniform(-meters, meters) * DEGREES_PER_METER,
+            lng + rng.uniform(-meters, meters) * DEGREES_PER_METER)
+
+def _segment_seconds(a, b):
+    return haversine(a[0], a[1], b[0], b[1]) * ROAD_FACTOR / AVG_BUS_SPEED
+
+def _congestion(seconds_of_day):
+    hour = seconds_of_day / 3600
+    if 6.5 <= hour < 9 or 15.5 <= hour < 18.5:
+        return 1.4
+    if 9 <= hour < 15.5:
+        return 1.1
+    return 0.9
+
+
+def generate_network(writer, rng, areas, routes, stops):
+    """Areas with a terminal each, routes between them with stops along the way, and a daily pattern per route"""
+    area_rows = []
+    for index in range(areas):
+        lat, lng = rng.uniform(*BOUNDS[0]), rng.uniform(*BOUNDS[1])
+        area_id = writer.add(Area.__table__, {'name': f"Synthetic Area {index + 1}"})
+        terminal_id = writer.add(Location.__table__, {
+            'name': f"Synthetic Area {index + 1} Terminal", 'lat': lat, 'lng': lng, 'type': 'Terminal'
+        })
+        area_rows.append((area_id, terminal_id, (lat, lng)))
+
+    calendar_id = writer.add(ServiceCalendar.__table__, {
+        'name': "Synthetic Daily", 'days': "1111111", 'start_date': None, 'end_date': None
+    })
+
+    network = []
+    for index in range(routes):
+        start, end = rng.sample(area_rows, 2)
+        route_id = writer.add(Route.__table__, {
+            'name': f"Synthetic {start[0]}-{end[0]} #{index + 1}", 'cost': rng.choice((4, 5, 6, 8, 10, 12)),
+            'start_area_id': start[0], 'end_area_id': end[0]
+        })
+        count = rng.randint(*stops)
+        points = [(start[1], start[2])]
+        for position in range(1, count - 1):
+            fraction = position / (count - 1)
+            lat, lng = _jitter(rng, start[2][0] + (end[2][0] - start[2][0]) * fraction,
+                               start[2][1] + (end[2][1] - start[2][1]) * fraction, 400)
+            location_id = writer.add(Location.__table__, {
+                'name': f"Route {route_id} Stop {position}", 'lat': lat, 'lng': lng, 'type': 'Stop'
+            })
+            points.append((location_id, (lat, lng)))
+        points.append((end[1], end[2]))
+
+        route_stops = [writer.add(RouteStop.__table__, {
+            'route_id': route_id, 'location_id': location_id, 'stop_index': stop_index
+        }) for stop_index, (location_id, _) in enumerate(points)]
+        segments = [_segment_seconds(a[1], b[1]) for a, b in zip(points, points[1:])]
+
+        pattern_id = writer.add(TripPattern.__table__, {
+            'name': f"Synthetic route {route_id}", 'route_id': route_id, 'calendar_id': calendar_id
+        })
+        offset = 0
+        for stop_index, (location_id, _) in enumerate(points):
+            if stop_index:
+                offset += int(segments[stop_index - 1])
+            writer.add(PatternStop.__table__, {
+                'pattern_id': pattern_id, 'stop_index': stop_index, 'location_id': location_id,
+                'arrival_offset': offset, 'departure_offset': offset
+            })
+        writer.add(FrequencyBlock.__table__, {
+            'pattern_id': pattern_id, 'start_time': SERVICE_START, 'end_time': SERVICE_END,
+            'headway': rng.choice((900, 1200, 1800))
+        })
+        network.append({'id': route_id, 'points': points, 'route_stops': route_stops, 'segments': segments})
+    return network
+
+def generate_fleet(writer, network, buses_per_route, password_hash):
+    """A driver and a bus per vehicle, all drivers sharing one password hash"""
+    fleet = []
+    for route in network:
+        for _ in range(buses_per_route):
+            driver_id = writer.next_ids['user']
+            writer.add(User.__table__, {
+                'username': f"synth{driver_id}", 'password': password_hash, 'is_admin': False,
+                'type': 'driver', 'full_Name': f"Synthetic Driver {driver_id}", 'licenseNo': f"SY{driver_id:06d}"
+            })
+            bus_id = writer.next_ids['bus']
+            writer.add(Bus.__table__, {
+                'plate_num': f"SYN{bus_id:06d}", 'driver_id': driver_id, 'route_id': route['id'],
+                'passenger_count': 0, 'max_passenger_count': 50
+            })
+            fleet.append((bus_id, driver_id, route))
+    return fleet
+
+def generate_journey(writer, rng, bus_id, driver_id, route, start, ping, stop_at=None):
+    """
+    A completed journey with GPS pings every `ping` seconds and boarding at each stop, or one
+    still in progress at stop index `stop_at`. Returns when it ended or reached that stop.
+    """
+    journey_id = writer.next_ids['journey']
+    points, route_stops = route['points'], route['route_stops']
+    congestion = _congestion(start.hour * 3600 + start.minute * 60)
+
+    # Stop arrival times, with congestion and per-segment noise
+    arrivals = [0.0]
+    for seconds in route['segments']:
+        dwell = rng.uniform(15, 45)
+        arrivals.append(arrivals[-1] + dwell + seconds * congestion * max(0.6, rng.gauss(1, 0.15)))
+    completed = stop_at is None
+    if not completed:
+        arrivals = arrivals[:stop_at + 1]
+
+    events = []
+    elapsed = 0.0
+    segment = 0
+    while elapsed <= arrivals[-1]:
+        while segment < len(arrivals) - 2 and elapsed > arrivals[segment + 1]:
+            segment += 1
+        (_, a), (_, b) = points[segment], points[min(segment + 1, len(points) - 1)]
+        span = arrivals[segment + 1] - arrivals[segment] if segment + 1 < len(arrivals) else 0
+        fraction = min(1.0, (elapsed - arrivals[segment]) / span) if span else 0.0
+        lat, lng = _jitter(rng, a[0] + (b[0] - a[0]) * fraction, a[1] + (b[1] - a[1]) * fraction, 8)
+        events.append({'journey_id': journey_id, 'time': start + timedelta(seconds=elapsed), 'lat': lat, 'lng': lng})
+        elapsed += ping
+
+    end = start + timedelta(seconds=arrivals[-1])
+    writer.add(Journey.__table__, {
+        'bus_id': bus_id, 'driver_id': driver_id, 'route_id': route['id'], 'startTime': start,
+        'endTime': end if completed else None, 'current_stop_index': len(arrivals) - 1,
+        'status': "Completed" if completed else "In Progress"
+    })
+    for event in events:
+        writer.add(JourneyEvent.__table__, event)
+
+    load = 0
+    demand = 2 * congestion
+    for stop_index, stop_id in enumerate(route_stops[:len(arrivals)]):
+        at = start + timedelta(seconds=arrivals[stop_index])
+        last = completed and stop_index == len(route_stops) - 1
+        leaving = load if last else min(load, int(load * rng.uniform(0, 0.35)))
+        if leaving:
+            writer.add(BoardEvent.__table__, {'journey_id': journey_id, 'type': "Exit", 'qty': leaving, 'stop_id': stop_id, 'time': at})
+            load -= leaving
+        if not last:
+            boarding = min(50 - load, int(rng.expovariate(1 / demand)) if demand else 0)
+            if boarding:
+                writer.add(BoardEvent.__table__, {'journey_id': journey_id, 'type': "Enter", 'qty': boarding, 'stop_id': stop_id, 'time': at})
+                load += boarding
+    return end
+
+def generate_synthetic_data(seed=0, areas=20, routes=100, stops=(8, 30), buses_per_route=3, days=7,
+                            trips_per_day=6, ping=30, start=date(2025, 1, 6), chunk=5000, password="pass123",
+                            active=0):
+    """
+    Generate a synthetic network and days of completed journeys with bulk inserts, then
+    `active` journeys per route still on the road. The same arguments always produce the same
+    rows. Returns the rows written per table and the seconds taken.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, every synthetic driver shares one hash
+    password_hash = generate_password_hash(password)
+    writer = BulkWriter(chunk)
+
+    network = generate_network(writer, rng, areas, routes, stops)
+    fleet = generate_fleet(writer, network, buses_per_route, password_hash)
+    for day in range(days):
+        midnight = datetime.combine(start + timedelta(days=day), datetime.min.time())
+        for number, (bus_id, driver_id, route) in enumerate(fleet):
+            # Stagger the buses of a route, then run back to back with a layover
+            departure = midnight + timedelta(seconds=SERVICE_START + (number % buses_per_route) * 1200 + rng.randint(0, 300))
+            for _ in range(trips_per_day):
+                if departure >= midnight + timedelta(seconds=SERVICE_END):
+                    break
+                end = generate_journey(writer, rng, bus_id, driver_id, route, departure, ping)
+                departure = end + timedelta(seconds=LAYOVER + rng.randint(0, 600))
+
+    midday = datetime.combine(start + timedelta(days=days), datetime.min.time()) + timedelta(hours=12)
+    for number, (bus_id, driver_id, route) in enumerate(fleet):
+        if number % buses_per_route < active:
+            departure = midday + timedelta(seconds=rng.randint(0, 1800))
+            stop_at = rng.randint(1, max(1, len(route['route_stops']) - 2))
+            generate_journey(writer, rng, bus_id, driver_id, route, departure, ping, stop_at)
+
+    counts = writer.close()
+    return {'rows': counts, 'total': sum(counts.values()), 'seconds': time.perf_counter() - started}
@@ -1,14 +1,273 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from contextvars import ContextVar
+import logging
+import os
+import threading
+import time
 
+# Bind key of the replica that reads in the current context are routed to, set by App.replicas.read_only
+replica_bind = ContextVar('replica_bind', default=None)
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the current replica bind and flushes to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        key = replica_bind.get()
+        if bind is None and key is not None and not self._flushing and not self.info.get('wrote'):
+            engine = get_replica_engines().get(key)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Engine profile defaults, each overridable from config (or FLASK_DB_* environment variables)
+ENGINE_DEFAULTS = {
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 10,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_STATEMENT_TIMEOUT_MS': 15000
+}
+
+# Single-node SQLite: WAL lets readers run alongside the writer, NORMAL sync is safe under WAL
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -16000,
+    'mmap_size': 134217728
+}
+
+
+class PoolStats:
+    """Checkout counters of one connection pool"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+
+    def record(self, waited, in_use):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_total_ms': self.wait_total * 1000,
+                'wait_mean_ms': self.wait_total * 1000 / self.checkouts if self.checkouts else 0.0,
+                'wait_max_ms': self.wait_max * 1000,
+                'peak_in_use': self.peak_in_use
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self.stats.lock:
+                self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - started, self.checkedout())
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool, keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+# SQLAlchemy names pool loggers after the pool class, which puts this one under the app's
+# logger. Keep its connection chatter at the level SQLAlchemy's own pools default to.
+logging.getLogger(f'{__name__}.MeteredQueuePool').setLevel(logging.WARNING)
+
+
+def _setting(settings, key):
+    return settings.get(key, ENGINE_DEFAULTS[key])
+
+def engine_options(uri, settings):
+    """
+    SQLAlchemy engine arguments for a database URI under the DB_* settings:
+    a metered pool with explicit size, overflow, timeout, recycle and pre-ping,
+    and a per-statement timeout where the driver supports one
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    timeout_ms = int(_setting(settings, 'DB_STATEMENT_TIMEOUT_MS'))
+
+    if backend == 'sqlite':
+        # In-memory databases keep Flask-SQLAlchemy's single static connection
+        if url.database in (None, '', ':memory:'):
+            return {}
+        # SQLite has one writer; a few pooled connections are plenty
+        return {
+            'poolclass': MeteredQueuePool,
+            'pool_size': min(int(_setting(settings, 'DB_POOL_SIZE')), 5),
+            'max_overflow': int(_setting(settings, 'DB_MAX_OVERFLOW')),
+            'pool_timeout': int(_setting(settings, 'DB_POOL_TIMEOUT')),
+            # How long to wait on a locked database before raising
+            'connect_args': {'timeout': max(timeout_ms, 1000) / 1000}
+        }
+
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': int(_setting(settings, 'DB_POOL_SIZE')),
+        'max_overflow': int(_setting(settings, 'DB_MAX_OVERFLOW')),
+        'pool_timeout': int(_setting(settings, 'DB_POOL_TIMEOUT')),
+        'pool_recycle': int(_setting(settings, 'DB_POOL_RECYCLE')),
+        'pool_pre_ping': bool(_setting(settings, 'DB_POOL_PRE_PING'))
+    }
+    if timeout_ms:
+        if backend == 'postgresql':
+            options['connect_args'] = {'options': f'-c statement_timeout={timeout_ms}'}
+        elif backend in ('mysql', 'mariadb'):
+            options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={timeout_ms}'}
+    return options
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Apply PRAGMAs to every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+    memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if memory and name == 'journal_mode':
+                continue
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def gevent_wait_callback(connection, timeout=None):
+    """psycopg2 wait callback that yields to other greenlets while the server works"""
+    import psycopg2
+    from psycopg2 import extensions
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+def make_psycopg2_green():
+    """
+    Make psycopg2 cooperative under gevent. Without this a query blocks the
+    worker's whole event loop until the server answers.
+    """
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    extensions.set_wait_callback(gevent_wait_callback)
+    return True
+
+def gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def pool_status(engine=None):
+    """Connections in use and idle in an engine's pool, with its checkout wait counters"""
+    engine = engine or db.engine
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0)
+        })
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+def check_database(engine=None):
+    """Round trip a trivial query. Returns the latency in milliseconds."""
+    engine = engine or db.engine
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    return (time.perf_counter() - started) * 1000
 
-db = SQLAlchemy()
 
 def get_migrate(app):
+    from flask_migrate import Migrate
     return Migrate(app, db)
 
 def create_db():
     db.create_all()
-    
+
+def replica_uris(settings):
+    """SQLALCHEMY_REPLICAS as a list, given as a list or a comma separated string"""
+    replicas = settings.get('SQLALCHEMY_REPLICAS') or []
+    if isinstance(replicas, str):
+        replicas = [uri.strip() for uri in replicas.split(',') if uri.strip()]
+    return list(replicas)
+
+def make_replica_engine(app, uri):
+    """Engine for a read replica, with the same profile as the primary"""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+            and not os.path.isabs(url.database):
+        # Relative SQLite paths live in the instance folder, as Flask-SQLAlchemy does for the primary
+        url = url.set(database=os.path.join(app.instance_path, url.database))
+    return create_engine(url, **engine_options(uri, app.config))
+
+def get_replica_engines(app=None):
+    """Replica engines of the app by key (replica_1..n), outside Flask-SQLAlchemy's binds
+    so create_all and drop_all never touch them"""
+    return (app or current_app).extensions.get('replicas', {})
+
 def init_db(app):
-    db.init_app(app)
\ No newline at end of file
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    options = engine_options(uri, app.config) if uri else {}
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    # Only code marked with App.replicas.read_only reads from the replicas
+    app.extensions['replicas'] = {
+        f'replica_{index}': make_replica_engine(app, uri) for index, uri in enumerate(replica_uris(app.config), 1)
+    }
+    with app.app_context():
+        for engine in list(db.engines.values()) + list(get_replica_engines(app).values()):
+            set_sqlite_pragmas(engine, app.config.get('SQLITE_PRAGMAS', SQLITE_PRAGMAS))
+    if app.config.get('DB_GEVENT', gevent_patched()):
+        make_psycopg2_green()
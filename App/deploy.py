@@ -0,0 +1,144 @@
+from App.database import db, get_replica_engines
+from App.log import get_logger
+from datetime import datetime
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+log = get_logger(__name__)
+
+# Request paths that make a worker build its caches
+WARM_PATHS = ('/', '/health', '/api/stops/search?q=a')
+
+
+def warm_shared_state(app):
+    """
+    Build the read-only structures workers would otherwise each build on their first requests:
+    compiled templates, route topology, stop index, the ETA model and the offline road graph.
+    Called in the gunicorn master before forking. Returns the names of the structures that were warmed.
+    """
+    from App.controllers.planner import get_network
+    from App.controllers.isochrone import get_stop_graph
+    from App.controllers.eta import get_eta_model
+    from App.controllers.route import warm_route_offsets
+    from App.controllers import get_all_routes
+    from App.fragments import render_fragment
+    from App.serializers import SERIALIZERS, SHAPES
+    from App.routing import get_router
+    from App import ors
+
+    steps = {
+        'templates': lambda: [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates()
+                              if name.endswith('.html')],
+        'serializers': lambda: [serializer.plan(shape) for serializer in SERIALIZERS.values() for shape in SHAPES],
+        'route list': lambda: render_fragment('fragments/route_list.html', lambda: {'routes': get_all_routes()}),
+        'route offsets': warm_route_offsets,
+        'transit network': lambda: get_network(datetime.utcnow().date()),
+        'stop graph': get_stop_graph,
+        'eta model': get_eta_model
+    }
+    if ors.offline():
+        steps['road graph'] = get_router
+
+    warmed = []
+    with app.test_request_context('/'):
+        for name, step in steps.items():
+            try:
+                step()
+                warmed.append(name)
+            except Exception as e:
+                log.warning("Could not warm %s: %s", name, e)
+                db.session.rollback()
+        db.session.remove()
+    # Workers must open their own connections instead of sharing the master's sockets
+    db.engine.dispose()
+    for engine in get_replica_engines(app).values():
+        engine.dispose()
+    return warmed
+
+
+def process_memory(pid):
+    """Resident, proportional and unique set sizes (KiB) of a process from /proc smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss_kb': values.get('Rss', 0),
+        'pss_kb': values.get('Pss', 0),
+        'uss_kb': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    }
+
+def child_pids(pid):
+    pids = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    return pids
+
+
+def benchmark_memory(workers=2, preload=True, requests=20, port=8091, timeout=60):
+    """
+    Start gunicorn with gunicorn_config.py, send requests so the workers build their caches,
+    and report the memory of each worker. Uses the database configured for this app.
+    """
+    from App.config import config
+    # Its own cache store and metrics, so starting it does not empty those of a server running
+    # from this checkout (gunicorn_config.py only sees the bind in the file, not --bind)
+    state = tempfile.mkdtemp()
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0',
+               FLASK_SQLALCHEMY_DATABASE_URI=config['SQLALCHEMY_DATABASE_URI'],
+               FLASK_CACHE_PATH=os.path.join(state, 'cache.sqlite'),
+               FLASK_METRICS_DIR=os.path.join(state, 'metrics'))
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--access-logfile', '/dev/null', '--error-logfile', '/dev/null', 'wsgi:app'],
+        cwd=root, env=env
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=5).read()
+                if len(child_pids(master.pid)) == workers:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline or master.poll() is not None:
+                raise RuntimeError("gunicorn did not start")
+            time.sleep(0.2)
+
+        for _ in range(requests):
+            for path in WARM_PATHS:
+                try:
+                    urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=10).read()
+                except OSError:
+                    pass
+        time.sleep(0.5)
+
+        per_worker = [process_memory(pid) for pid in child_pids(master.pid)]
+        return {
+            'preload': preload,
+            'workers': len(per_worker),
+            'master': process_memory(master.pid),
+            'per_worker': per_worker,
+            'mean_rss_kb': sum(m['rss_kb'] for m in per_worker) / len(per_worker),
+            'mean_uss_kb': sum(m['uss_kb'] for m in per_worker) / len(per_worker),
+            'total_pss_kb': sum(m['pss_kb'] for m in per_worker) + process_memory(master.pid)['pss_kb']
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+        shutil.rmtree(state, ignore_errors=True)
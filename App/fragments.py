@@ -0,0 +1,28 @@
+from flask import current_app
+from markupsafe import Markup
+from App.versioning import get_versions
+from App.metrics import count_cache
+
+# Tables whose changes alter the public network listings
+NETWORK_TABLES = ('area', 'location', 'route', 'route_stop')
+
+_fragments = {}
+
+def render_fragment(template, context, tables=NETWORK_TABLES):
+    """
+    Render a template fragment once per data version of `tables` in each worker.
+    `context` is called only when the fragment has to be rendered again. Fragments are
+    shared by every visitor, so they are rendered without context processors or the request.
+    """
+    versions = get_versions(tables)
+    cached = _fragments.get(template)
+    if cached and cached[0] == versions:
+        count_cache('fragment', True)
+        return cached[1]
+    count_cache('fragment', False)
+    html = Markup(current_app.jinja_env.get_template(template).render(**context()))
+    _fragments[template] = (versions, html)
+    return html
+
+def clear_fragments():
+    _fragments.clear()
@@ -0,0 +1,184 @@
+from flask import current_app, make_response, request
+from functools import wraps
+from collections import OrderedDict
+from App.versioning import get_versions
+from App.metrics import count_cache
+import gzip
+import hashlib
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = frozenset((
+    'application/json', 'application/geo+json', 'text/html', 'text/plain', 'text/css', 'application/javascript'
+))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Limits of the per-worker cache of compressed bodies
+PRECOMPRESSED_ENTRIES = 256
+PRECOMPRESSED_BYTES = 32 * 1024 * 1024
+
+
+class PrecompressedCache:
+    """LRU of compressed bodies keyed by (strong ETag, encoding), bounded by entries and bytes"""
+
+    def __init__(self, max_entries=PRECOMPRESSED_ENTRIES, max_bytes=PRECOMPRESSED_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key)[0])
+            self._entries[key] = (body, mimetype)
+            self.size += len(body)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+precompressed = PrecompressedCache()
+
+
+def choose_encoding():
+    """Best content encoding the client accepts, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compute_etag(tables):
+    """Strong ETag for the current request from the path, arguments and data versions of tables"""
+    arguments = sorted(request.args.items(multi=True))
+    key = f"{current_app.config.get('ETAG_SALT', '')}|{request.path}|{arguments}|{get_versions(tables)}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.cache_control.no_store
+
+def conditional(*tables):
+    """
+    Mark a GET view whose body only depends on its arguments and the given tables. The ETag is
+    worked out from data versions before the view runs, so revalidations are answered with a 304
+    and repeated requests for hot payloads are served from the precompressed cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(tables)
+            encoding = choose_encoding()
+            for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+                if request.if_none_match.contains(candidate):
+                    count_cache('etag', True)
+                    response = current_app.response_class(status=304)
+                    response.set_etag(candidate)
+                    response.vary.add('Accept-Encoding')
+                    response.cache_control.no_cache = True
+                    return response
+
+            count_cache('etag', False)
+            cached = precompressed.get((etag, encoding)) if encoding else None
+            if encoding:
+                count_cache('precompressed', cached is not None)
+            if cached:
+                response = current_app.response_class(cached[0], mimetype=cached[1])
+                response.headers['Content-Encoding'] = encoding
+                response.set_etag(f"{etag}-{encoding}")
+            else:
+                response = make_response(view(*args, **kwargs))
+                if not _cacheable(response):
+                    return response
+                response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+def compress_response(response):
+    """Compress large text responses for clients that accept it, keeping strong ETag bodies"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if not encoding:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    compressed = compress(data, encoding)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        precompressed.put((etag, encoding), compressed, response.mimetype)
+        response.set_etag(f"{etag}-{encoding}")
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def setup_http_cache(app):
+    app.after_request(compress_response)
+
+
+def benchmark_index_flow(client, route_id, query='a', repeats=10):
+    """
+    Bytes sent and mean latency (ms) of the requests behind the index page, fetched plainly,
+    compressed, and revalidated with the ETags from a previous response.
+    """
+    urls = ['/', f'/api/routes/{route_id}', f'/api/route-directions/{route_id}', f'/api/stops/search?q={query}']
+    modes = {
+        'plain': {},
+        'compressed': {'Accept-Encoding': 'br, gzip'},
+        'revalidated': {'Accept-Encoding': 'br, gzip'}
+    }
+    results = {}
+    for url in urls:
+        etag = client.get(url, headers=modes['compressed']).headers.get('ETag')
+        for mode, headers in modes.items():
+            headers = dict(headers)
+            if mode == 'revalidated' and etag:
+                headers['If-None-Match'] = etag
+            sent = 0
+            started = time.perf_counter()
+            for _ in range(repeats):
+                response = client.get(url, headers=headers)
+                sent = len(response.get_data())
+            results.setdefault(url, {})[mode] = {
+                'status': response.status_code,
+                'bytes': sent,
+                'ms': (time.perf_counter() - started) / repeats * 1000
+            }
+    return results
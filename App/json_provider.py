@@ -0,0 +1,156 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+from enum import Enum
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder is used without it
+    orjson = None
+
+
+class RawJSON:
+    """
+    Already encoded JSON, such as stored route geometry. Returned from a view on its own it is
+    sent untouched. Nested in other data it is embedded without decoding when orjson is in use.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data.encode() if isinstance(data, str) else data
+
+
+def _default(obj):
+    """Types the stdlib encoder does not know, encoded the same way orjson encodes them"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, RawJSON):
+        return json.loads(obj.data)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _orjson_default(obj):
+    if isinstance(obj, RawJSON):
+        return orjson.Fragment(obj.data)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibEncoder:
+    name = 'stdlib'
+
+    @staticmethod
+    def dumps_bytes(obj, indent=False):
+        if indent:
+            return json.dumps(obj, default=_default, indent=2, ensure_ascii=False).encode()
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonEncoder:
+    name = 'orjson'
+
+    @staticmethod
+    def dumps_bytes(obj, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_orjson_default, option=option)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+ENCODERS = {'stdlib': StdlibEncoder}
+if orjson is not None:
+    ENCODERS['orjson'] = OrjsonEncoder
+
+def get_encoder(name='auto'):
+    """The named encoder, 'auto' picks orjson when it is installed"""
+    if name == 'auto':
+        return OrjsonEncoder if orjson is not None else StdlibEncoder
+    if name not in ENCODERS:
+        raise ValueError(f"JSON encoder '{name}' is not available, expected one of {', '.join(ENCODERS)}")
+    return ENCODERS[name]
+
+_encoder = get_encoder()
+
+def dumps_bytes(obj):
+    return _encoder.dumps_bytes(obj)
+
+def dumps(obj):
+    return _encoder.dumps_bytes(obj).decode()
+
+def loads(data):
+    return _encoder.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider for all API responses. Encodes with orjson when available and the stdlib
+    otherwise, writes dates as ISO 8601 and passes RawJSON bytes through without re-encoding.
+    """
+    mimetype = 'application/json'
+    compact = None
+
+    def __init__(self, app, encoder='auto'):
+        super().__init__(app)
+        self.encoder = get_encoder(encoder)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs and set(kwargs) - {'indent', 'separators', 'sort_keys', 'ensure_ascii'}:
+            # Callers asking for a custom encoder get the stdlib one
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return self.encoder.dumps_bytes(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return self.encoder.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, RawJSON):
+            return self._app.response_class(obj.data, mimetype=self.mimetype)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.encoder.dumps_bytes(obj, indent=indent), mimetype=self.mimetype)
+
+
+def benchmark_encoders(obj, iterations=50):
+    """Milliseconds per encode of obj with each available encoder, and for passing it through pre-encoded"""
+    import timeit
+    results = {}
+    for name, encoder in ENCODERS.items():
+        results[name] = timeit.timeit(lambda: encoder.dumps_bytes(obj), number=iterations) / iterations * 1000
+    raw = RawJSON(get_encoder().dumps_bytes(obj))
+    results['passthrough'] = timeit.timeit(lambda: raw.data, number=iterations) / iterations * 1000
+    results['bytes'] = len(raw.data)
+    return results
+
+
+def setup_json(app):
+    global _encoder
+    app.json = FastJSONProvider(app, app.config.get('JSON_ENCODER', 'auto'))
+    _encoder = app.json.encoder
+    return app.json
@@ -0,0 +1,139 @@
+from queue import SimpleQueue
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import random
+import sys
+
+# Loggers of the app all live under this one, so its handlers see every module
+ROOT = 'App'
+
+# Attributes every LogRecord has, anything else on a record is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    A logger taking structured fields as keyword arguments, e.g.
+    log.debug("Found %d board events", count, journey_id=7). Messages keep the logging
+    module's %-style arguments, so they are only formatted when a handler emits them.
+    """
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in ('exc_info', 'stack_info', 'stacklevel', 'extra')}
+        if fields:
+            kwargs['extra'] = {**kwargs.get('extra', {}), **fields}
+        return msg, kwargs
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the time, level, logger, message and structured fields"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Plain lines for development, with structured fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f'{key}={value}' for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        return f'{line} {fields}' if fields else line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a fraction of the DEBUG records of each logger prefix in `rates`, e.g.
+    {'App.models': 0.01} keeps about one model debug event in a hundred
+    """
+
+    def __init__(self, rates, random=random.random):
+        super().__init__()
+        # Longest prefix first, so the most specific rate wins
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self.random = random
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return self.random() < rate
+        return True
+
+
+def parse_settings(value, convert=str):
+    """{name: value} from a dict or a 'name=value,name=value' string, as set through the environment"""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return {name: convert(setting) for name, setting in value.items()}
+    pairs = (item.split('=', 1) for item in value.split(',') if '=' in item)
+    return {name.strip(): convert(setting.strip()) for name, setting in pairs}
+
+def _restart_listener():
+    # The listener thread does not survive a fork, each worker starts its own
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+os.register_at_fork(after_in_child=_restart_listener)
+atexit.register(_stop_listener)
+
+
+def setup_logging(app):
+    """
+    Send the app's log records through a queue to a listener thread that formats and writes
+    them, so requests never wait on log I/O. LOG_LEVEL sets the default level, LOG_LEVELS
+    per-module levels and LOG_SAMPLE the fraction of DEBUG records kept per module.
+    LOG_FORMAT is 'json' (default) or 'text'.
+    """
+    global _listener
+    _stop_listener()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(TextFormatter() if app.config.get('LOG_FORMAT', 'json') == 'text' else JSONFormatter())
+    queue = SimpleQueue()
+    handler = logging.handlers.QueueHandler(queue)
+    samples = parse_settings(app.config.get('LOG_SAMPLE'), float)
+    if samples:
+        handler.addFilter(SamplingFilter(samples))
+
+    logger = logging.getLogger(ROOT)
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+    logger.addHandler(handler)
+    logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    # The records are written once, by the listener, not again by the root logger's handlers
+    logger.propagate = False
+    for name, level in parse_settings(app.config.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
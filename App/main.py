@@ -1,12 +1,19 @@
 import os
 from flask import Flask, render_template
-from flask_uploads import DOCUMENTS, IMAGES, TEXT, UploadSet, configure_uploads
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-from werkzeug.datastructures import  FileStorage
 
 from App.database import init_db
 from App.config import load_config
+from App.log import setup_logging
+from App.json_provider import setup_json
+from App.versioning import setup_versioning
+from App.replicas import setup_replicas
+from App.http_cache import setup_http_cache
+from App.query_guard import setup_query_guard
+from App.metrics import setup_metrics
+from App.tracing import setup_tracing
+from App.cache import setup_cache
+from App.change_feed import setup_change_feed
 
 
 from App.controllers import (
@@ -20,17 +27,35 @@ def add_views(app):
     for view in views:
         app.register_blueprint(view)
 
+def setup_uploads(app):
+    # Nothing reads the photo set yet, so uploads are only configured when enabled
+    from flask_uploads import DOCUMENTS, IMAGES, TEXT, UploadSet, configure_uploads
+    photos = UploadSet('photos', TEXT + DOCUMENTS + IMAGES)
+    configure_uploads(app, photos)
+    return photos
+
 def create_app(overrides={}):
     app = Flask(__name__, static_url_path='/static')
     load_config(app, overrides)
+    setup_logging(app)
+    setup_json(app)
     CORS(app)
     add_auth_context(app)
-    photos = UploadSet('photos', TEXT + DOCUMENTS + IMAGES)
-    configure_uploads(app, photos)
+    if app.config.get('UPLOADS_ENABLED', False):
+        setup_uploads(app)
     add_views(app)
     init_db(app)
+    setup_versioning(app)
+    setup_cache(app)
+    setup_change_feed(app)
+    setup_replicas(app)
+    setup_http_cache(app)
+    setup_query_guard(app)
+    setup_metrics(app)
+    setup_tracing(app)
     jwt = setup_jwt(app)
-    setup_admin(app)
+    if app.config.get('ADMIN_ENABLED', True):
+        setup_admin(app)
     @jwt.invalid_token_loader
     @jwt.unauthorized_loader
     def custom_unauthorized_response(error):
@@ -0,0 +1,235 @@
+from flask import Response, g, request
+from bisect import bisect_left
+from App.log import get_logger
+import json
+import os
+import threading
+import time
+
+log = get_logger(__name__)
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100)
+
+# Seconds between writes of a worker's metrics to the shared directory
+FLUSH_INTERVAL = 1.0
+
+
+class Registry:
+    """
+    Counters and histograms of one process. With a metrics directory each process writes its
+    values to <dir>/<pid>.json and /metrics sums the files of every worker, so the numbers
+    add up across gunicorn workers. Counters of exited workers are kept, as Prometheus expects.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.directory = None
+        self.help = {}
+        self.kinds = {}
+        self.buckets = {}
+        self.gauges = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._flushed = 0.0
+
+    def counter(self, name, help):
+        self.help[name], self.kinds[name] = help, 'counter'
+        return name
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self.help[name], self.kinds[name], self.buckets[name] = help, 'histogram', tuple(buckets)
+        return name
+
+    def gauge(self, name, help, function):
+        """A value worked out by `function` when metrics are scraped, e.g. from the database"""
+        self.help[name], self.kinds[name], self.gauges[name] = help, 'gauge', function
+        return name
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self.buckets[name]
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(buckets) + 1), 0.0]
+            entry[0][bisect_left(buckets, value)] += 1
+            entry[1] += value
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+            self._flushed = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, list(labels), json.loads(json.dumps(value))] for (name, labels), value in self._values.items()]
+
+    def flush(self, force=False):
+        """Write this process's values to the metrics directory, at most every FLUSH_INTERVAL seconds"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed < FLUSH_INTERVAL:
+            return
+        self._flushed = now
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """{(name, labels): value} summed over every process writing to the metrics directory"""
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush(force=True)
+            snapshots = []
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.json'):
+                    try:
+                        with open(os.path.join(self.directory, filename)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        totals = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                key = (name, tuple(tuple(label) for label in labels))
+                if self.kinds.get(name) == 'histogram':
+                    total = totals.setdefault(key, [[0] * len(value[0]), 0.0])
+                    total[0] = [a + b for a, b in zip(total[0], value[0])]
+                    total[1] += value[1]
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format"""
+        totals = self.collect()
+        by_name = {}
+        for (name, labels), value in sorted(totals.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name in sorted(self.kinds):
+            kind = self.kinds[name]
+            lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'gauge':
+                try:
+                    lines.append(f'{name} {_number(self.gauges[name]())}')
+                except Exception as e:
+                    log.warning("Could not collect %s: %s", name, e)
+                continue
+            for labels, value in by_name.get(name, []):
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets[name] + (float('inf'),), value[0]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+metrics = Registry()
+# A forked worker starts counting from zero, whatever the master recorded while warming up
+os.register_at_fork(after_in_child=metrics.reset)
+
+REQUEST_SECONDS = metrics.histogram('http_request_duration_seconds', 'Request latency by Flask endpoint')
+REQUESTS = metrics.counter('http_requests_total', 'Requests by Flask endpoint, method and status')
+REQUEST_DB_SECONDS = metrics.histogram('http_request_db_seconds', 'Database time per request by Flask endpoint')
+REQUEST_QUERIES = metrics.histogram('http_request_queries', 'Statements per request by Flask endpoint', QUERY_BUCKETS)
+ORS_SECONDS = metrics.histogram('ors_request_duration_seconds', 'OpenRouteService call latency by operation')
+ORS_ERRORS = metrics.counter('ors_errors_total', 'Failed OpenRouteService calls by operation')
+ORS_BATCH_REQUESTS = metrics.histogram('ors_matrix_batch_requests', 'Matrix requests merged into each OpenRouteService call', BATCH_BUCKETS)
+CACHE_REQUESTS = metrics.counter('cache_requests_total', 'Cache lookups by cache and result (hit or miss)')
+
+
+def count_cache(cache, hit):
+    metrics.inc(CACHE_REQUESTS, cache=cache, result='hit' if hit else 'miss')
+
+def _active_journeys():
+    from App.models import Journey
+    return Journey.query.filter(Journey.endTime.is_(None), Journey.status == "In Progress").count()
+
+metrics.gauge('active_journeys', 'Journeys in progress', _active_journeys)
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+def _record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None or request.endpoint == 'metrics':
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe(REQUEST_SECONDS, time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    metrics.inc(REQUESTS, endpoint=endpoint, method=request.method, status=response.status_code)
+    query_log = g.get('query_log')
+    if query_log is not None:
+        metrics.observe(REQUEST_DB_SECONDS, query_log.seconds, endpoint=endpoint)
+        metrics.observe(REQUEST_QUERIES, query_log.count, endpoint=endpoint)
+    metrics.flush()
+    return response
+
+def metrics_view():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def setup_metrics(app):
+    """Record request metrics and serve them on /metrics. METRICS_DIR shares them between workers."""
+    metrics.enabled = app.config.get('METRICS_ENABLED', True)
+    metrics.directory = app.config.get('METRICS_DIR') or None
+    if metrics.directory:
+        os.makedirs(metrics.directory, mode=0o700, exist_ok=True)
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def benchmark_metrics_overhead(client, urls, rounds=20, requests=50):
+    """
+    Mean request latency (ms) with metrics recording off and on, alternating rounds so both
+    see the same conditions, and the relative overhead
+    """
+    timings = {False: [], True: []}
+    enabled = metrics.enabled
+    try:
+        for url in urls:
+            client.get(url)
+        for _ in range(rounds):
+            for state in (False, True):
+                metrics.enabled = state
+                started = time.perf_counter()
+                for i in range(requests):
+                    client.get(urls[i % len(urls)])
+                timings[state].append((time.perf_counter() - started) / requests * 1000)
+    finally:
+        metrics.enabled = enabled
+    # The fastest round of each is the least disturbed by the rest of the machine
+    off, on = min(timings[False]), min(timings[True])
+    return {'requests': rounds * requests, 'off_ms': off, 'on_ms': on, 'overhead': (on - off) / off}
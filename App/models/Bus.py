@@ -19,15 +19,8 @@ class Bus(db.Model):
         self.max_passenger_count = max_passenger_count
     
     def get_json(self):
-        return {
-            'id': self.id,
-            'plate_num': self.plate_num,
-            'driver': self.driver.get_json() if self.driver else None,
-            'route': self.route.get_json() if self.route else None,
-            'passenger_count': self.passenger_count,
-            'max_passenger_count': self.max_passenger_count,
-            'available_seats': self.max_passenger_count - self.passenger_count
-        }
+        from App.serializers import serialize
+        return serialize(self, 'deep')
     
     def selectRoute(self, route):
         self.route = route
@@ -0,0 +1,25 @@
+from App.database import db
+from datetime import datetime
+
+
+class ChangeFeed(db.Model):
+    """
+    One committed change to tables other app nodes cache, written in the same transaction.
+    Nodes read the rows after the last id they have seen and drop their cached copies.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    tables = db.Column(db.String(255), nullable=False)
+    node = db.Column(db.String(64), nullable=False)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __init__(self, tables, node):
+        self.tables = ','.join(sorted(tables))
+        self.node = node
+
+    def get_json(self):
+        return {
+            'id': self.id,
+            'tables': self.tables.split(','),
+            'node': self.node,
+            'created': self.created.isoformat()
+        }
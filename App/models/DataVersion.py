@@ -0,0 +1,17 @@
+from App.database import db
+
+
+class DataVersion(db.Model):
+    """Change counter of a table, bumped in the same transaction as every change to it"""
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, name, version=0):
+        self.name = name
+        self.version = version
+
+    def get_json(self):
+        return {
+            'name': self.name,
+            'version': self.version
+        }
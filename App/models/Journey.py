@@ -4,6 +4,11 @@ from datetime import datetime, time
 from .BoardEvent import BoardEvent
 from .JourneyEvent import JourneyEvent
 from .Route import Route
+from sqlalchemy.orm import joinedload
+from App.log import get_logger
+from App.tracing import span
+
+log = get_logger(__name__)
 
 
 class Journey(db.Model):
@@ -122,18 +127,17 @@ class Journey(db.Model):
             
         return int((self.current_stop_index / (total_stops - 1)) * 100) if total_stops > 1 else 100
     
+    @span()
     def getStats(self):
         try:
-            print(f"Starting getStats for journey {self.id}")
-            
             # Get all board events for this journey during the journey timeframe
             board_events = BoardEvent.query.filter(
                 BoardEvent.journey_id == self.id,
                 BoardEvent.time >= self.startTime,
                 BoardEvent.time <= (self.endTime or datetime.utcnow())
             ).all()
-            
-            print(f"Found {len(board_events)} board events")
+
+            log.debug("Generating stats", journey_id=self.id, board_events=len(board_events))
             
             # Calculate passenger statistics
             total_entries = 0
@@ -145,19 +149,18 @@ class Journey(db.Model):
                 elif event.type == "Exit":
                     total_exits += event.qty
             
-            print(f"Calculated passengers: {total_entries} entries, {total_exits} exits")
+            log.debug("Calculated passengers", journey_id=self.id, boarded=total_entries, alighted=total_exits)
             
             # Calculate revenue based on route cost and passengers
             if not self.route:
-                print("Route is None, cannot calculate revenue")
+                log.debug("Journey has no route, cannot calculate revenue", journey_id=self.id)
                 revenue = 0
             else:
                 if not hasattr(self.route, 'cost'):
-                    print("Route has no cost attribute")
+                    log.debug("Route has no cost", journey_id=self.id)
                     revenue = 0
                 else:
                     revenue = total_entries * self.route.cost
-                    print(f"Calculated revenue: {revenue}")
             
             # Calculate journey duration
             duration = "Unknown"
@@ -170,9 +173,8 @@ class Journey(db.Model):
                     minutes = (datetime.utcnow() - self.startTime).total_seconds() // 60  
                     seconds = (datetime.utcnow() - self.startTime).total_seconds() % 60
                     duration = f"{int(minutes)}m {int(floor(seconds))}s"
-                print(f"Calculated duration: {duration}")
             except Exception as duration_error:
-                print(f"Error calculating duration: {str(duration_error)}")
+                log.warning("Could not calculate duration: %s", duration_error, journey_id=self.id)
                 duration = "Unknown"
             
             # Get stop delays - comparing actual arrival times with scheduled times
@@ -180,11 +182,11 @@ class Journey(db.Model):
             
             # Check if route exists and has stops
             if not self.route:
-                print("Route is None, cannot get stops")
+                log.debug("Journey has no route, cannot get stops", journey_id=self.id)
             elif not hasattr(self.route, 'stops'):
-                print("Route has no stops attribute")
+                log.debug("Route has no stops", journey_id=self.id)
             else:
-                print(f"Route has {len(self.route.stops) if self.route.stops else 0} stops")
+                log.debug("Route stops", journey_id=self.id, stops=len(self.route.stops) if self.route.stops else 0)
                 
                 if self.route.stops:
                     for route_stop in self.route.stops:
@@ -197,27 +199,27 @@ class Journey(db.Model):
                                 
                                 # Get scheduled time if available
                                 if not hasattr(route_stop, 'location'):
-                                    print(f"RouteStop {route_stop.id} has no location attribute")
+                                    log.debug("Route stop has no location", route_stop_id=route_stop.id)
                                     continue
                                 
                                 if not route_stop.location:
-                                    print(f"RouteStop {route_stop.id} location is None")
+                                    log.debug("Route stop location is missing", route_stop_id=route_stop.id)
                                     continue
                                 
                                 location = route_stop.location
                                 
                                 if not hasattr(location, 'getSchedule'):
-                                    print(f"Location {location.id} has no getSchedule method")
+                                    log.debug("Location has no schedule", location_id=location.id)
                                     continue
                                 
-                                schedule = location.getSchedule(self.route_id)
+                                schedule = location.getSchedule(self.route_id, arrival_time)
                                 
                                 if not schedule:
-                                    print(f"No schedule found for location {location.id} and route {self.route_id}")
+                                    log.debug("No schedule found", location_id=location.id, route_id=self.route_id)
                                     continue
                                 
                                 if not hasattr(schedule, 'arrivalTime'):
-                                    print(f"Schedule {schedule.id} has no arrivalTime attribute")
+                                    log.debug("Schedule has no arrival time", schedule_id=schedule.id)
                                     continue
                                 
                                 # Extract time components only for comparison
@@ -252,13 +254,13 @@ class Journey(db.Model):
                                     'actual_time': actual_time_of_day.strftime('%H:%M:%S'),
                                     'delay_minutes': round(delay_minutes, 2)
                                 })
-                                print(f"Added delay for stop {location.name}: {round(delay_minutes, 2)} minutes")
+                                log.debug("Stop delay", journey_id=self.id, stop=location.name, delay_minutes=round(delay_minutes, 2))
                         except Exception as stop_error:
-                            print(f"Error processing stop delay for stop {route_stop.id}: {str(stop_error)}")
+                            log.warning("Could not work out the delay at a stop: %s", stop_error, route_stop_id=route_stop.id)
                             # Continue with the next stop instead of failing completely
                             continue
             
-            print("Successfully generated stats")
+            log.debug("Generated stats", journey_id=self.id, stop_delays=len(stop_delays))
             
             return {
                 'journey_id': self.id,
@@ -271,10 +273,7 @@ class Journey(db.Model):
                 'stop_delays': stop_delays
             }
         except Exception as e:
-            import traceback
-            import sys
-            print(f"Error generating journey stats for journey {self.id}: {str(e)}")
-            traceback.print_exc(file=sys.stdout)
+            log.exception("Error generating journey stats", journey_id=self.id)
             
             # Return a basic set of stats if there's an error
             return {
@@ -304,7 +303,11 @@ class Journey(db.Model):
     def get_journeys_for_driver(cls, driver_id):
         """Get all journeys for a specific driver"""
         try:
-            return cls.query.filter_by(driver_id=driver_id).order_by(cls.startTime.desc()).all()
+            # The journeys page shows each journey's route and its areas
+            return cls.query.options(
+                joinedload(cls.route).joinedload(Route.start_area),
+                joinedload(cls.route).joinedload(Route.end_area)
+            ).filter_by(driver_id=driver_id).order_by(cls.startTime.desc()).all()
         except Exception as e:
-            print(f"Error getting journeys for driver {driver_id}: {str(e)}")
+            log.exception("Error getting journeys for driver", driver_id=driver_id)
             return [] 
\ No newline at end of file
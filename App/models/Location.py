@@ -2,6 +2,7 @@ from App.database import db
 from enum import Enum
 
 from .Schedule import Schedule
+from .ServicePattern import find_schedule
 from .Journey import Journey
 from .JourneyEvent import JourneyEvent
 from .Route import Route
@@ -9,10 +10,35 @@ from .RouteStop import RouteStop
 from .BoardEvent import BoardEvent
 
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
+from math import radians, sin, cos, sqrt, atan2
 import os
 from datetime import datetime, timedelta
-import openrouteservice
 from App.config import config
+from App import ors
+from App.log import get_logger
+from App.tracing import span
+
+log = get_logger(__name__)
+
+# Average bus speed in meters per second (30 km/h)
+AVG_BUS_SPEED = 8.33
+# Roads are not straight, straight-line distances are stretched by this factor
+ROAD_FACTOR = 1.3
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in meters between two points given in decimal degrees"""
+    R = 6371000  # Earth radius in meters
+    
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    return R * c
 
 class LocationType(Enum):
     Stop = "Stop"
@@ -47,19 +73,24 @@ class Location(db.Model):
             'name': self.name,
             'lat': self.lat,
             'lng': self.lng,
-            'type': self.type.value
+            'type': self.type
         }
         
-    def getSchedule(self, route_id):
-        return Schedule.query.filter(Schedule.route_id == route_id, Schedule.stop_id == self.id).first()
+    def getSchedule(self, route_id, near=None):
+        """Scheduled stop time on a route closest to `near`, from trip patterns or the legacy Schedule row"""
+        return find_schedule(route_id, self.id, near)
         
+    @span()
     def getBuses(self, route_id):
+        # ETAs come from the in-process history model unless configured to use OpenRouteService
+        use_ors = config.get('ETA_SOURCE', 'model') == 'ors'
+        
         # Get API key from environment variable
         ors_api_key = config.get('OPENROUTE_SERVICE_KEY', '')
         
-        # Check if API key is valid
-        if not ors_api_key:
-            print("Warning: OpenRouteService API key not configured")
+        # Check if API key is valid, unless the offline routing engine answers instead
+        if use_ors and not ors.available(ors_api_key):
+            log.warning("OpenRouteService API key not configured")
             return []
         
         # Find this stop's position in the route
@@ -80,49 +111,54 @@ class Location(db.Model):
         if not previous_stop_position:
             return []  # There is no previous stop (this is the first stop)
         
-        # Find active journeys on this route
-        active_journeys = Journey.query.filter_by(route_id=route_id, endTime=None).all()
+        # Find active journeys on this route, with their buses
+        active_journeys = Journey.query.options(joinedload(Journey.bus)).filter_by(
+            route_id=route_id, endTime=None
+        ).all()
         
         if not active_journeys:
             return []
         
+        # Most recent board event of each active journey at the previous and current stops, in one query
+        last_boarded = dict(
+            ((journey_id, stop_id), time) for journey_id, stop_id, time in db.session.query(
+                BoardEvent.journey_id, BoardEvent.stop_id, func.max(BoardEvent.time)
+            ).filter(
+                BoardEvent.journey_id.in_([journey.id for journey in active_journeys]),
+                BoardEvent.stop_id.in_([previous_stop_position.id, current_stop_position.id])
+            ).group_by(BoardEvent.journey_id, BoardEvent.stop_id)
+        )
+        
         # Find buses that have board events at the previous stop but not at the current stop
         buses_between_stops = []
         
         for journey in active_journeys:
-            # Get the bus for this journey
-            bus = journey.bus
-            
-            # Check if there are board events for this bus at the previous stop
-            previous_stop_event = BoardEvent.query.filter_by(
-                journey_id=journey.id,
-                stop_id=previous_stop_position.id
-            ).order_by(BoardEvent.time.desc()).first()
-            
-            # Check if there are board events for this bus at the current stop
-            current_stop_event = BoardEvent.query.filter_by(
-                journey_id=journey.id,
-                stop_id=current_stop_position.id
-            ).order_by(BoardEvent.time.desc()).first()
+            previous_stop_time = last_boarded.get((journey.id, previous_stop_position.id))
+            current_stop_time = last_boarded.get((journey.id, current_stop_position.id))
             
             # If there are events at the previous stop but none at the current stop,
             # or if the most recent event at the previous stop is more recent than
             # the most recent event at the current stop, the bus is between stops
-            if previous_stop_event and (not current_stop_event or 
-                                        previous_stop_event.time > current_stop_event.time):
+            if previous_stop_time and (not current_stop_time or previous_stop_time > current_stop_time):
                 buses_between_stops.append(journey)
         
         if not buses_between_stops:
             return []
         
-        # Get latest position for each journey
+        # Latest position of each journey between the stops, in one query
+        latest = db.session.query(
+            JourneyEvent.journey_id, func.max(JourneyEvent.time).label('time')
+        ).filter(
+            JourneyEvent.journey_id.in_([journey.id for journey in buses_between_stops])
+        ).group_by(JourneyEvent.journey_id).subquery()
+        latest_events = {event.journey_id: event for event in JourneyEvent.query.join(
+            latest, (JourneyEvent.journey_id == latest.c.journey_id) & (JourneyEvent.time == latest.c.time)
+        ).order_by(JourneyEvent.id)}
+        
         bus_info = []
         
         for journey in buses_between_stops:
-            # Get the latest event for this journey
-            latest_event = JourneyEvent.query.filter_by(
-                journey_id=journey.id
-            ).order_by(JourneyEvent.time.desc()).first()
+            latest_event = latest_events.get(journey.id)
             
             if latest_event:
                 bus_info.append({
@@ -136,34 +172,28 @@ class Location(db.Model):
         if not bus_info:
             return []
         
+        if not use_ors:
+            return self._model_estimates(route_id, previous_stop_position, current_stop_position, bus_info)
+        
         try:
-            # Initialize the OpenRouteService client
-            client = openrouteservice.Client(key=ors_api_key)
+            # Bus coordinates
+            coordinates = [[info['lng'], info['lat']] for info in bus_info]
             
-            # Create coordinates list with current location as first entry
-            coordinates = [[self.lng, self.lat]]
-            
-            # Add bus coordinates
-            for info in bus_info:
-                coordinates.append([info['lng'], info['lat']])
-            
-            # Make API request with both distance and duration metrics using the Python client
+            # Only the row from this stop is needed, batched with other stops' rows into one call
             try:
-                matrix = client.distance_matrix(
-                    locations=coordinates,
-                    profile='driving-car',
-                    metrics=['distance', 'duration'],
-                    units='m'  # meters
-                )
+                row = ors.matrix_row([self.lng, self.lat], coordinates, ors_api_key)
                 
                 # Process results
-                distances = matrix['distances'][0]  # First row contains distances from our location
-                durations = matrix['durations'][0]  # First row contains durations from our location
+                distances = row['distances']
+                durations = row['durations']
                 
-                # Skip the first entries (which are 0, distance/duration to self)
-                for i in range(len(distances) - 1):
-                    distance = distances[i + 1]
-                    duration_seconds = durations[i + 1]
+                for i in range(len(distances)):
+                    distance = distances[i]
+                    duration_seconds = durations[i]
+                    if distance is None or duration_seconds is None:
+                        # No road from this bus to the stop, estimate from the straight line
+                        distance = haversine(self.lat, self.lng, bus_info[i]['lat'], bus_info[i]['lng'])
+                        duration_seconds = (distance * ROAD_FACTOR) / AVG_BUS_SPEED
                     
                     # Calculate estimated arrival time
                     now = datetime.utcnow()
@@ -181,47 +211,44 @@ class Location(db.Model):
                 bus_info.sort(key=lambda x: x['distance'])
                 return bus_info[:3]
                 
-            except openrouteservice.exceptions.ApiError as e:
-                print(f"OpenRouteService API error: {str(e)}")
+            except ors.api_error() as e:
+                log.warning("OpenRouteService API error: %s", e, location_id=self.id)
                 # Fallback: Estimate using straight-line distance
                 return self._fallback_distance_calculation(bus_info)
                 
         except Exception as e:
             # Handle any errors from the OpenRouteService client
-            print(f"Error calculating distances: {str(e)}")
+            log.exception("Error calculating distances", location_id=self.id)
             # Fallback: Estimate using straight-line distance
             return self._fallback_distance_calculation(bus_info)
             
-    def _fallback_distance_calculation(self, bus_info):
-        """Fallback method to calculate straight-line distance and estimated arrival"""
-        from math import radians, sin, cos, sqrt, atan2
+    @span()
+    def _model_estimates(self, route_id, previous_stop, current_stop, bus_info):
+        """Estimate distance and arrival with the historical ETA model, without any network calls"""
+        from App.controllers.eta import estimate_arrival
         
-        def haversine(lat1, lon1, lat2, lon2):
-            # Calculate the great circle distance between two points
-            # on the earth (specified in decimal degrees)
-            R = 6371000  # Earth radius in meters
-            
-            # Convert decimal degrees to radians
-            lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-            
-            # Haversine formula
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * atan2(sqrt(a), sqrt(1-a))
-            distance = R * c
-            
-            return distance
-        
-        # Average bus speed in meters per second (30 km/h)
-        avg_speed = 8.33  # m/s
+        now = datetime.utcnow()
+        for info in bus_info:
+            distance, duration_seconds = estimate_arrival(
+                route_id, previous_stop, current_stop, info['lat'], info['lng'], now
+            )
+            info['distance'] = distance
+            info['duration_seconds'] = duration_seconds
+            info['estimated_arrival'] = (now + timedelta(seconds=duration_seconds)).strftime('%H:%M:%S')
         
+        # Sort by distance and take the closest 3
+        bus_info.sort(key=lambda x: x['distance'])
+        return bus_info[:3]
+            
+    @span()
+    def _fallback_distance_calculation(self, bus_info):
+        """Fallback method to calculate straight-line distance and estimated arrival"""
         for info in bus_info:
             # Calculate straight-line distance
             distance = haversine(self.lat, self.lng, info['lat'], info['lng'])
             
             # Estimate duration (add 30% to account for roads not being straight)
-            duration_seconds = (distance * 1.3) / avg_speed
+            duration_seconds = (distance * ROAD_FACTOR) / AVG_BUS_SPEED
             
             # Calculate estimated arrival time
             now = datetime.utcnow()
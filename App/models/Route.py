@@ -12,7 +12,9 @@ class Route(db.Model):
 
     buses = db.relationship('Bus', back_populates='route')
     schedules = db.relationship('Schedule', back_populates='route')
-    stops = db.relationship('RouteStop', back_populates='route')
+    stops = db.relationship('RouteStop', back_populates='route', order_by='RouteStop.stop_index')
+    patterns = db.relationship('TripPattern', back_populates='route')
+    segments = db.relationship('RouteSegment', back_populates='route', order_by='RouteSegment.stop_index')
     
     def __init__(self, name, cost, start_area, end_area):
         self.name = name
@@ -21,12 +23,5 @@ class Route(db.Model):
         self.end_area = end_area
     
     def get_json(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'cost': self.cost,
-            'start_area': self.start_area.get_json() if self.start_area else None,
-            'end_area': self.end_area.get_json() if self.end_area else None,
-            'buses': [bus.get_json() for bus in self.buses],
-            'schedules': [schedule.get_json() for schedule in self.schedules]
-        }
\ No newline at end of file
+        from App.serializers import serialize
+        return serialize(self, 'deep')
\ No newline at end of file
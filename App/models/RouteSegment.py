@@ -0,0 +1,55 @@
+from App.database import db
+from datetime import datetime
+
+
+class RouteSegment(db.Model):
+    """
+    Travel from the previous stop to the stop at `stop_index` on a route, with offsets
+    accumulated from the first stop so any stop-to-stop estimate is a subtraction.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False, index=True)
+    stop_index = db.Column(db.Integer, nullable=False)
+    distance = db.Column(db.Float, nullable=False, default=0)
+    travel_time = db.Column(db.Float, nullable=False, default=0)
+    cum_distance = db.Column(db.Float, nullable=False, default=0)
+    cum_time = db.Column(db.Float, nullable=False, default=0)
+    source = db.Column(db.String(20), nullable=False)
+
+    route = db.relationship('Route', back_populates='segments')
+
+    def __init__(self, route_id, stop_index, distance, travel_time, cum_distance, cum_time, source):
+        self.route_id = route_id
+        self.stop_index = stop_index
+        self.distance = distance
+        self.travel_time = travel_time
+        self.cum_distance = cum_distance
+        self.cum_time = cum_time
+        self.source = source
+
+    def get_json(self):
+        return {
+            'route_id': self.route_id,
+            'stop_index': self.stop_index,
+            'distance': self.distance,
+            'travel_time': self.travel_time,
+            'cum_distance': self.cum_distance,
+            'cum_time': self.cum_time,
+            'source': self.source
+        }
+
+
+class RouteGeometry(db.Model):
+    """Driving directions for a route as returned by the routing service, stored as GeoJSON text"""
+    id = db.Column(db.Integer, primary_key=True)
+    route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False, unique=True)
+    # Identifies the stop coordinates the geometry was computed for
+    stops_key = db.Column(db.String(64), nullable=False)
+    geojson = db.Column(db.Text, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __init__(self, route_id, stops_key, geojson):
+        self.route_id = route_id
+        self.stops_key = stops_key
+        self.geojson = geojson
+        self.updated = datetime.utcnow()
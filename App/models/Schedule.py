@@ -18,10 +18,5 @@ class Schedule(db.Model):
         self.departureTime = departureTime
     
     def get_json(self):
-        return {
-            'id': self.id,
-            'stop': self.stop.get_json() if self.stop else None,
-            'route': self.route.get_json() if self.route else None,
-            'arrivalTime': self.arrivalTime.isoformat(),
-            'departureTime': self.departureTime.isoformat()
-        } 
\ No newline at end of file
+        from App.serializers import serialize
+        return serialize(self, 'deep') 
\ No newline at end of file
@@ -0,0 +1,254 @@
+from App.database import db
+from datetime import datetime, timedelta
+from sqlalchemy.orm import selectinload
+
+from .Schedule import Schedule
+
+DAY_SECONDS = 24 * 3600
+
+
+class ServiceCalendar(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # One character per weekday, Monday first, e.g. "1111100" for weekdays only
+    days = db.Column(db.String(7), nullable=False, default="1111111")
+    start_date = db.Column(db.Date, nullable=True)
+    end_date = db.Column(db.Date, nullable=True)
+
+    def __init__(self, name, days="1111111", start_date=None, end_date=None):
+        if len(days) != 7 or set(days) - {"0", "1"}:
+            raise ValueError(f"Invalid service days '{days}', expected 7 characters of 0/1")
+        self.name = name
+        self.days = days
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def runs_on(self, day):
+        """Check whether the service operates on the given date"""
+        if self.start_date and day < self.start_date:
+            return False
+        if self.end_date and day > self.end_date:
+            return False
+        return self.days[day.weekday()] == "1"
+
+    def get_json(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'days': self.days,
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None
+        }
+
+
+class TripPattern(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False)
+    calendar_id = db.Column(db.Integer, db.ForeignKey('service_calendar.id'), nullable=False)
+
+    route = db.relationship('Route', back_populates='patterns')
+    calendar = db.relationship('ServiceCalendar')
+    stops = db.relationship('PatternStop', back_populates='pattern', order_by='PatternStop.stop_index',
+                            cascade='all, delete-orphan')
+    frequencies = db.relationship('FrequencyBlock', back_populates='pattern', order_by='FrequencyBlock.start_time',
+                                  cascade='all, delete-orphan')
+
+    def __init__(self, name, route, calendar):
+        self.name = name
+        self.route = route
+        self.calendar = calendar
+
+    def add_stop(self, route_stop, arrival_offset, departure_offset=None):
+        """Add a stop to the trip template, offsets are seconds after the trip starts"""
+        stop = PatternStop(route_stop.stop_index, route_stop.location, arrival_offset,
+                           departure_offset if departure_offset is not None else arrival_offset)
+        self.stops.append(stop)
+        return stop
+
+    def add_frequency(self, start_time, end_time=None, headway=0):
+        """Run the trip from start_time until end_time every headway seconds (times are seconds after midnight)"""
+        block = FrequencyBlock(start_time, end_time if end_time is not None else start_time, headway)
+        self.frequencies.append(block)
+        return block
+
+    def trip_starts(self, day, earliest, latest):
+        """Yield trip start datetimes on the given service day that fall within [earliest, latest]"""
+        midnight = datetime.combine(day, datetime.min.time())
+        low = (earliest - midnight).total_seconds()
+        high = (latest - midnight).total_seconds()
+        for block in self.frequencies:
+            for seconds in block.starts_between(low, high):
+                yield midnight + timedelta(seconds=seconds)
+
+    def expand(self, location_id, start, end):
+        """
+        Lazily expand the pattern into concrete stop times at a location between start and end.
+        Only the trips that can reach the location inside the window are generated.
+        """
+        for stop in self.stops:
+            if stop.location_id != location_id:
+                continue
+            # Trips that started on the previous day can still be running after midnight
+            day = (start - timedelta(seconds=stop.departure_offset)).date()
+            while day <= end.date():
+                if self.calendar.runs_on(day):
+                    earliest = start - timedelta(seconds=stop.departure_offset)
+                    latest = end - timedelta(seconds=stop.arrival_offset)
+                    for trip_start in self.trip_starts(day, earliest, latest):
+                        yield ScheduledStop(self.route_id, location_id,
+                                            trip_start + timedelta(seconds=stop.arrival_offset),
+                                            trip_start + timedelta(seconds=stop.departure_offset),
+                                            pattern_id=self.id)
+                day += timedelta(days=1)
+
+    def get_json(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'route_id': self.route_id,
+            'calendar': self.calendar.get_json() if self.calendar else None,
+            'stops': [stop.get_json() for stop in self.stops],
+            'frequencies': [block.get_json() for block in self.frequencies]
+        }
+
+
+class PatternStop(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pattern_id = db.Column(db.Integer, db.ForeignKey('trip_pattern.id'), nullable=False)
+    stop_index = db.Column(db.Integer, nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)
+    arrival_offset = db.Column(db.Integer, nullable=False)
+    departure_offset = db.Column(db.Integer, nullable=False)
+
+    pattern = db.relationship('TripPattern', back_populates='stops')
+    location = db.relationship('Location')
+
+    def __init__(self, stop_index, location, arrival_offset, departure_offset):
+        if departure_offset < arrival_offset:
+            raise ValueError("Departure offset cannot be before arrival offset")
+        self.stop_index = stop_index
+        self.location = location
+        self.arrival_offset = arrival_offset
+        self.departure_offset = departure_offset
+
+    def get_json(self):
+        return {
+            'id': self.id,
+            'stop_index': self.stop_index,
+            'location_id': self.location_id,
+            'arrival_offset': self.arrival_offset,
+            'departure_offset': self.departure_offset
+        }
+
+
+class FrequencyBlock(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pattern_id = db.Column(db.Integer, db.ForeignKey('trip_pattern.id'), nullable=False)
+    start_time = db.Column(db.Integer, nullable=False)
+    end_time = db.Column(db.Integer, nullable=False)
+    headway = db.Column(db.Integer, nullable=False, default=0)
+
+    pattern = db.relationship('TripPattern', back_populates='frequencies')
+
+    def __init__(self, start_time, end_time, headway=0):
+        if not 0 <= start_time <= end_time < DAY_SECONDS:
+            raise ValueError("Frequency block times must be seconds after midnight and end after they start")
+        if headway < 0 or (headway == 0 and end_time != start_time):
+            raise ValueError("A frequency block spanning a period needs a positive headway")
+        self.start_time = start_time
+        self.end_time = end_time
+        self.headway = headway
+
+    def starts_between(self, low, high):
+        """Yield trip start offsets (seconds after midnight) inside [low, high] without walking the whole block"""
+        first = max(low, self.start_time)
+        last = min(high, self.end_time)
+        if first > last:
+            return
+        if not self.headway:
+            yield self.start_time
+            return
+        steps = -(-(first - self.start_time) // self.headway)
+        seconds = self.start_time + int(steps) * self.headway
+        while seconds <= last:
+            yield seconds
+            seconds += self.headway
+
+    def get_json(self):
+        return {
+            'id': self.id,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'headway': self.headway
+        }
+
+
+class ScheduledStop:
+    """A concrete stop time expanded from a trip pattern, shaped like a Schedule row"""
+    __slots__ = ('id', 'route_id', 'stop_id', 'arrivalTime', 'departureTime', 'pattern_id')
+
+    def __init__(self, route_id, stop_id, arrivalTime, departureTime, pattern_id=None):
+        self.id = None
+        self.route_id = route_id
+        self.stop_id = stop_id
+        self.arrivalTime = arrivalTime
+        self.departureTime = departureTime
+        self.pattern_id = pattern_id
+
+    def get_json(self):
+        return {
+            'route_id': self.route_id,
+            'stop_id': self.stop_id,
+            'pattern_id': self.pattern_id,
+            'arrivalTime': self.arrivalTime.isoformat(),
+            'departureTime': self.departureTime.isoformat()
+        }
+
+
+def patterns_serving(route_id, location_id):
+    """Trip patterns of a route that call at a location, with their calendar and frequencies loaded up front"""
+    return TripPattern.query.options(
+        selectinload(TripPattern.calendar),
+        selectinload(TripPattern.stops),
+        selectinload(TripPattern.frequencies)
+    ).join(PatternStop).filter(
+        TripPattern.route_id == route_id,
+        PatternStop.location_id == location_id
+    ).distinct().all()
+
+
+def get_stop_times(route_id, location_id, start, end):
+    """All scheduled stop times of a route at a location between start and end, ordered by arrival"""
+    patterns = patterns_serving(route_id, location_id)
+    if patterns:
+        times = [t for pattern in patterns for t in pattern.expand(location_id, start, end)]
+        times.sort(key=lambda t: t.arrivalTime)
+        return times
+
+    return Schedule.query.filter(
+        Schedule.route_id == route_id,
+        Schedule.stop_id == location_id,
+        Schedule.arrivalTime >= start,
+        Schedule.arrivalTime <= end
+    ).order_by(Schedule.arrivalTime).all()
+
+
+def find_schedule(route_id, location_id, near=None):
+    """
+    Schedule adapter: the stop time of a route at a location closest to `near`.
+    Routes with trip patterns are expanded lazily around `near`, other routes read their Schedule row.
+    """
+    near = near or datetime.utcnow()
+    patterns = patterns_serving(route_id, location_id)
+    if not patterns:
+        return Schedule.query.filter(Schedule.route_id == route_id, Schedule.stop_id == location_id).first()
+
+    start = near - timedelta(seconds=DAY_SECONDS // 2)
+    end = near + timedelta(seconds=DAY_SECONDS // 2)
+    closest = None
+    for pattern in patterns:
+        for stop_time in pattern.expand(location_id, start, end):
+            if closest is None or abs(stop_time.arrivalTime - near) < abs(closest.arrivalTime - near):
+                closest = stop_time
+    return closest
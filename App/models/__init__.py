@@ -8,4 +8,8 @@ from .JourneyEvent import JourneyEvent
 from .BoardEvent import BoardEvent, BoardType
 from .Journey import Journey
 from .Schedule import Schedule
-from .RouteStop import RouteStop
\ No newline at end of file
+from .RouteStop import RouteStop
+from .ServicePattern import ServiceCalendar, TripPattern, PatternStop, FrequencyBlock, ScheduledStop
+from .RouteSegment import RouteSegment, RouteGeometry
+from .DataVersion import DataVersion
+from .ChangeFeed import ChangeFeed
@@ -0,0 +1,204 @@
+from App.config import config
+from App.metrics import metrics, ORS_SECONDS, ORS_ERRORS, ORS_BATCH_REQUESTS
+from App.tracing import span
+from contextlib import contextmanager
+import threading
+import time
+
+# Seconds matrix requests wait for others to share their call, and the most
+# sources x destinations cells OpenRouteService answers in one matrix call
+BATCH_WINDOW = 0.02
+MAX_MATRIX_CELLS = 3500
+# Seconds the client waits for OpenRouteService to answer
+TIMEOUT = 60
+
+# openrouteservice (and requests behind it) is imported on the first call, not at startup
+_clients = {}
+
+def offline():
+    """Whether ROUTING_ENGINE is 'offline': routes come from the local road graph instead of OpenRouteService"""
+    return config.get('ROUTING_ENGINE', 'ors') == 'offline'
+
+def available(key=None):
+    """Whether routing calls can be made: the offline engine is on, or there is an API key"""
+    return offline() or bool(key or config.get('OPENROUTE_SERVICE_KEY', ''))
+
+def get_client(key=None):
+    """
+    openrouteservice client for the given or configured API key, or None without a key.
+    With the offline engine, its router, which answers the same calls.
+    """
+    if offline():
+        from App.routing import get_router
+        return get_router()
+    key = key or config.get('OPENROUTE_SERVICE_KEY', '')
+    if not key:
+        return None
+    client = _clients.get(key)
+    if client is None:
+        import openrouteservice
+        client = _clients[key] = openrouteservice.Client(key=key, timeout=config.get('ORS_TIMEOUT', TIMEOUT))
+    return client
+
+def api_error():
+    """The errors of routing calls (openrouteservice ApiError and RoutingError), for use in except clauses"""
+    from App.routing import RoutingError
+    try:
+        from openrouteservice.exceptions import ApiError
+    except ImportError:
+        return RoutingError
+    return (ApiError, RoutingError)
+
+@contextmanager
+def _timed(operation, **tags):
+    """Record the latency of an openrouteservice call, and count it when it fails"""
+    started = time.perf_counter()
+    try:
+        with span(f'ors.{operation}', 'CLIENT', **tags):
+            yield
+    except Exception:
+        metrics.inc(ORS_ERRORS, operation=operation)
+        raise
+    finally:
+        metrics.observe(ORS_SECONDS, time.perf_counter() - started, operation=operation)
+
+def directions(coordinates, key=None):
+    """Driving directions GeoJSON through [[lng, lat], ...] in the given order"""
+    client = get_client(key)
+    with _timed('directions'):
+        return client.directions(
+            coordinates=coordinates,
+            profile='driving-car',
+            format='geojson',
+            optimize_waypoints=False,
+            preference='recommended'
+        )
+
+def distance_matrix(locations, key=None):
+    """Driving distance (meters) and duration (seconds) matrices between [[lng, lat], ...]"""
+    client = get_client(key)
+    with _timed('distance_matrix'):
+        return client.distance_matrix(
+            locations=locations,
+            profile='driving-car',
+            metrics=['distance', 'duration'],
+            units='m'
+        )
+
+
+class _MatrixBatch:
+    """
+    Matrix rows requested while a batch window is open, merged into one call: the union of
+    their sources by the union of their destinations, each location sent once.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.locations = []
+        self._positions = {}
+        self.sources = {}
+        self.destinations = {}
+        self.requests = []
+        # A greenlet primitive once gevent has patched threading
+        self.done = threading.Event()
+        self.matrix = None
+        self.error = None
+
+    def fits(self, source, destinations, max_cells):
+        """Whether adding the row keeps the call within max_cells (a lone row always fits)"""
+        if not self.requests:
+            return True
+        sources = len(self.sources) + (tuple(source) not in self.sources)
+        new = {tuple(location) for location in destinations} - self.destinations.keys()
+        return sources * (len(self.destinations) + len(new)) <= max_cells
+
+    def _position(self, location):
+        location = tuple(location)
+        position = self._positions.get(location)
+        if position is None:
+            position = self._positions[location] = len(self.locations)
+            self.locations.append(list(location))
+        return position
+
+    def add(self, source, destinations):
+        """Add a row, returns its index in requests"""
+        for location, axis in [(source, self.sources)] + [(location, self.destinations) for location in destinations]:
+            axis.setdefault(tuple(location), self._position(location))
+        self.requests.append((tuple(source), [tuple(location) for location in destinations]))
+        return len(self.requests) - 1
+
+    def run(self):
+        sources, destinations = list(self.sources.values()), list(self.destinations.values())
+        metrics.observe(ORS_BATCH_REQUESTS, len(self.requests))
+        try:
+            with _timed('distance_matrix', requests=len(self.requests), cells=len(sources) * len(destinations)):
+                self.matrix = get_client(self.key).distance_matrix(
+                    locations=self.locations,
+                    sources=sources,
+                    destinations=destinations,
+                    profile='driving-car',
+                    metrics=['distance', 'duration'],
+                    units='m'
+                )
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def row(self, index):
+        if self.error is not None:
+            raise self.error
+        source, destinations = self.requests[index]
+        # Rows and columns of the answer follow the order sources and destinations were sent in
+        row = {location: i for i, location in enumerate(self.sources)}[source]
+        columns = {location: i for i, location in enumerate(self.destinations)}
+        picked = [columns[location] for location in destinations]
+        return {name: [self.matrix[name][row][column] for column in picked] for name in ('distances', 'durations')}
+
+
+# The batch of each API key still taking rows
+_batches = {}
+_batches_lock = threading.Lock()
+
+def matrix_row(source, destinations, key=None):
+    """
+    Driving distances (meters) and durations (seconds) from source to each of destinations,
+    as {'distances': [...], 'durations': [...]}. Rows requested within ORS_BATCH_WINDOW
+    seconds of each other share one OpenRouteService call of at most ORS_MATRIX_MAX_CELLS.
+    Rows whose shared call has not answered within ORS_TIMEOUT raise one of api_error().
+    """
+    if offline():
+        # Nothing to save by batching a local search, one per source either way
+        client = get_client()
+        with _timed('distance_matrix', engine='offline'):
+            matrix = client.distance_matrix([source] + list(destinations), sources=[0],
+                                            destinations=list(range(1, len(destinations) + 1)))
+        return {'distances': matrix['distances'][0], 'durations': matrix['durations'][0]}
+    key = key or config.get('OPENROUTE_SERVICE_KEY', '')
+    window = config.get('ORS_BATCH_WINDOW', BATCH_WINDOW)
+    max_cells = config.get('ORS_MATRIX_MAX_CELLS', MAX_MATRIX_CELLS)
+    with _batches_lock:
+        batch = _batches.get(key)
+        if batch is not None and not batch.fits(source, destinations, max_cells):
+            # Full: its first caller still sends it when its window ends, this row starts the next
+            del _batches[key]
+            batch = None
+        first = batch is None
+        if first:
+            batch = _batches[key] = _MatrixBatch(key)
+        index = batch.add(source, destinations)
+
+    if first:
+        # The first caller waits out the window for others to join, then calls for everyone
+        if window:
+            time.sleep(window)
+        with _batches_lock:
+            if _batches.get(key) is batch:
+                del _batches[key]
+        batch.run()
+    elif not batch.done.wait(config.get('ORS_TIMEOUT', TIMEOUT) + window):
+        # The caller sending the batch died or hangs, callers fall back as for any failed call
+        from App.routing import RoutingError
+        metrics.inc(ORS_ERRORS, operation='distance_matrix')
+        raise RoutingError("No answer to the shared matrix call")
+    return batch.row(index)
@@ -0,0 +1,171 @@
+from App.config import config
+from App.log import get_logger
+from collections import Counter
+from datetime import datetime
+import os
+import sys
+import threading
+import time
+
+log = get_logger(__name__)
+
+# Seconds between samples of a worker-wide profile, and of a single profiled request
+INTERVAL = 0.005
+REQUEST_INTERVAL = 0.001
+MIN_INTERVAL = 0.001
+MAX_SECONDS = 120
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _original(module, name):
+    """The unpatched threading primitive, so the sampler keeps running while gevent greenlets do"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched(module):
+            return monkey.get_original(module, name)
+    except ImportError:
+        pass
+    return getattr(__import__(module), name)
+
+def frame_name(frame):
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_root):
+        filename = os.path.relpath(filename, _root)
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+
+def collapse(frame):
+    """The stack of `frame`, outermost first, in the collapsed format flamegraph tools read"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """
+    Samples the Python stacks of this process every `interval` seconds from a background
+    thread and counts identical stacks. Only `thread_id` is sampled when given, and only
+    `greenlet` on it when given (greenlets share their thread). `on_stop(sampler)` is called
+    from the sampling thread once it stops.
+    """
+
+    def __init__(self, interval=INTERVAL, thread_id=None, on_stop=None, greenlet=None):
+        # A shorter interval would keep the sampling thread spinning on a whole CPU
+        self.interval = max(interval, MIN_INTERVAL)
+        self.thread_id = thread_id
+        self.greenlet = greenlet
+        self.on_stop = on_stop
+        self.path = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        # Plain flags rather than threading.Event, which gevent patches into a greenlet primitive
+        self._stopping = False
+        self._ident = None
+
+    def _sample(self):
+        frames = sys._current_frames()
+        if self.greenlet is not None:
+            # A switched out greenlet keeps its frame, the running one is the thread's current frame
+            frame = self.greenlet.gr_frame
+            if frame is None and not self.greenlet.dead:
+                frame = frames.get(self.thread_id)
+            frames = {self.thread_id: frame} if frame is not None else {}
+        elif self.thread_id is not None:
+            frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+        for ident, frame in frames.items():
+            if ident != self._ident:
+                self.stacks[collapse(frame)] += 1
+        self.samples += 1
+
+    def _run(self, seconds):
+        self._ident = _original('threading', 'get_ident')()
+        sleep = _original('time', 'sleep')
+        deadline = time.monotonic() + seconds if seconds is not None else None
+        # At least one sample, even for a request that finished before the thread started
+        self._sample()
+        while not self._stopping and (deadline is None or time.monotonic() < deadline):
+            sleep(self.interval)
+            self._sample()
+        if self.on_stop:
+            try:
+                self.on_stop(self)
+            except Exception:
+                log.exception("Error finishing profile")
+        self.stopped = datetime.utcnow()
+
+    def start(self, seconds=None):
+        self.started = datetime.utcnow()
+        _original('_thread', 'start_new_thread')(self._run, (seconds,))
+        return self
+
+    def stop(self):
+        """Stop sampling and wait for the sampling thread to finish its last sample"""
+        self._stopping = True
+        sleep = _original('time', 'sleep')
+        deadline = time.monotonic() + 1
+        while self.stopped is None and time.monotonic() < deadline:
+            sleep(self.interval / 2)
+        return self
+
+    @property
+    def running(self):
+        return self.started is not None and self.stopped is None
+
+    def collapsed(self):
+        """'stack count' lines, most sampled first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{os.getpid()}-{self.started:%Y%m%dT%H%M%S}.folded")
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        return path
+
+
+# The worker-wide profile of this process, running or last finished
+_current = None
+_lock = threading.Lock()
+
+def start_profile(seconds, interval=INTERVAL):
+    """Start sampling this worker for `seconds`, or None when a profile is already running"""
+    global _current
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"A worker profile lasts more than 0 and at most {MAX_SECONDS} seconds")
+    with _lock:
+        if _current is not None and _current.running:
+            return None
+        _current = Sampler(interval, on_stop=save_profile).start(seconds)
+    log.info("Profiling started", seconds=seconds, interval=interval)
+    return _current
+
+def current_profile():
+    return _current
+
+def save_profile(sampler):
+    """Keep a finished profile in PROFILE_DIR, when configured"""
+    directory = config.get('PROFILE_DIR')
+    if directory:
+        sampler.path = sampler.save(directory)
+        log.info("Profile saved", path=sampler.path, samples=sampler.samples)
+
+
+def _request_greenlet():
+    """The current greenlet when gevent runs requests as greenlets sharing a thread, otherwise None"""
+    try:
+        from gevent import getcurrent, monkey
+    except ImportError:
+        return None
+    return getcurrent() if monkey.is_module_patched('threading') else None
+
+def start_request_profile():
+    """
+    Sample only the thread (or under gevent, the greenlet) handling the current request, more
+    often than a worker profile, until stopped
+    """
+    return Sampler(REQUEST_INTERVAL, _original('threading', 'get_ident')(), greenlet=_request_greenlet()).start()
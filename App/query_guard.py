@@ -0,0 +1,130 @@
+from App.config import config
+from App.log import get_logger
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import re
+import time
+
+log = get_logger(__name__)
+
+# Identical statement shapes run at least this many times in one request are N+1 candidates
+REPEAT_THRESHOLD = 5
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r"\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,?)+\)", re.IGNORECASE)
+_parameters = re.compile(r"%\(\w+\)s|:\w+|\$\d+")
+_whitespace = re.compile(r"\s+")
+
+# Active logs, innermost last: a request's log nests inside a test's or a benchmark's
+_current = ContextVar('query_logs', default=())
+
+
+def statement_shape(statement):
+    """A statement with its literals and parameters replaced by ?, so repeated queries compare equal"""
+    shape = _literals.sub('?', statement)
+    shape = _parameters.sub('?', shape)
+    shape = _in_lists.sub('IN (?)', shape)
+    return _whitespace.sub(' ', shape).strip()
+
+
+class QueryLog:
+    """Statements executed while a log is active, with their total time and shapes"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        self.statements.append(statement)
+
+    def repeated(self, threshold=None):
+        """[(shape, count)] of shapes run at least `threshold` times, most repeated first"""
+        threshold = threshold or config.get('QUERY_REPEAT_THRESHOLD', REPEAT_THRESHOLD)
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    logs = _current.get()
+    if not logs:
+        return
+    started = conn.info.get('query_started')
+    seconds = time.perf_counter() - started.pop() if started else 0.0
+    for log in logs:
+        log.record(statement, seconds)
+
+def listen():
+    """Count the statements of every engine, primary and replicas alike"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@contextmanager
+def track_queries():
+    """Collect the statements executed inside the block into a QueryLog"""
+    listen()
+    log = QueryLog()
+    token = _current.set(_current.get() + (log,))
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def assert_max_queries(budget, repeat_threshold=None):
+    """
+    Fail when the block executes more than `budget` statements, or (with `repeat_threshold`)
+    runs any statement shape that many times
+    """
+    with track_queries() as log:
+        yield log
+    if log.count > budget:
+        listing = '\n'.join(f"  {count}x {shape}" for shape, count in log.shapes.most_common())
+        raise AssertionError(f"{log.count} queries executed, budget is {budget}:\n{listing}")
+    if repeat_threshold:
+        repeated = log.repeated(repeat_threshold)
+        if repeated:
+            raise AssertionError(f"N+1 candidate, {repeated[0][1]}x {repeated[0][0]}")
+
+
+def _start_request():
+    g.query_log = QueryLog()
+    g.query_log_token = _current.set(_current.get() + (g.query_log,))
+
+def _finish_request(response):
+    query_log = g.get('query_log')
+    if query_log is None:
+        return response
+    for shape, count in query_log.repeated():
+        log.warning("N+1 candidate on %s %s: %dx %s", request.method, request.path, count, shape)
+    response.headers.add('Server-Timing', f'db;dur={query_log.seconds * 1000:.1f};desc="{query_log.count} queries"')
+    return response
+
+def _teardown_request(error=None):
+    # The log stays on g until teardown so other after_request hooks (metrics) can read it
+    g.pop('query_log', None)
+    token = g.pop('query_log_token', None)
+    if token is not None:
+        _current.reset(token)
+
+def setup_query_guard(app):
+    """Count and time the statements of each request, and report repeated statement shapes"""
+    if not app.config.get('QUERY_GUARD_ENABLED', True):
+        return
+    listen()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,176 @@
+from App.database import db, replica_bind, get_replica_engines
+from App.models import DataVersion
+from App.config import config
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import Session
+from functools import wraps
+import itertools
+import threading
+import time
+
+# Cookie that keeps a client on the primary for a while after it wrote, so it reads its own writes
+PIN_COOKIE = 'db_pin'
+# Seconds a request waits for the first lag measurement of a replica
+PROBE_TIMEOUT = 1.0
+
+_lock = threading.Lock()
+_status = {}
+# Threads measuring the lag of a replica, by bind key
+_probes = {}
+_round_robin = itertools.count()
+
+
+def replica_keys():
+    return sorted(get_replica_engines(), key=lambda key: int(key.split('_')[1]))
+
+def _version_total(connection):
+    return connection.execute(select(func.coalesce(func.sum(DataVersion.version), 0))).scalar()
+
+def measure_lag(key):
+    """
+    How far a replica is behind the primary: the data version changes it has not replayed yet,
+    and on Postgres the seconds since the last transaction it replayed
+    """
+    lag = {'bind': key, 'reachable': True, 'versions_behind': None, 'seconds': None, 'checked': time.time()}
+    try:
+        with db.engine.connect() as primary:
+            primary_total = _version_total(primary)
+        with get_replica_engines()[key].connect() as replica:
+            lag['versions_behind'] = max(primary_total - _version_total(replica), 0)
+            if replica.dialect.name == 'postgresql' and lag['versions_behind']:
+                lag['seconds'] = replica.execute(text(
+                    "SELECT CASE WHEN pg_is_in_recovery() "
+                    "THEN extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END")).scalar()
+            elif not lag['versions_behind']:
+                lag['seconds'] = 0.0
+    except Exception as e:
+        lag.update(reachable=False, error=str(e))
+    return lag
+
+def _probe(app, key):
+    try:
+        with app.app_context():
+            status = measure_lag(key)
+        with _lock:
+            _status[key] = status
+    finally:
+        with _lock:
+            _probes.pop(key, None)
+
+def _start_probe(key):
+    """The thread measuring the lag of a replica, started unless one is already running"""
+    with _lock:
+        thread = _probes.get(key)
+        if thread is not None:
+            return thread
+        thread = _probes[key] = threading.Thread(target=_probe, args=(current_app._get_current_object(), key),
+                                                 daemon=True, name=f'replica-lag-{key}')
+    thread.start()
+    return thread
+
+def replica_status(refresh=False):
+    """
+    Lag of every replica, measured at most once per REPLICA_CHECK_INTERVAL seconds. Measurements
+    run in the background so an unreachable replica never holds up a request: requests get the
+    last one, and only wait (up to REPLICA_PROBE_TIMEOUT) for a replica's first. `refresh`
+    measures in the caller.
+    """
+    interval = config.get('REPLICA_CHECK_INTERVAL', 5)
+    statuses = []
+    for key in replica_keys():
+        with _lock:
+            status = _status.get(key)
+        if refresh:
+            status = measure_lag(key)
+            with _lock:
+                _status[key] = status
+        elif status is None or time.time() - status['checked'] >= interval:
+            thread = _start_probe(key)
+            if status is None:
+                thread.join(config.get('REPLICA_PROBE_TIMEOUT', PROBE_TIMEOUT))
+                with _lock:
+                    status = _status.get(key)
+            if status is None:
+                status = {'bind': key, 'reachable': False, 'versions_behind': None, 'seconds': None,
+                          'checked': None, 'error': "Lag not measured yet"}
+        statuses.append(status)
+    return statuses
+
+def healthy(status):
+    if not status['reachable']:
+        return False
+    max_versions = config.get('REPLICA_MAX_VERSIONS_BEHIND')
+    if max_versions is not None and status['versions_behind'] > max_versions:
+        return False
+    seconds = status['seconds']
+    return seconds is None or seconds <= config.get('REPLICA_MAX_LAG_SECONDS', 30)
+
+def choose_replica():
+    """Bind key of a healthy replica, rotating between them, or None to read from the primary"""
+    candidates = [status['bind'] for status in replica_status() if healthy(status)]
+    if not candidates:
+        return None
+    return candidates[next(_round_robin) % len(candidates)]
+
+def reset_replica_status():
+    with _lock:
+        _status.clear()
+
+
+def pinned():
+    """Whether the current request must read from the primary to see its own client's writes"""
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    try:
+        return float(request.cookies.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def read_only(function):
+    """
+    Mark a view or controller as read-only so its queries go to a replica. Stays on the
+    primary when no replica is healthy, the client wrote recently, or the session holds
+    uncommitted writes.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if replica_bind.get() is not None or pinned():
+            return function(*args, **kwargs)
+        key = choose_replica()
+        if key is None:
+            return function(*args, **kwargs)
+        token = replica_bind.set(key)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            replica_bind.reset(token)
+    return wrapper
+
+
+def _after_flush(session, flush_context):
+    session.info['wrote'] = True
+
+def _after_commit(session):
+    if session.info.pop('wrote', None) and has_request_context():
+        g.db_wrote = True
+
+def _after_rollback(session):
+    session.info.pop('wrote', None)
+
+def pin_writers(response):
+    if g.pop('db_wrote', False):
+        seconds = config.get('REPLICA_PIN_SECONDS', 10)
+        response.set_cookie(PIN_COOKIE, str(int(time.time() + seconds)), max_age=seconds,
+                            httponly=True, samesite='Lax')
+    return response
+
+def setup_replicas(app):
+    """Track writes for read-your-writes pinning"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+    app.after_request(pin_writers)
@@ -0,0 +1,425 @@
+from App.config import config
+from App.log import get_logger
+from array import array
+from heapq import heappush, heappop
+from math import asin, cos, inf, radians, sin, sqrt
+import csv
+import os
+import pickle
+import random
+import threading
+import time
+
+log = get_logger(__name__)
+
+# Landmarks whose distances bound the remaining travel time of A* searches (ALT)
+LANDMARKS = 8
+# Landmarks consulted per query, the ones giving the tightest bound between its endpoints
+ACTIVE_LANDMARKS = 4
+# Meters a coordinate may be from the nearest road node, like the OpenRouteService default
+SNAP_RADIUS = 350
+# km/h by OSM highway class when an edge has no speed of its own
+SPEEDS = {
+    'motorway': 100, 'motorway_link': 60, 'trunk': 85, 'trunk_link': 50, 'primary': 65,
+    'primary_link': 50, 'secondary': 60, 'secondary_link': 50, 'tertiary': 50, 'tertiary_link': 40,
+    'unclassified': 30, 'residential': 30, 'living_street': 10, 'service': 20, 'road': 30
+}
+DEFAULT_SPEED = 30
+ENGINE = 'nextstop-offline'
+
+
+class RoutingError(Exception):
+    """A query the road graph cannot answer: a point off the network or no road between points"""
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """Great circle distance in meters"""
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371000 * asin(sqrt(a))
+
+
+def _dijkstra(first, head, weight, source):
+    """Travel times from source to every node over a CSR adjacency"""
+    times = array('d', [inf]) * (len(first) - 1)
+    times[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        elapsed, node = heappop(heap)
+        if elapsed > times[node]:
+            continue
+        for arc in range(first[node], first[node + 1]):
+            other = head[arc]
+            candidate = elapsed + weight[arc]
+            if candidate < times[other]:
+                times[other] = candidate
+                heappush(heap, (candidate, other))
+    return times
+
+def _csr(count, arcs):
+    """Compressed adjacency of (tail, head, seconds, meters) arcs: arcs of node v are first[v]:first[v + 1]"""
+    arcs = sorted(arcs)
+    first = array('l', [0]) * (count + 1)
+    for tail, _, _, _ in arcs:
+        first[tail + 1] += 1
+    for node in range(count):
+        first[node + 1] += first[node]
+    return (first, array('l', (arc[1] for arc in arcs)),
+            array('f', (arc[2] for arc in arcs)), array('f', (arc[3] for arc in arcs)))
+
+
+class RoadGraph:
+    """
+    A directed road network in flat arrays: node coordinates, forward and reverse adjacency
+    with travel seconds and meters per arc, and travel times from and to a few landmarks for
+    ALT, A* whose lower bounds come from the triangle inequality over the landmarks.
+    """
+
+    def __init__(self, lats, lngs, arcs):
+        self.lats = array('d', lats)
+        self.lngs = array('d', lngs)
+        count = len(self.lats)
+        self.first, self.head, self.seconds, self.meters = _csr(count, arcs)
+        self.reverse_first, self.reverse_head, self.reverse_seconds, _ = _csr(
+            count, ((head, tail, seconds, meters) for tail, head, seconds, meters in arcs))
+        self.landmarks = []
+        self.from_landmark = []
+        self.to_landmark = []
+        self._grid = None
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Build from (from_lng, from_lat, to_lng, to_lat, meters, seconds, oneway) road edges"""
+        nodes, lats, lngs, arcs = {}, [], [], []
+        def node(lng, lat):
+            key = (round(lng, 7), round(lat, 7))
+            number = nodes.get(key)
+            if number is None:
+                number = nodes[key] = len(lats)
+                lats.append(lat)
+                lngs.append(lng)
+            return number
+        for from_lng, from_lat, to_lng, to_lat, meters, seconds, oneway in edges:
+            tail, head = node(from_lng, from_lat), node(to_lng, to_lat)
+            if tail == head:
+                continue
+            arcs.append((tail, head, seconds, meters))
+            if not oneway:
+                arcs.append((head, tail, seconds, meters))
+        return cls(lats, lngs, arcs)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def prepare(self, landmarks=LANDMARKS, seed=0):
+        """Pick landmarks far apart (each the node farthest from those already picked) and store their travel times"""
+        count = len(self)
+        self.landmarks, self.from_landmark, self.to_landmark = [], [], []
+        if not count:
+            return self
+        nearest = array('d', [inf]) * count
+        node = random.Random(seed).randrange(count)
+        for _ in range(min(landmarks, count)):
+            forward = _dijkstra(self.first, self.head, self.seconds, node)
+            backward = _dijkstra(self.reverse_first, self.reverse_head, self.reverse_seconds, node)
+            self.landmarks.append(node)
+            # Doubles: rounded to float32 a bound can exceed the real time and ALT stops being exact
+            self.from_landmark.append(forward)
+            self.to_landmark.append(backward)
+            for other in range(count):
+                # Unreachable nodes count as close, so landmarks stay in the connected part
+                away = forward[other] + backward[other]
+                nearest[other] = min(nearest[other], away if away < inf else 0.0)
+            node = max(range(count), key=nearest.__getitem__)
+        return self
+
+    def _bound(self, source, target):
+        """Lower bound of the seconds from a node to target, over the landmarks tightest between source and target"""
+        def pair_bound(forward, backward, node):
+            # d(L, t) - d(L, v) <= d(v, t) and d(v, L) - d(t, L) <= d(v, t)
+            best = 0.0
+            if forward[target] < inf and forward[node] < inf:
+                best = max(best, forward[target] - forward[node])
+            if backward[target] < inf and backward[node] < inf:
+                best = max(best, backward[node] - backward[target])
+            return best
+
+        pairs = sorted(zip(self.from_landmark, self.to_landmark),
+                       key=lambda pair: pair_bound(pair[0], pair[1], source), reverse=True)[:ACTIVE_LANDMARKS]
+        return lambda node: max(pair_bound(forward, backward, node) for forward, backward in pairs)
+
+    def route(self, source, target, landmarks=True):
+        """(seconds, meters, nodes) of the fastest path from source to target, or None"""
+        bound = self._bound(source, target) if landmarks and self.landmarks else (lambda node: 0.0)
+        times = {source: 0.0}
+        meters = {source: 0.0}
+        parents = {source: None}
+        settled = set()
+        heap = [(bound(source), source)]
+        while heap:
+            _, node = heappop(heap)
+            if node in settled:
+                continue
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return times[target], meters[target], path[::-1]
+            settled.add(node)
+            elapsed = times[node]
+            for arc in range(self.first[node], self.first[node + 1]):
+                other = self.head[arc]
+                candidate = elapsed + self.seconds[arc]
+                if candidate < times.get(other, inf):
+                    times[other] = candidate
+                    meters[other] = meters[node] + self.meters[arc]
+                    parents[other] = node
+                    heappush(heap, (candidate + bound(other), other))
+        return None
+
+    def table(self, source, targets):
+        """[(seconds, meters) or None] from source to each of targets, one search stopping once all are reached"""
+        remaining = set(targets)
+        times, meters = {source: 0.0}, {source: 0.0}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap and remaining:
+            elapsed, node = heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            for arc in range(self.first[node], self.first[node + 1]):
+                other = self.head[arc]
+                candidate = elapsed + self.seconds[arc]
+                if candidate < times.get(other, inf):
+                    times[other] = candidate
+                    meters[other] = meters[node] + self.meters[arc]
+                    heappush(heap, (candidate, other))
+        return [(times[target], meters[target]) if target in settled else None for target in targets]
+
+    def snap(self, lng, lat, radius=SNAP_RADIUS):
+        """The road node nearest to a coordinate, None when there is none within radius meters"""
+        if self._grid is None or self._grid[0] != radius:
+            self._build_grid(radius)
+        _, cell_lat, cell_lng, cells = self._grid
+        row, col = int(lat // cell_lat), int(lng // cell_lng)
+        best, best_distance = None, radius
+        for r in (row - 1, row, row + 1):
+            for c in (col - 1, col, col + 1):
+                for node in cells.get((r, c), ()):
+                    meters = distance(lat, lng, self.lats[node], self.lngs[node])
+                    if meters <= best_distance:
+                        best, best_distance = node, meters
+        return best
+
+    def _build_grid(self, radius):
+        # Cells at least radius wide, so the nearest node within radius is in the 3x3 cells around a point
+        mean_lat = sum(self.lats) / len(self.lats) if len(self.lats) else 0.0
+        cell_lat = radius / 111320.0
+        cell_lng = radius / (111320.0 * max(cos(radians(mean_lat)), 0.01))
+        cells = {}
+        for node in range(len(self)):
+            cells.setdefault((int(self.lats[node] // cell_lat), int(self.lngs[node] // cell_lng)), []).append(node)
+        self._grid = (radius, cell_lat, cell_lng, {cell: array('l', nodes) for cell, nodes in cells.items()})
+
+    def save(self, path):
+        self._grid = None
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def _edge_seconds(meters, speed=None, highway=None):
+    speed = float(speed) if speed else SPEEDS.get(highway, DEFAULT_SPEED)
+    return meters / (speed / 3.6)
+
+def read_edge_list(path):
+    """
+    Road edges from a CSV with from_lng, from_lat, to_lng, to_lat columns and optionally
+    distance (meters), duration (seconds), speed (km/h), highway (OSM class) and oneway (1/0)
+    """
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            from_lng, from_lat = float(row['from_lng']), float(row['from_lat'])
+            to_lng, to_lat = float(row['to_lng']), float(row['to_lat'])
+            meters = float(row.get('distance') or distance(from_lat, from_lng, to_lat, to_lng))
+            seconds = float(row.get('duration') or _edge_seconds(meters, row.get('speed'), row.get('highway')))
+            yield from_lng, from_lat, to_lng, to_lat, meters, seconds, row.get('oneway', '0') in ('1', 'yes', 'true')
+
+def read_pbf(path):
+    """Drivable road edges of an OSM PBF extract, split at every way node (needs the osmium package)"""
+    import osmium
+
+    edges = []
+
+    class Roads(osmium.SimpleHandler):
+        def way(self, way):
+            highway = way.tags.get('highway')
+            if highway not in SPEEDS or way.tags.get('access') in ('no', 'private'):
+                return
+            oneway = way.tags.get('oneway') in ('yes', '1', 'true') or highway in ('motorway', 'motorway_link')
+            maxspeed = way.tags.get('maxspeed', '').split(' ')[0]
+            speed = float(maxspeed) if maxspeed.replace('.', '', 1).isdigit() else None
+            points = [(node.lon, node.lat) for node in way.nodes if node.location.valid()]
+            for (from_lng, from_lat), (to_lng, to_lat) in zip(points, points[1:]):
+                meters = distance(from_lat, from_lng, to_lat, to_lng)
+                edges.append((from_lng, from_lat, to_lng, to_lat, meters, _edge_seconds(meters, speed, highway), oneway))
+
+    Roads().apply_file(path, locations=True)
+    return edges
+
+def load_graph(path, landmarks=LANDMARKS):
+    """
+    The prepared road graph of an extract (.pbf or edge list .csv). Preparing a country takes a
+    while, so the result is kept next to the extract as <path>.prepared and reused until the
+    extract changes.
+    """
+    prepared = f'{path}.prepared'
+    if os.path.exists(prepared) and os.path.getmtime(prepared) >= os.path.getmtime(path):
+        graph = RoadGraph.load(prepared)
+        # Graphs prepared before landmark times were kept as doubles are prepared again
+        if len(graph.landmarks) == min(landmarks, len(graph)) and all(
+                times.typecode == 'd' for times in graph.from_landmark):
+            return graph
+    started = time.perf_counter()
+    edges = read_pbf(path) if path.endswith('.pbf') else read_edge_list(path)
+    graph = RoadGraph.from_edges(edges).prepare(landmarks)
+    try:
+        graph.save(prepared)
+    except OSError as e:
+        log.warning("Could not keep the prepared road graph: %s", e, path=prepared)
+    log.info("Prepared road graph", path=path, nodes=len(graph), arcs=len(graph.head),
+             seconds=round(time.perf_counter() - started, 1))
+    return graph
+
+
+class OfflineRouter:
+    """
+    Answers the openrouteservice client calls the app makes (directions and distance_matrix)
+    from a local road graph, in the same response shapes.
+    """
+
+    def __init__(self, graph, snap_radius=SNAP_RADIUS):
+        self.graph = graph
+        self.snap_radius = snap_radius
+
+    def _snap(self, coordinates):
+        nodes = []
+        for lng, lat in coordinates:
+            node = self.graph.snap(lng, lat, self.snap_radius)
+            if node is None:
+                raise RoutingError(f"No road within {self.snap_radius}m of {lng},{lat}")
+            nodes.append(node)
+        return nodes
+
+    def directions(self, coordinates, profile='driving-car', format='geojson', **options):
+        """Directions GeoJSON through coordinates, with a segment (distance, duration) per leg"""
+        nodes = self._snap(coordinates)
+        line, segments, way_points = [], [], [0]
+        for source, target in zip(nodes, nodes[1:]):
+            found = self.graph.route(source, target)
+            if found is None:
+                raise RoutingError(f"No road between {self.graph.lngs[source]},{self.graph.lats[source]} "
+                                   f"and {self.graph.lngs[target]},{self.graph.lats[target]}")
+            seconds, meters, path = found
+            points = [[round(self.graph.lngs[node], 6), round(self.graph.lats[node], 6)] for node in path]
+            line.extend(points[1:] if line else points)
+            way_points.append(len(line) - 1)
+            segments.append({'distance': round(meters, 1), 'duration': round(seconds, 1), 'steps': []})
+        lngs, lats = [point[0] for point in line], [point[1] for point in line]
+        bbox = [min(lngs), min(lats), max(lngs), max(lats)]
+        return {
+            'type': 'FeatureCollection',
+            'bbox': bbox,
+            'features': [{
+                'type': 'Feature',
+                'bbox': bbox,
+                'properties': {
+                    'segments': segments,
+                    'summary': {'distance': round(sum(leg['distance'] for leg in segments), 1),
+                                'duration': round(sum(leg['duration'] for leg in segments), 1)},
+                    'way_points': way_points
+                },
+                'geometry': {'type': 'LineString', 'coordinates': line}
+            }],
+            'metadata': {'engine': {'version': ENGINE}, 'query': {'coordinates': coordinates, 'profile': profile}}
+        }
+
+    def distance_matrix(self, locations, profile='driving-car', sources=None, destinations=None,
+                        metrics=None, units='m', **options):
+        """Meters and seconds from each source to each destination (indices into locations, all by default), None when unreachable"""
+        nodes = self._snap(locations)
+        sources = range(len(nodes)) if sources is None else sources
+        destinations = range(len(nodes)) if destinations is None else destinations
+        targets = [nodes[i] for i in destinations]
+        distances, durations = [], []
+        for i in sources:
+            row = self.graph.table(nodes[i], targets)
+            distances.append([round(cell[1], 2) if cell else None for cell in row])
+            durations.append([round(cell[0], 2) if cell else None for cell in row])
+        result = {'metadata': {'engine': {'version': ENGINE}}}
+        if not metrics or 'distance' in metrics:
+            result['distances'] = distances
+        if not metrics or 'duration' in metrics:
+            result['durations'] = durations
+        return result
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """The offline router over ROUTING_GRAPH, loaded on first use (before forking when preloaded)"""
+    global _router
+    path = config.get('ROUTING_GRAPH')
+    if not path:
+        raise RoutingError("ROUTING_GRAPH is not configured")
+    with _router_lock:
+        if _router is None or _router[0] != path:
+            graph = load_graph(path, config.get('ROUTING_LANDMARKS', LANDMARKS))
+            _router = (path, OfflineRouter(graph, config.get('ROUTING_SNAP_RADIUS', SNAP_RADIUS)))
+    return _router[1]
+
+
+def synthetic_road_graph(rows=100, cols=100, seed=0, spacing=0.002):
+    """A grid of streets with random speeds and some one-way and missing blocks, for tests and benchmarks"""
+    rng = random.Random(seed)
+    edges = []
+    for row in range(rows):
+        for col in range(cols):
+            lng, lat = -61.5 + col * spacing, 10.6 + row * spacing
+            for next_lng, next_lat in ((lng + spacing, lat), (lng, lat + spacing)):
+                if next_lng > -61.5 + (cols - 1) * spacing + 1e-9 or next_lat > 10.6 + (rows - 1) * spacing + 1e-9:
+                    continue
+                if rng.random() < 0.05:
+                    continue
+                meters = distance(lat, lng, next_lat, next_lng)
+                speed = rng.choice((20, 30, 30, 50, 65))
+                edges.append((lng, lat, next_lng, next_lat, meters, _edge_seconds(meters, speed), rng.random() < 0.1))
+    return RoadGraph.from_edges(edges)
+
+def benchmark_routing(rows=100, cols=100, queries=200, landmarks=LANDMARKS, seed=0):
+    """Time shortest path queries on a synthetic street grid with and without landmarks, in milliseconds"""
+    started = time.perf_counter()
+    graph = synthetic_road_graph(rows, cols, seed).prepare(landmarks)
+    prepare_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(seed + 1)
+    pairs = [(rng.randrange(len(graph)), rng.randrange(len(graph))) for _ in range(queries)]
+    result = {'nodes': len(graph), 'arcs': len(graph.head), 'prepare_ms': prepare_ms, 'queries': queries}
+    for name, landmarks in (('alt', True), ('dijkstra', False)):
+        latencies = []
+        for source, target in pairs:
+            started = time.perf_counter()
+            graph.route(source, target, landmarks)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        result[f'{name}_p50_ms'] = latencies[len(latencies) // 2]
+        result[f'{name}_p95_ms'] = latencies[int(len(latencies) * 0.95) - 1]
+    return result
@@ -0,0 +1,168 @@
+from App.models import Area, Location, Route, RouteStop, Bus, Schedule, Driver
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import date, datetime
+from enum import Enum
+from operator import attrgetter
+
+SHAPES = ('shallow', 'deep')
+
+
+class Serializer:
+    """
+    Explicit JSON shapes for a model. `columns` and `computed` values are plain fields,
+    `relations` maps a relationship name to (serializer name, nested shape).
+    Each shape lists its fields; any known field can also be selected explicitly.
+    Field getters and loader options are worked out once, not per object.
+    """
+
+    def __init__(self, model, columns, shapes, relations=None, computed=None):
+        self.model = model
+        self.relations = relations or {}
+        self.getters = {name: attrgetter(name) for name in columns}
+        self.getters.update(computed or {})
+        self.shapes = {shape: tuple(fields) for shape, fields in shapes.items()}
+        self.fields = tuple(self.getters) + tuple(self.relations)
+        self._plans = {}
+
+    def plan(self, shape='shallow', fields=None):
+        """
+        [(name, getter, nested serializer, nested shape, many)] for a shape or field selection.
+        Selected fields come in the serializer's order, so any order or repetition of the same
+        selection shares one plan and clients cannot grow the plans without bound.
+        """
+        if fields:
+            selected = set(fields)
+            unknown = [name for name in fields if name not in self.fields]
+            if unknown:
+                raise ValueError(f"Unknown field(s) for {self.model.__name__}: {', '.join(unknown)}")
+            fields = tuple(name for name in self.fields if name in selected)
+        # The shape does not matter with a selection
+        key = (None, fields) if fields else (shape, None)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        if not fields and shape not in self.shapes:
+            raise ValueError(f"Unknown shape '{shape}', expected one of {', '.join(SHAPES)}")
+
+        plan = []
+        mapper = inspect(self.model)
+        for name in fields or self.shapes[shape]:
+            if name in self.relations:
+                target, nested_shape = self.relations[name]
+                plan.append((name, attrgetter(name), target, nested_shape, mapper.relationships[name].uselist))
+            else:
+                plan.append((name, self.getters[name], None, None, False))
+        self._plans[key] = plan
+        return plan
+
+    def dump(self, obj, shape='shallow', fields=None):
+        result = {}
+        for name, getter, target, nested_shape, many in self.plan(shape, fields):
+            value = getter(obj)
+            if target:
+                nested = SERIALIZERS[target]
+                if many:
+                    value = [nested.dump(item, nested_shape) for item in value]
+                else:
+                    value = nested.dump(value, nested_shape) if value is not None else None
+            else:
+                value = _plain(value)
+            result[name] = value
+        return result
+
+    def options(self, shape='shallow', fields=None):
+        """Loader options that fetch everything the shape needs in a fixed number of queries"""
+        options = []
+        for name, _, target, nested_shape, many in self.plan(shape, fields):
+            if not target:
+                continue
+            attribute = getattr(self.model, name)
+            loader = selectinload(attribute) if many else joinedload(attribute)
+            nested = SERIALIZERS[target].options(nested_shape)
+            options.append(loader.options(*nested) if nested else loader)
+        return options
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+SERIALIZERS = {
+    'area': Serializer(Area, ('id', 'name'), {
+        'shallow': ('id', 'name'),
+        'deep': ('id', 'name')
+    }),
+    'location': Serializer(Location, ('id', 'name', 'lat', 'lng', 'type'), {
+        'shallow': ('id', 'name', 'lat', 'lng', 'type'),
+        'deep': ('id', 'name', 'lat', 'lng', 'type')
+    }),
+    'driver': Serializer(Driver, ('id', 'username', 'is_admin', 'full_Name', 'licenseNo'), {
+        'shallow': ('id', 'username', 'full_Name'),
+        'deep': ('id', 'username', 'is_admin', 'full_Name', 'licenseNo')
+    }),
+    'route_stop': Serializer(RouteStop, ('id', 'route_id', 'location_id', 'stop_index'), {
+        'shallow': ('id', 'route_id', 'location_id', 'stop_index'),
+        'deep': ('id', 'route_id', 'location', 'stop_index')
+    }, relations={
+        'location': ('location', 'shallow')
+    }),
+    'bus': Serializer(Bus, ('id', 'plate_num', 'driver_id', 'route_id', 'passenger_count', 'max_passenger_count'), {
+        'shallow': ('id', 'plate_num', 'driver_id', 'route_id', 'passenger_count', 'max_passenger_count', 'available_seats'),
+        'deep': ('id', 'plate_num', 'driver', 'route', 'passenger_count', 'max_passenger_count', 'available_seats')
+    }, relations={
+        'driver': ('driver', 'shallow'),
+        'route': ('route', 'shallow')
+    }, computed={
+        'available_seats': lambda bus: bus.max_passenger_count - bus.passenger_count
+    }),
+    'schedule': Serializer(Schedule, ('id', 'stop_id', 'route_id', 'arrivalTime', 'departureTime'), {
+        'shallow': ('id', 'stop_id', 'route_id', 'arrivalTime', 'departureTime'),
+        'deep': ('id', 'stop', 'route', 'arrivalTime', 'departureTime')
+    }, relations={
+        'stop': ('location', 'shallow'),
+        'route': ('route', 'shallow')
+    }),
+    'route': Serializer(Route, ('id', 'name', 'cost', 'start_area_id', 'end_area_id'), {
+        'shallow': ('id', 'name', 'cost', 'start_area_id', 'end_area_id'),
+        'deep': ('id', 'name', 'cost', 'start_area', 'end_area', 'stops')
+    }, relations={
+        'start_area': ('area', 'shallow'),
+        'end_area': ('area', 'shallow'),
+        'stops': ('route_stop', 'deep'),
+        'buses': ('bus', 'shallow'),
+        'schedules': ('schedule', 'shallow')
+    })
+}
+
+_by_model = {serializer.model: serializer for serializer in SERIALIZERS.values()}
+
+def get_serializer(model):
+    for cls in model.__mro__:
+        if cls in _by_model:
+            return _by_model[cls]
+    raise KeyError(f"No serializer for {model.__name__}")
+
+def parse_fields(value):
+    """Field names from a comma separated ?fields= argument, or None"""
+    if not value:
+        return None
+    return tuple(name.strip() for name in value.split(',') if name.strip()) or None
+
+def serialize(obj, shape='shallow', fields=None):
+    return get_serializer(type(obj)).dump(obj, shape, fields)
+
+def serialize_many(objects, shape='shallow', fields=None):
+    if not objects:
+        return []
+    serializer = get_serializer(type(objects[0]))
+    return [serializer.dump(obj, shape, fields) for obj in objects]
+
+def query_for(model, shape='shallow', fields=None):
+    """A query on model with the eager loading plan of a shape or field selection"""
+    return model.query.options(*get_serializer(model).options(shape, fields))
@@ -0,0 +1,99 @@
+from App.log import get_logger
+from App.metrics import count_cache
+from functools import wraps
+import threading
+import time
+
+log = get_logger(__name__)
+
+# Seconds a follower waits for the leader before computing the value itself
+TIMEOUT = 30.0
+# Finished results kept for reuse beyond this many keys are pruned when the next one is stored
+MAX_RECENT = 1024
+
+
+class _Flight:
+    def __init__(self):
+        # threading.Event is a greenlet primitive once gevent has patched threading
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent computations of the same key in this process: the first caller
+    computes, callers arriving while it runs wait for and share its result (or exception),
+    and callers within `reuse` seconds after it finished get the same result too.
+    Results are shared between requests, so they must be plain data nobody mutates.
+    Usable as a decorator, keyed on the call's arguments:
+
+        @SingleFlight('arrivals', reuse=1.0)
+        def get_arrivals(stop_id, route_id):
+            ...
+    """
+
+    def __init__(self, name, reuse=0.0, timeout=TIMEOUT):
+        self.name = name
+        self.reuse = reuse
+        self.timeout = timeout
+        self._flights = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute):
+        """compute(), or the result of the computation of `key` already running or just finished"""
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None and recent[0] > now:
+                count_cache(f'singleflight.{self.name}', True)
+                return recent[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        count_cache(f'singleflight.{self.name}', not leader)
+
+        if not leader:
+            if flight.done.wait(self.timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            log.warning("Gave up waiting for a shared computation", flight=self.name, key=str(key))
+            return compute()
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if self.reuse and flight.error is None:
+                    self._remember(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _remember(self, key, value):
+        now = time.monotonic()
+        if len(self._recent) >= MAX_RECENT:
+            self._recent = {k: entry for k, entry in self._recent.items() if entry[0] > now}
+        self._recent[key] = (now + self.reuse, value)
+
+    def forget(self, key=None):
+        """Drop the reusable result of `key`, or of every key"""
+        with self._lock:
+            if key is None:
+                self._recent.clear()
+            else:
+                self._recent.pop(key, None)
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            return self.do(key, lambda: function(*args, **kwargs))
+        wrapper.flight = self
+        return wrapper
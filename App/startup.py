@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+# What a gunicorn worker does on boot without --preload: import the app module
+BOOT_SCRIPT = (
+    "import time; started = time.perf_counter(); import wsgi; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def parse_importtime(stderr, depth=2):
+    """
+    [(cumulative microseconds, module)] from `python -X importtime` output, for modules
+    imported at most `depth` levels below the app module
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level below the module that triggered them
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if 1 <= level <= depth:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)
+
+def boot_once(env=None, importtime=False):
+    """Seconds to boot the app in a fresh interpreter, and the -X importtime report if requested"""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', BOOT_SCRIPT]
+    result = subprocess.run(command, capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if result.returncode != 0:
+        raise RuntimeError(f"App failed to boot: {result.stderr.strip().splitlines()[-1]}")
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def benchmark_startup(runs=5, top=15, overrides=None):
+    """
+    Cold boot time of one worker, booting the app `runs` times in fresh interpreters,
+    and the slowest top-level imports. `overrides` are extra FLASK_ config variables.
+    """
+    env = dict(os.environ)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    for key, value in (overrides or {}).items():
+        env[f'FLASK_{key}'] = str(value)
+
+    times = sorted(boot_once(env)[0] for _ in range(runs))
+    _, report = boot_once(env, importtime=True)
+    return {
+        'runs': runs,
+        'min_ms': times[0] * 1000,
+        'median_ms': times[len(times) // 2] * 1000,
+        'max_ms': times[-1] * 1000,
+        'imports': [(name, microseconds / 1000) for microseconds, name in parse_importtime(report)[:top]]
+    }
@@ -1,4 +1,7 @@
 import os, tempfile, pytest, logging, unittest
+from unittest.mock import patch
+from flask import current_app
+from flask_jwt_extended import create_access_token
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from App.main import create_app
@@ -294,3 +297,14 @@ class JourneyIntegrationTests(unittest.TestCase):
         self.assertEqual(stats['total_passengers'], 12)  # 10 + 2 = 12 total entries
         self.assertEqual(stats['revenue'], 60)  # 12 passengers * 5 cost = 60
 
+    def test_journey_stats_page_leaves_shared_stats(self):
+        """The stats page fills in defaults without touching the result other requests share"""
+        shared = {'journey_id': self.journey.id, 'route_name': "Test Route", 'stop_delays': [{'stop_name': "Stop 2"}]}
+        client = current_app.test_client()
+        client.set_cookie('access_token', create_access_token(identity="driver1"))
+        with patch('App.views.journey.get_journey_stats', return_value=shared):
+            response = client.get(f'/driver/journeys/{self.journey.id}/stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(shared, {'journey_id': self.journey.id, 'route_name': "Test Route",
+                                  'stop_delays': [{'stop_name': "Stop 2"}]})
+
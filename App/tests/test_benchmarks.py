@@ -0,0 +1,59 @@
+import pytest, unittest
+
+from App.main import create_app
+from App.database import db, create_db
+from App.benchmarks import percentile, compare_results, format_report, benchmark_scale
+
+'''
+   Unit Tests
+'''
+def results(**cases):
+    return {'scales': {'small': {'cases': cases}}}
+
+class BenchmarkUnitTests(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 51)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile([3.0], 0.99), 3.0)
+
+    def test_compare_results(self):
+        baseline = results(search={'p95_ms': 10.0, 'queries': 5, 'peak_kb': 100}, stats={'p95_ms': 0.2, 'queries': 2, 'peak_kb': 50})
+        current = results(search={'p95_ms': 15.0, 'queries': 1, 'peak_kb': 110}, stats={'p95_ms': 0.4, 'queries': 2, 'peak_kb': 50},
+                          added={'p95_ms': 1.0, 'queries': 1, 'peak_kb': 1})
+        rows = {(row['case'], row['metric']): row['status'] for row in compare_results(baseline, current, threshold=0.2)}
+        self.assertEqual(rows[('search', 'p95_ms')], 'regression')
+        self.assertEqual(rows[('search', 'queries')], 'improvement')
+        # Within the threshold, or below the absolute floor
+        self.assertEqual(rows[('search', 'peak_kb')], 'ok')
+        self.assertEqual(rows[('stats', 'p95_ms')], 'ok')
+        self.assertNotIn(('added', 'p95_ms'), rows)
+        self.assertIn("1 regression(s), 1 improvement(s)", format_report(compare_results(baseline, current)))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_benchmarks.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class BenchmarkIntegrationTests(unittest.TestCase):
+
+    def test_benchmark_scale(self):
+        params = {'areas': 3, 'routes': 3, 'stops': (5, 6), 'buses_per_route': 2, 'days': 1, 'trips_per_day': 2, 'active': 1}
+        result = benchmark_scale(params, iterations=3)
+        self.assertGreater(result['rows'], 0)
+        self.assertEqual(set(result['cases']), {
+            'location_get_buses', 'journey_get_stats', 'journey_calculate_progress', 'search_stops',
+            'get_route_api', 'create_board_event', 'gps_ingest'
+        })
+        for metrics in result['cases'].values():
+            self.assertGreater(metrics['queries'], 0)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p95_ms'])
+            self.assertGreater(metrics['peak_kb'], 0)
@@ -0,0 +1,132 @@
+import json, multiprocessing, os, pickle, pytest, sqlite3, tempfile, time, unittest
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.config import config
+from App.models import Route, Area, RouteSegment
+from App.cache import Cache, get_cache, clear_caches, invalidate_tables
+from App.controllers.route import get_route_offsets
+
+def shared(path):
+    """Point the caches at a shared store file for the duration of a test"""
+    config['CACHE_PATH'] = path
+    config['CACHE_GENERATION_TTL'] = 0
+    clear_caches()
+
+def set_in_child(path, key, value):
+    shared(path)
+    Cache('children').set(key, value)
+
+'''
+   Unit Tests
+'''
+class CacheUnitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = config.get('CACHE_PATH')
+        config['CACHE_PATH'] = ''
+        clear_caches()
+
+    def tearDown(self):
+        config['CACHE_PATH'] = self.previous
+        config.pop('CACHE_GENERATION_TTL', None)
+
+    def test_lru_and_ttl(self):
+        cache = Cache('lru', ttl=60, l1_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        cache.set('short', 4, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('short'))
+
+    def test_versioned_keys(self):
+        cache = Cache('versioned')
+        cache.set('routes', ['old'], version=(1, 4))
+        self.assertEqual(cache.get('routes', version=(1, 4)), ['old'])
+        self.assertIsNone(cache.get('routes', version=(1, 5)))
+
+    def test_get_or_compute(self):
+        cache = Cache('compute')
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(cache.get_or_compute('key', compute), 1)
+        self.assertEqual(cache.get_or_compute('key', compute), 1)
+        self.assertEqual(len(calls), 1)
+        # None is a value like any other
+        self.assertIsNone(cache.get_or_compute('none', lambda: None))
+        self.assertIsNone(cache.get_or_compute('none', lambda: 1 / 0))
+
+    def test_workers_share_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared(os.path.join(directory, 'cache.sqlite'))
+            # Two caches of one namespace stand in for the same cache in two workers
+            first, second = Cache('shared'), Cache('shared')
+            first.set('stop index', {'A': 1})
+            self.assertEqual(second.get('stop index'), {'A': 1})
+
+            first.invalidate()
+            self.assertIsNone(second.get('stop index'))
+            self.assertNotIn('stop index', first)
+
+    def test_other_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+            shared(path)
+            child = multiprocessing.get_context('fork').Process(target=set_in_child, args=(path, 'geometry', [1.5, 2.5]))
+            child.start()
+            child.join()
+            self.assertEqual(child.exitcode, 0)
+            self.assertEqual(Cache('children').get('geometry'), [1.5, 2.5])
+
+    def test_store_holds_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+            shared(path)
+            Cache('offsets').set(7, {0: (0.0, 0), 1: (250.5, 60)})
+            with sqlite3.connect(path) as connection:
+                connection.execute("INSERT INTO cache_entry VALUES ('offsets:0:8', ?, ?)",
+                                   (pickle.dumps([1]), time.time() + 60))
+                stored = connection.execute("SELECT value FROM cache_entry WHERE key = 'offsets:0:7'").fetchone()[0]
+            self.assertEqual(json.loads(stored), {'0': [0.0, 0], '1': [250.5, 60]})
+            # Another worker reads it back in the shape it was stored in, and ignores anything not JSON
+            decoded = Cache('offsets', decode=lambda offsets: {int(i): tuple(pair) for i, pair in offsets.items()})
+            self.assertEqual(decoded.get(7), {0: (0.0, 0), 1: (250.5, 60)})
+            self.assertIsNone(decoded.get(8))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_cache.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class CacheIntegrationTests(unittest.TestCase):
+
+    def test_commit_invalidates(self):
+        route = Route("Cache Route", 5, Area("Cache North"), Area("Cache South"))
+        db.session.add(route)
+        db.session.commit()
+        self.assertEqual(get_route_offsets(route.id), {})
+
+        db.session.add(RouteSegment(route_id=route.id, stop_index=0, distance=0, cum_distance=0,
+                                    travel_time=0, cum_time=0, source='origin'))
+        db.session.commit()
+        self.assertEqual(get_route_offsets(route.id), {0: (0, 0)})
+
+    def test_unrelated_commit_keeps_entries(self):
+        cache = get_cache('areas', tables=('area',))
+        other = get_cache('not_areas', tables=('bus',))
+        cache.set('count', 1)
+        other.set('count', 1)
+        invalidate_tables({'area', 'user'})
+        self.assertIsNone(cache.get('count'))
+        self.assertEqual(other.get('count'), 1)
@@ -0,0 +1,126 @@
+import os, pytest, unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Bus, ChangeFeed
+from App.change_feed import ChangeFeedReader, record_change
+
+'''
+   Unit Tests
+'''
+class ChangeFeedUnitTests(unittest.TestCase):
+
+    def test_own_changes_skipped(self):
+        feed = ChangeFeedReader('a')
+        seen = []
+        feed.subscribe(seen.append)
+        feed.start(db.engine)
+        with db.engine.begin() as connection:
+            record_change(connection, {'route'}, 'a')
+            record_change(connection, {'bus', 'location'}, 'b')
+        self.assertEqual(feed.poll(force=True), {'bus', 'location'})
+        self.assertEqual(seen, [{'bus', 'location'}])
+        # The high-water mark moved past both rows
+        self.assertEqual(feed.poll(force=True), set())
+
+    def test_late_commit_below_high_water(self):
+        feed = ChangeFeedReader('a')
+        feed.start(db.engine)
+        table = ChangeFeed.__table__
+        # Two transactions took ids in one order and committed in the other, as they can on Postgres
+        late, early = feed.high_water + 1, feed.high_water + 2
+        with db.engine.begin() as connection:
+            connection.execute(table.insert().values(id=early, tables='route', node='b', created=datetime.utcnow()))
+        self.assertEqual(feed.poll(force=True), {'route'})
+        with db.engine.begin() as connection:
+            connection.execute(table.insert().values(id=late, tables='schedule', node='b', created=datetime.utcnow()))
+        self.assertEqual(feed.poll(force=True), {'schedule'})
+        self.assertEqual(feed.poll(force=True), set())
+
+    def test_listener_reconnects_in_place(self):
+        class Stop(Exception):
+            pass
+        feed = ChangeFeedReader('a', listen=True)
+        feed._listener_pid = os.getpid()
+        raw = MagicMock()
+        raw.driver_connection.cursor.return_value.execute.side_effect = OSError("server closed the connection")
+        engine = MagicMock()
+        engine.raw_connection.return_value = raw
+        with patch('App.change_feed.time.sleep', side_effect=Stop):
+            with self.assertRaises(Stop):
+                feed._listen(engine)
+        raw.close.assert_called_once()
+        # Polls fall back to the normal interval, but the failing thread stays the process's listener
+        self.assertFalse(feed._listening)
+        self.assertEqual(feed._listener_pid, os.getpid())
+
+    def test_poll_throttled(self):
+        feed = ChangeFeedReader('a', interval=60)
+        feed.start(db.engine)
+        feed.poll(force=True)
+        with db.engine.begin() as connection:
+            record_change(connection, {'schedule'}, 'b')
+        self.assertEqual(feed.poll(), set())
+        feed.pending = True
+        self.assertEqual(feed.poll(), {'schedule'})
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_change_feed.db', 'CHANGE_FEED_NODE': 'a'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class ChangeFeedIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.node_a = current_app._get_current_object()
+        # A second app on the same database stands in for another node
+        cls.node_b = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_change_feed.db',
+                                  'CHANGE_FEED_NODE': 'b', 'CHANGE_FEED_INTERVAL': 0})
+        cls.node_a.app_context().push()
+        cls.changes = {'a': [], 'b': []}
+        for app in (cls.node_a, cls.node_b):
+            feed = app.extensions['change_feed']
+            feed.subscribe(cls.changes[feed.node].append)
+
+    def setUp(self):
+        for app in (self.node_a, self.node_b):
+            app.extensions['change_feed'].poll(force=True)
+        self.changes['a'].clear()
+        self.changes['b'].clear()
+
+    def test_commit_reaches_other_node(self):
+        route = Route("Feed Route", 5, Area("Feed North"), Area("Feed South"))
+        db.session.add(route)
+        db.session.commit()
+
+        with self.node_b.app_context():
+            response = self.node_b.test_client().get('/')
+        self.assertNotEqual(response.status_code, 500)
+        self.assertEqual(self.changes['b'], [{'route'}])
+        self.assertEqual(self.node_a.extensions['change_feed'].poll(force=True), set())
+        self.assertEqual(self.changes['a'], [])
+
+    def test_bulk_update_recorded(self):
+        db.session.add(Bus('FEED-1'))
+        db.session.commit()
+        self.node_b.extensions['change_feed'].poll(force=True)
+        Bus.query.filter_by(plate_num='FEED-1').update({'max_passenger_count': 40})
+        db.session.commit()
+        self.assertEqual(self.node_b.extensions['change_feed'].poll(force=True), {'bus'})
+
+    def test_other_tables_not_recorded(self):
+        before = ChangeFeed.query.count()
+        db.session.add(Area("Feed East"))
+        db.session.commit()
+        self.assertEqual(ChangeFeed.query.count(), before)
@@ -0,0 +1,84 @@
+import json, pytest, unittest
+from flask import current_app
+from sqlalchemy import create_engine, exc, text
+
+from App.main import create_app
+from App.database import (
+    db, create_db, engine_options, pool_status, set_sqlite_pragmas, make_psycopg2_green,
+    gevent_wait_callback, MeteredQueuePool, SQLITE_PRAGMAS
+)
+
+'''
+   Unit Tests
+'''
+class EngineOptionsUnitTests(unittest.TestCase):
+
+    def test_postgres_profile(self):
+        options = engine_options('postgresql://user:pass@db/nextstop', {'DB_POOL_SIZE': 4, 'DB_STATEMENT_TIMEOUT_MS': 2500})
+        self.assertIs(options['poolclass'], MeteredQueuePool)
+        self.assertEqual(options['pool_size'], 4)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=2500'})
+
+    def test_statement_timeout_disabled(self):
+        options = engine_options('postgresql://user:pass@db/nextstop', {'DB_STATEMENT_TIMEOUT_MS': 0})
+        self.assertNotIn('connect_args', options)
+
+    def test_sqlite_profile(self):
+        self.assertEqual(engine_options('sqlite://', {}), {})
+        options = engine_options('sqlite:///nextstop.db', {'DB_POOL_SIZE': 20})
+        self.assertEqual(options['pool_size'], 5)
+        self.assertNotIn('pool_recycle', options)
+
+    def test_metered_pool(self):
+        engine = create_engine('sqlite://', poolclass=MeteredQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05)
+        with engine.connect():
+            self.assertEqual(pool_status(engine)['in_use'], 1)
+            with self.assertRaises(exc.TimeoutError):
+                engine.connect()
+        status = pool_status(engine)
+        self.assertEqual((status['in_use'], status['checkouts'], status['timeouts'], status['peak_in_use']), (0, 1, 1, 1))
+        engine.dispose()
+        self.assertEqual(pool_status(engine)['timeouts'], 1)
+
+    def test_green_psycopg2(self):
+        from psycopg2 import extensions
+        previous = extensions.get_wait_callback()
+        try:
+            self.assertTrue(make_psycopg2_green())
+            self.assertIs(extensions.get_wait_callback(), gevent_wait_callback)
+        finally:
+            extensions.set_wait_callback(previous)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_database.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class DatabaseIntegrationTests(unittest.TestCase):
+
+    def test_sqlite_pragmas(self):
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+            self.assertEqual(connection.execute(text('PRAGMA synchronous')).scalar(), 1)
+
+    def test_memory_database_pragmas(self):
+        engine = create_engine('sqlite://')
+        set_sqlite_pragmas(engine, SQLITE_PRAGMAS)
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text('PRAGMA temp_store')).scalar(), 2)
+
+    def test_health_endpoint(self):
+        response = current_app.test_client().get('/health/db')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['pool']['pool'], 'MeteredQueuePool')
+        self.assertGreater(data['pool']['checkouts'], 0)
+        self.assertEqual(data['pool']['in_use'], 0)
@@ -0,0 +1,50 @@
+import os, pytest, unittest
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop
+from App.models.Location import LocationType
+from App.deploy import warm_shared_state, process_memory
+from App.controllers import route
+
+'''
+   Unit Tests
+'''
+class DeployUnitTests(unittest.TestCase):
+
+    def test_process_memory(self):
+        memory = process_memory(os.getpid())
+        self.assertGreater(memory['rss_kb'], 0)
+        self.assertLessEqual(memory['uss_kb'], memory['rss_kb'])
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_deploy.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class WarmUpIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("Warm Route", 5, start, end)
+        first = Location("Warm A", 10.0, -61.0, LocationType.Terminal)
+        second = Location("Warm B", 10.1, -61.0, LocationType.Terminal)
+        db.session.add_all([start, end, cls.route, first, second,
+                            RouteStop(cls.route, first, 0), RouteStop(cls.route, second, 1)])
+        db.session.commit()
+
+    def test_warm_shared_state(self):
+        warmed = warm_shared_state(current_app)
+        self.assertEqual(warmed, ['templates', 'serializers', 'route list', 'route offsets',
+                                  'transit network', 'stop graph', 'eta model'])
+        self.assertIn(self.route.id, route.route_offsets)
+        self.assertIsNotNone(current_app.jinja_env.cache)
@@ -0,0 +1,116 @@
+import os, pytest, unittest
+from datetime import datetime, timedelta
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Journey, JourneyEvent, Route, Bus, Location, Area, RouteStop, BoardEvent
+from App.models.User import Driver
+from App.models.Location import LocationType
+from App.controllers.eta import EtaModel, set_eta_model, train_eta_model, backtest_eta_model, collect_arrivals
+
+'''
+   Unit Tests
+'''
+class EtaModelUnitTests(unittest.TestCase):
+
+    def setUp(self):
+        morning = datetime(2024, 1, 8, 7, 0)
+        arrivals = {}
+        for i, minutes in enumerate([10, 12, 14]):
+            arrivals[i] = (1, {0: morning, 1: morning + timedelta(minutes=minutes)})
+        arrivals[3] = (1, {0: morning.replace(hour=13), 1: morning.replace(hour=13) + timedelta(minutes=30)})
+        self.model = EtaModel.train(arrivals)
+
+    def test_hourly_distribution(self):
+        self.assertEqual(self.model.predict_segment(1, 0, datetime(2024, 1, 9, 7, 30)), 12 * 60)
+
+    def test_sparse_hour_uses_daily_distribution(self):
+        self.assertEqual(self.model.segment_stats(1, 0, 13)[2], 4)
+
+    def test_progress_along_segment(self):
+        self.assertEqual(self.model.predict_segment(1, 0, datetime(2024, 1, 9, 7, 30), progress=0.75), 3 * 60)
+
+    def test_unknown_segment_falls_back_to_distance(self):
+        self.assertAlmostEqual(self.model.predict_segment(2, 0, datetime(2024, 1, 9, 7, 30), distance=833), 130, places=0)
+        self.assertIsNone(self.model.predict_segment(2, 0, datetime(2024, 1, 9, 7, 30)))
+
+    def test_save_and_load(self):
+        path = 'test_eta_model.json'
+        try:
+            self.model.save(path)
+            loaded = EtaModel.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(loaded.segments, self.model.segments)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_eta.db',
+                      'ETA_MODEL_PATH': 'test_eta_model.json'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+    if os.path.exists('test_eta_model.json'):
+        os.remove('test_eta_model.json')
+
+
+class EtaIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("ETA Route", 5, start, end)
+        cls.first = Location("First", 10.0, -61.0, LocationType.Terminal)
+        cls.second = Location("Second", 10.1, -61.0, LocationType.Stop)
+        cls.rs1 = RouteStop(cls.route, cls.first, 0)
+        cls.rs2 = RouteStop(cls.route, cls.second, 1)
+        cls.driver = Driver("etadriver", "pass", False, "ETA Driver", "DL1")
+        cls.bus = Bus("ETA001", cls.driver, cls.route, 50)
+        db.session.add_all([start, end, cls.route, cls.first, cls.second, cls.rs1, cls.rs2, cls.driver, cls.bus])
+        db.session.commit()
+
+        # Ten completed journeys taking 20 minutes between the two stops
+        base = datetime(2024, 1, 8, 8, 0)
+        for day in range(10):
+            departed = base + timedelta(days=day)
+            journey = Journey(cls.driver, cls.route, cls.bus, startTime=departed,
+                              endTime=departed + timedelta(minutes=30), status="Completed")
+            at_first = JourneyEvent(journey, cls.first.lat, cls.first.lng)
+            at_first.time = departed
+            at_second = JourneyEvent(journey, cls.second.lat, cls.second.lng)
+            at_second.time = departed + timedelta(minutes=20)
+            db.session.add_all([journey, at_first, at_second])
+        db.session.commit()
+
+    def test_collect_arrivals_from_trails(self):
+        arrivals = collect_arrivals(Journey.query.filter_by(status="Completed").all())
+        self.assertEqual(len(arrivals), 10)
+        route_id, stop_times = next(iter(arrivals.values()))
+        self.assertEqual(route_id, self.route.id)
+        self.assertEqual(stop_times[1] - stop_times[0], timedelta(minutes=20))
+
+    def test_backtest(self):
+        result = backtest_eta_model(holdout=0.3)
+        self.assertEqual(result['test_journeys'], 3)
+        self.assertEqual(result['mae_seconds'], 0)
+        self.assertGreater(result['baseline_mae_seconds'], 0)
+
+    def test_get_buses_uses_model(self):
+        train_eta_model()
+        journey = Journey(self.driver, self.route, self.bus)
+        journey.startJourney()
+        db.session.add(BoardEvent(journey, "Enter", 1, self.rs1))
+        halfway = JourneyEvent(journey, 10.05, -61.0)
+        db.session.add(halfway)
+        db.session.commit()
+
+        buses = self.second.getBuses(self.route.id)
+        self.assertEqual(len(buses), 1)
+        self.assertAlmostEqual(buses[0]['duration_seconds'], 600, delta=1)
+
+        journey.completeJourney()
+        set_eta_model(EtaModel())
@@ -0,0 +1,68 @@
+import pytest, unittest
+from flask import current_app
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, User
+from App.fragments import clear_fragments
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_fragments.db',
+                      'JWT_COOKIE_SECURE': False})
+    create_db()
+    clear_fragments()
+    yield app.test_client()
+    db.drop_all()
+
+
+class FragmentCacheIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Couva"), Area("Chaguanas")
+        cls.route = Route("Fragment Route", 7, start, end)
+        db.session.add_all([start, end, cls.route, User("fragmentuser", "pass")])
+        db.session.commit()
+
+    def route_queries(self, client, **kwargs):
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/', **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True), [s for s in statements if 'FROM route' in s or 'FROM area' in s]
+
+    def test_route_list_cached_until_commit(self):
+        client = current_app.test_client()
+        page, _ = self.route_queries(client)
+        self.assertIn('$7', page)
+        page, queries = self.route_queries(client)
+        self.assertIn('$7', page)
+        self.assertEqual(queries, [])
+
+        route = db.session.get(Route, self.route.id)
+        route.cost = 9
+        db.session.commit()
+        page, queries = self.route_queries(client)
+        self.assertIn('$9', page)
+        self.assertNotEqual(queries, [])
+
+    def test_auth_context_stays_dynamic(self):
+        client = current_app.test_client()
+        self.route_queries(client)
+        client.set_cookie('access_token', create_access_token(identity="fragmentuser"))
+        page, queries = self.route_queries(client)
+        self.assertIn('fragmentuser', page)
+        self.assertIn('Couva', page)
+        self.assertEqual(queries, [])
@@ -0,0 +1,138 @@
+import gzip, json, pytest, unittest
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, RouteSegment, DataVersion, Bus
+from App.models.Location import LocationType
+from App.controllers.route import get_route_stops, save_route_geometry
+from App.versioning import get_versions
+from App.http_cache import PrecompressedCache, precompressed, benchmark_index_flow, brotli
+
+'''
+   Unit Tests
+'''
+class PrecompressedCacheUnitTests(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = PrecompressedCache(max_entries=2, max_bytes=100)
+        cache.put('a', b'1' * 10, 'application/json')
+        cache.put('b', b'2' * 10, 'application/json')
+        cache.get('a')
+        cache.put('c', b'3' * 10, 'application/json')
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+
+    def test_bounded_by_bytes(self):
+        cache = PrecompressedCache(max_entries=10, max_bytes=25)
+        for key in 'abc':
+            cache.put(key, b'x' * 10, 'application/json')
+        self.assertEqual(cache.size, 20)
+        self.assertIsNone(cache.get('a'))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_http_cache.db',
+                      'DATA_VERSION_TTL': 60})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class HttpCacheIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("Cached Route", 5, start, end)
+        cls.locations = [Location(f"Cached Stop {index}", 10.0 + index * 0.01, -61.0, LocationType.Stop)
+                         for index in range(30)]
+        stops = [RouteStop(cls.route, location, index) for index, location in enumerate(cls.locations)]
+        db.session.add_all([start, end, cls.route] + cls.locations + stops)
+        db.session.commit()
+        cls.route_id = cls.route.id
+
+        coordinates = [[-61.0, 10.0 + index * 0.0001] for index in range(3000)]
+        save_route_geometry(cls.route_id, get_route_stops(cls.route_id), {
+            'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': coordinates},
+                          'properties': {'segments': [{'distance': 100, 'duration': 10}] * 29}}]
+        })
+
+    def test_commit_bumps_versions(self):
+        before = get_versions(['route'])
+        route = db.session.get(Route, self.route_id)
+        route.cost = route.cost + 1
+        db.session.commit()
+        self.assertEqual(get_versions(['route']), (before[0] + 1,))
+
+        RouteSegment.query.filter_by(route_id=self.route_id).delete()
+        db.session.commit()
+        self.assertGreater(db.session.get(DataVersion, 'route_segment').version, 0)
+
+    def test_not_modified(self):
+        client = current_app.test_client()
+        response = client.get(f'/api/routes/{self.route_id}')
+        etag = response.headers['ETag']
+        self.assertEqual(client.get(f'/api/routes/{self.route_id}', headers={'If-None-Match': etag}).status_code, 304)
+        self.assertNotEqual(client.get(f'/api/routes/{self.route_id}?shape=shallow').headers['ETag'], etag)
+
+        route = db.session.get(Route, self.route_id)
+        route.name = "Renamed Route"
+        db.session.commit()
+        response = client.get(f'/api/routes/{self.route_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['name'], "Renamed Route")
+
+    def test_selected_relations_revalidate(self):
+        bus = Bus("CACHED1", None, db.session.get(Route, self.route_id), 40)
+        db.session.add(bus)
+        db.session.commit()
+        client = current_app.test_client()
+        url = f'/api/routes/{self.route_id}?fields=id,buses'
+        etag = client.get(url).headers['ETag']
+        bus.passenger_count = 10
+        db.session.commit()
+        response = client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['buses'][0]['available_seats'], 30)
+
+    def test_compressed_and_precompressed(self):
+        client = current_app.test_client()
+        url = f'/api/route-directions/{self.route_id}'
+        plain = client.get(url).get_data()
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.get_data()), plain)
+        self.assertLess(len(response.get_data()) * 3, len(plain))
+
+        etag = response.headers['ETag'].strip('"')
+        self.assertTrue(etag.endswith('-gzip'))
+        self.assertIsNotNone(precompressed.get((etag[:-len('-gzip')], 'gzip')))
+        again = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(again.get_data(), response.get_data())
+        revalidated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+        self.assertEqual(revalidated.status_code, 304)
+
+    @unittest.skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_preferred(self):
+        client = current_app.test_client()
+        response = client.get(f'/api/route-directions/{self.route_id}', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+
+    def test_small_bodies_uncompressed(self):
+        client = current_app.test_client()
+        response = client.get('/health', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_index_flow_benchmark(self):
+        results = benchmark_index_flow(current_app.test_client(), self.route_id, 'Cached', repeats=1)
+        for url in (f'/api/routes/{self.route_id}', f'/api/route-directions/{self.route_id}'):
+            self.assertEqual(results[url]['revalidated']['status'], 304)
+            self.assertEqual(results[url]['revalidated']['bytes'], 0)
+            self.assertLess(results[url]['compressed']['bytes'], results[url]['plain']['bytes'])
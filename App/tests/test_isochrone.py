@@ -0,0 +1,94 @@
+import json, pytest, unittest
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, RouteSegment
+from App.models.Location import LocationType
+from App.controllers import isochrone
+from App.controllers.isochrone import StopGraph, TRANSFER_PENALTY, convex_hull, get_isochrones
+
+'''
+   Unit Tests
+'''
+class StopGraphUnitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = StopGraph()
+        for location_id in range(1, 5):
+            self.graph.add_location(location_id, f"Stop {location_id}", 10.0 + location_id * 0.1, -61.0)
+        self.graph.add_route(1, [(0, 1, 0), (1, 2, 600), (2, 3, 600)])
+        self.graph.add_route(2, [(0, 3, 0), (1, 4, 900)])
+
+    def test_reach_with_transfer_penalty(self):
+        reached = self.graph.reach([1], 3600)
+        self.assertEqual(reached, {1: 0, 2: 600, 3: 1200, 4: 1200 + TRANSFER_PENALTY + 900})
+
+    def test_reach_is_bounded(self):
+        self.assertEqual(set(self.graph.reach([1], 1000)), {1, 2})
+
+    def test_multiple_sources(self):
+        self.assertEqual(self.graph.reach([1, 3], 1000)[4], 900)
+
+    def test_walk_from_origin(self):
+        self.graph.add_location(5, "Stop 5", 10.55, -61.0)
+        self.graph.add_walks({1: [(5, 300)]})
+        self.assertEqual(self.graph.reach([1], 600), {1: 0, 2: 600, 5: 300})
+
+    def test_convex_hull(self):
+        ring = convex_hull([(0, 0), (1, 0), (1, 1), (0, 1), (0.5, 0.5)])
+        self.assertEqual(len(ring), 5)
+        self.assertEqual(ring[0], ring[-1])
+        self.assertNotIn([0.5, 0.5], ring)
+        self.assertIsNone(convex_hull([(0, 0), (1, 1), (2, 2)]))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_isochrone.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class IsochroneIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("Isochrone Route", 5, start, end)
+        cls.locations = [
+            Location("Terminal", 10.60, -61.50, LocationType.Terminal),
+            Location("Middle", 10.55, -61.45, LocationType.Stop),
+            Location("Far", 10.40, -61.40, LocationType.Terminal)
+        ]
+        stops = [RouteStop(cls.route, location, index) for index, location in enumerate(cls.locations)]
+        db.session.add_all([start, end, cls.route] + cls.locations + stops)
+        db.session.commit()
+        db.session.add_all([
+            RouteSegment(cls.route.id, 0, 0, 0, 0, 0, 'origin'),
+            RouteSegment(cls.route.id, 1, 8000, 20 * 60, 8000, 20 * 60, 'history'),
+            RouteSegment(cls.route.id, 2, 20000, 30 * 60, 28000, 50 * 60, 'history')
+        ])
+        db.session.commit()
+        isochrone._graph = None
+
+    def test_bands(self):
+        result = get_isochrones([self.locations[0].id], [30, 60])
+        self.assertEqual([stop['name'] for stop in result['bands'][0]['stops']], ["Terminal", "Middle"])
+        self.assertEqual(result['bands'][1]['stops'][-1]['seconds'], 50 * 60)
+
+    def test_isochrone_api(self):
+        client = current_app.test_client()
+        response = client.get(f'/api/isochrone?stop={self.locations[0].id}&bands=30,60&hull=1')
+        self.assertEqual(response.status_code, 200)
+        bands = json.loads(response.data)['bands']
+        self.assertIsNone(bands[0]['hull']['geometry'])
+        self.assertEqual(bands[1]['hull']['geometry']['type'], 'Polygon')
+
+        self.assertEqual(client.get('/api/isochrone').status_code, 400)
+        self.assertEqual(client.get(f'/api/isochrone?stop={self.locations[0].id}&bands=x').status_code, 400)
+        self.assertEqual(client.get('/api/isochrone?stop=999').status_code, 404)
@@ -0,0 +1,70 @@
+import json, pytest, unittest
+from datetime import datetime
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models.Location import LocationType
+from App.json_provider import RawJSON, ENCODERS, FastJSONProvider, benchmark_encoders, get_encoder
+
+'''
+   Unit Tests
+'''
+class JSONEncoderUnitTests(unittest.TestCase):
+
+    data = {
+        'when': datetime(2024, 1, 8, 7, 30, 15),
+        'type': LocationType.Terminal,
+        'coordinates': [[-61.5, 10.6], [-61.4, 10.5]],
+        'name': "Port of Spain – City Gate"
+    }
+
+    def test_encoders_agree(self):
+        encoded = {name: json.loads(encoder.dumps_bytes(self.data)) for name, encoder in ENCODERS.items()}
+        for result in encoded.values():
+            self.assertEqual(result, encoded['stdlib'])
+        self.assertEqual(encoded['stdlib']['when'], "2024-01-08T07:30:15")
+        self.assertEqual(encoded['stdlib']['type'], "Terminal")
+
+    def test_raw_json_nested(self):
+        for encoder in ENCODERS.values():
+            data = json.loads(encoder.dumps_bytes({'geometry': RawJSON('{"type":"LineString"}')}))
+            self.assertEqual(data, {'geometry': {'type': 'LineString'}})
+
+    def test_unknown_encoder(self):
+        with self.assertRaises(ValueError):
+            get_encoder('simdjson')
+
+    def test_benchmark(self):
+        result = benchmark_encoders({'features': [{'coordinates': [[0.1, 0.2]] * 1000}]}, iterations=2)
+        self.assertIn('stdlib', result)
+        self.assertGreater(result['bytes'], 1000)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_json_provider.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class JSONProviderIntegrationTests(unittest.TestCase):
+
+    def test_provider_registered(self):
+        self.assertIsInstance(current_app.json, FastJSONProvider)
+
+    def test_raw_json_response_untouched(self):
+        raw = b'{"type":"FeatureCollection",  "features":[]}'
+        with current_app.test_request_context():
+            response = current_app.json.response(RawJSON(raw))
+        self.assertEqual(response.get_data(), raw)
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_response_datetime(self):
+        with current_app.test_request_context():
+            response = current_app.json.response({'at': datetime(2024, 1, 8, 7, 30)})
+        self.assertEqual(json.loads(response.get_data()), {'at': "2024-01-08T07:30:00"})
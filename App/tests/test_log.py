@@ -0,0 +1,129 @@
+import io, json, logging, pytest, unittest
+from datetime import datetime
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Bus, Journey
+from App.models.User import Driver
+from App.controllers.journey import get_journey_stats
+from App.log import get_logger, JSONFormatter, TextFormatter, SamplingFilter, parse_settings, setup_logging
+
+def capture(formatter=None):
+    """A handler collecting formatted records, attached to the listener's output"""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter or JSONFormatter())
+    return stream, handler
+
+'''
+   Unit Tests
+'''
+class LogUnitTests(unittest.TestCase):
+
+    def record(self, name='App.models.Journey', level=logging.DEBUG, **fields):
+        record = logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level),
+                                        'msg': "Found %d board events", 'args': (3,), **fields})
+        return record
+
+    def test_json_formatter(self):
+        entry = json.loads(JSONFormatter().format(self.record(journey_id=7)))
+        self.assertEqual(entry['message'], "Found 3 board events")
+        self.assertEqual((entry['level'], entry['logger'], entry['journey_id']), ('DEBUG', 'App.models.Journey', 7))
+
+    def test_text_formatter(self):
+        line = TextFormatter().format(self.record(journey_id=7))
+        self.assertTrue(line.endswith("DEBUG App.models.Journey: Found 3 board events journey_id=7"))
+
+    def test_sampling(self):
+        draws = iter([0.5, 0.005, 0.5])
+        sampler = SamplingFilter({'App.models': 0.01, 'App.models.Location': 1.0}, random=lambda: next(draws))
+        self.assertFalse(sampler.filter(self.record()))
+        self.assertTrue(sampler.filter(self.record()))
+        # Warnings and other modules are never sampled, the most specific prefix wins
+        self.assertTrue(sampler.filter(self.record(level=logging.WARNING)))
+        self.assertTrue(sampler.filter(self.record(name='App.views.index')))
+        self.assertTrue(sampler.filter(self.record(name='App.models.Location')))
+
+    def test_parse_settings(self):
+        self.assertEqual(parse_settings("App.models=DEBUG, App.query_guard=ERROR"),
+                         {'App.models': 'DEBUG', 'App.query_guard': 'ERROR'})
+        self.assertEqual(parse_settings({'App.models': '0.1'}, float), {'App.models': 0.1})
+        self.assertEqual(parse_settings(None), {})
+
+    def test_lazy_formatting(self):
+        class Expensive:
+            formatted = False
+            def __str__(self):
+                Expensive.formatted = True
+                return "expensive"
+        get_logger('App.test').debug("Value %s", Expensive())
+        self.assertFalse(Expensive.formatted)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_log.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class LogIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        driver = Driver("logdriver", "logpass")
+        route = Route("Log Route", 5, Area("Log North"), Area("Log South"))
+        bus = Bus("LOG1", driver, route)
+        journey = Journey(driver, route, bus, datetime.utcnow())
+        db.session.add_all([driver, route, bus, journey])
+        db.session.commit()
+        cls.journey_id = journey.id
+
+    def tearDown(self):
+        setup_logging(current_app)
+
+    def written(self, listener, stream):
+        # Records reach the output once the listener thread has drained the queue
+        listener.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_debug_levels_per_module(self):
+        listener = setup_logging(current_app)
+        stream, handler = capture()
+        listener.handlers = (handler,)
+        # At the default INFO level stats are quiet
+        get_journey_stats(self.journey_id)
+        self.assertEqual(self.written(listener, stream), [])
+
+        current_app.config['LOG_LEVELS'] = 'App.models.Journey=DEBUG'
+        try:
+            listener = setup_logging(current_app)
+            stream, handler = capture()
+            listener.handlers = (handler,)
+            # Computed again rather than reusing the result of the call a moment ago
+            get_journey_stats.flight.forget()
+            get_journey_stats(self.journey_id)
+            entries = self.written(listener, stream)
+        finally:
+            current_app.config.pop('LOG_LEVELS')
+            logging.getLogger('App.models.Journey').setLevel(logging.NOTSET)
+        self.assertTrue(entries)
+        self.assertEqual({entry['logger'] for entry in entries}, {'App.models.Journey'})
+        self.assertEqual(entries[0]['journey_id'], self.journey_id)
+
+    def test_request_path_uses_queue(self):
+        listener = setup_logging(current_app)
+        handlers = logging.getLogger('App').handlers
+        self.assertEqual(len(handlers), 1)
+        self.assertIsInstance(handlers[0], logging.handlers.QueueHandler)
+        stream, handler = capture()
+        listener.handlers = (handler,)
+        get_logger('App.views.index').warning("OpenRouteService API error: %s", "quota", route_id=3)
+        entries = self.written(listener, stream)
+        self.assertEqual(entries[0]['message'], "OpenRouteService API error: quota")
+        self.assertEqual(entries[0]['route_id'], 3)
@@ -0,0 +1,107 @@
+import os, pytest, tempfile, unittest
+from datetime import datetime
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Bus, Journey
+from App.models.User import Driver
+from App.metrics import Registry, metrics, benchmark_metrics_overhead
+from App import ors
+
+'''
+   Unit Tests
+'''
+class MetricsUnitTests(unittest.TestCase):
+
+    def test_histogram_exposition(self):
+        registry = Registry()
+        latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+        registry.observe(latency, 0.05, endpoint='a')
+        registry.observe(latency, 0.5, endpoint='a')
+        registry.observe(latency, 5, endpoint='a')
+        text = registry.render()
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{endpoint="a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{endpoint="a",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{endpoint="a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{endpoint="a"} 3', text)
+        self.assertIn('latency_seconds_sum{endpoint="a"} 5.55', text)
+
+    def test_workers_add_up(self):
+        # Two registries writing to one directory stand in for two worker processes
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = Registry(), Registry()
+            for registry in (first, second):
+                registry.counter('requests_total', 'Requests')
+                registry.directory = directory
+            first.inc('requests_total', 2, status=200)
+            first.flush(force=True)
+            os.rename(os.path.join(directory, f'{os.getpid()}.json'), os.path.join(directory, 'other.json'))
+            second.inc('requests_total', 3, status=200)
+            second.inc('requests_total', status=404)
+            text = second.render()
+        self.assertIn('requests_total{status="200"} 5', text)
+        self.assertIn('requests_total{status="404"} 1', text)
+
+    def test_disabled(self):
+        registry = Registry()
+        registry.counter('requests_total', 'Requests')
+        registry.enabled = False
+        registry.inc('requests_total')
+        self.assertEqual(registry.collect(), {})
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_metrics.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class MetricsIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        driver = Driver("metricsdriver", "metricspass")
+        route = Route("Metrics Route", 5, Area("Metrics North"), Area("Metrics South"))
+        bus = Bus("MET1", driver, route)
+        db.session.add_all([driver, route, bus, Journey(driver, route, bus, datetime.utcnow())])
+        db.session.commit()
+        cls.route_id = route.id
+
+    def test_request_metrics(self):
+        metrics.reset()
+        client = current_app.test_client()
+        client.get(f'/api/routes/{self.route_id}')
+        client.get(f'/api/routes/{self.route_id}')
+        text = client.get('/metrics').get_data(as_text=True)
+        self.assertIn('http_requests_total{endpoint="index_views.get_route_api",method="GET",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint="index_views.get_route_api",method="GET"} 2', text)
+        self.assertIn('http_request_queries_count{endpoint="index_views.get_route_api"} 2', text)
+        self.assertIn('cache_requests_total{cache="etag",result="miss"} 2', text)
+        self.assertIn('active_journeys 1', text)
+        # Scrapes are not counted
+        self.assertNotIn('endpoint="metrics"', text)
+
+    def test_ors_errors(self):
+        metrics.reset()
+        class FailingClient:
+            def directions(self, **kwargs):
+                raise ValueError("quota exceeded")
+        ors._clients['failing'] = FailingClient()
+        with self.assertRaises(ValueError):
+            ors.directions([[-61.3, 10.5], [-61.4, 10.6]], key='failing')
+        del ors._clients['failing']
+        text = metrics.render()
+        self.assertIn('ors_errors_total{operation="directions"} 1', text)
+        self.assertIn('ors_request_duration_seconds_count{operation="directions"} 1', text)
+
+    def test_overhead_benchmark(self):
+        result = benchmark_metrics_overhead(current_app.test_client(), [f'/api/routes/{self.route_id}'], rounds=2, requests=5)
+        self.assertEqual(result['requests'], 10)
+        self.assertGreater(result['off_ms'], 0)
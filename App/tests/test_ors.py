@@ -0,0 +1,106 @@
+import threading, time, unittest
+
+from App import ors
+from App.config import config
+
+class FakeClient:
+    """Answers matrices with distance = 1000 * destination lng - source lng, duration a tenth of it"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def distance_matrix(self, locations, sources, destinations, **kwargs):
+        self.calls.append((len(sources), len(destinations)))
+        if self.error:
+            raise self.error
+        distances = [[1000 * locations[d][0] - locations[s][0] for d in destinations] for s in sources]
+        return {'distances': distances, 'durations': [[value / 10 for value in row] for row in distances]}
+
+def rows_at_once(requests):
+    results, errors = [None] * len(requests), []
+    def call(i, source, destinations):
+        try:
+            results[i] = ors.matrix_row(source, destinations, key='fake')
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=call, args=(i,) + request) for i, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+'''
+   Unit Tests
+'''
+class MatrixBatchUnitTests(unittest.TestCase):
+
+    def setUp(self):
+        config['ORS_BATCH_WINDOW'] = 0.05
+
+    def tearDown(self):
+        config.pop('ORS_BATCH_WINDOW', None)
+        config.pop('ORS_MATRIX_MAX_CELLS', None)
+        config.pop('ORS_TIMEOUT', None)
+        ors._clients.pop('fake', None)
+
+    def use(self, client):
+        ors._clients['fake'] = client
+        return client
+
+    def test_rows_share_one_call(self):
+        client = self.use(FakeClient())
+        requests = [([1, 0], [[5, 0], [6, 0]]), ([2, 0], [[6, 0]]), ([1, 0], [[7, 0], [5, 0]])]
+        results, errors = rows_at_once(requests)
+        self.assertEqual(errors, [])
+        # Two distinct sources by three distinct destinations in a single call
+        self.assertEqual(client.calls, [(2, 3)])
+        self.assertEqual(results[0], {'distances': [4999, 5999], 'durations': [499.9, 599.9]})
+        self.assertEqual(results[1]['distances'], [5998])
+        self.assertEqual(results[2]['distances'], [6999, 4999])
+
+    def test_size_limit(self):
+        config['ORS_MATRIX_MAX_CELLS'] = 4
+        client = self.use(FakeClient())
+        requests = [([i, 0], [[10 + i, 0], [20 + i, 0]]) for i in range(4)]
+        results, errors = rows_at_once(requests)
+        self.assertEqual(errors, [])
+        self.assertGreater(len(client.calls), 1)
+        self.assertTrue(all(sources * destinations <= 4 for sources, destinations in client.calls))
+        for i, result in enumerate(results):
+            self.assertEqual(result['distances'], [1000 * (10 + i) - i, 1000 * (20 + i) - i])
+
+    def test_error_reaches_every_row(self):
+        self.use(FakeClient(RuntimeError("quota exceeded")))
+        results, errors = rows_at_once([([1, 0], [[2, 0]]), ([3, 0], [[4, 0]])])
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+    def test_stuck_call_times_out(self):
+        config['ORS_BATCH_WINDOW'] = 0.5
+        config['ORS_TIMEOUT'] = 0.1
+        answered = threading.Event()
+        class StuckClient(FakeClient):
+            def distance_matrix(self, **kwargs):
+                answered.wait(5)
+                return super().distance_matrix(**kwargs)
+        self.use(StuckClient())
+        results = []
+        leader = threading.Thread(target=lambda: results.append(ors.matrix_row([1, 0], [[2, 0]], key='fake')))
+        leader.start()
+        while 'fake' not in ors._batches:
+            time.sleep(0.001)
+        try:
+            with self.assertRaises(ors.api_error()):
+                ors.matrix_row([3, 0], [[4, 0]], key='fake')
+        finally:
+            answered.set()
+            leader.join()
+        self.assertEqual(results[0]['distances'], [1999])
+
+    def test_without_window(self):
+        config['ORS_BATCH_WINDOW'] = 0
+        client = self.use(FakeClient())
+        self.assertEqual(ors.matrix_row([1, 0], [[2, 0]], key='fake')['durations'], [199.9])
+        self.assertEqual(client.calls, [(1, 1)])
@@ -0,0 +1,132 @@
+import json, pytest, unittest
+from datetime import datetime, timedelta
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, Schedule, ServiceCalendar, TripPattern
+from App.models.Location import LocationType
+from App.controllers import planner
+from App.controllers.planner import TransitNetwork, MIN_TRANSFER_TIME, benchmark_planner, plan_journey
+
+'''
+   Unit Tests
+'''
+class TransitNetworkUnitTests(unittest.TestCase):
+
+    def setUp(self):
+        # Stops 1-2-3 on route 10, 3-4 on route 20, stop 5 is a short walk from stop 4
+        self.network = TransitNetwork()
+        self.network.add_location(1, "One", 10.00, -61.0)
+        self.network.add_location(2, "Two", 10.05, -61.0)
+        self.network.add_location(3, "Three", 10.10, -61.0)
+        self.network.add_location(4, "Four", 10.20, -61.0)
+        self.network.add_location(5, "Five", 10.2018, -61.0)
+        for start in (3600, 7200):
+            self.network.add_trip(10, 10, [1, 2, 3], [(start, start), (start + 600, start + 600), (start + 1200, start + 1200)])
+        for start in (4800 + MIN_TRANSFER_TIME - 1, 4800 + MIN_TRANSFER_TIME, 6000):
+            self.network.add_trip(20, 20, [3, 4], [(start, start), (start + 900, start + 900)])
+        self.network.finalize()
+
+    def test_single_route(self):
+        arrival, legs = self.network.plan(1, 3, 3000)
+        self.assertEqual(arrival, 4800)
+        self.assertEqual([leg['type'] for leg in legs], ['ride'])
+
+    def test_transfer_respects_change_time(self):
+        arrival, legs = self.network.plan(1, 4, 3000)
+        self.assertEqual(arrival, 4800 + MIN_TRANSFER_TIME + 900)
+        self.assertEqual([(leg['route_id'], leg['from_stop'], leg['to_stop']) for leg in legs], [(10, 1, 3), (20, 3, 4)])
+
+    def test_walking_transfer(self):
+        arrival, legs = self.network.plan(1, 5, 3000)
+        self.assertEqual([leg['type'] for leg in legs], ['ride', 'ride', 'walk'])
+        self.assertGreater(arrival, legs[1]['arrival'])
+
+    def test_no_journey(self):
+        self.assertIsNone(self.network.plan(4, 1, 3000))
+        self.assertIsNone(self.network.plan(1, 4, 3000, max_transfers=0))
+
+    def test_overtaking_trips_split(self):
+        network = TransitNetwork()
+        network.add_location(1, "One", 10.0, -61.0)
+        network.add_location(2, "Two", 10.1, -61.0)
+        network.add_trip(1, 1, [1, 2], [(0, 0), (3000, 3000)])
+        network.add_trip(1, 1, [1, 2], [(600, 600), (1200, 1200)])
+        network.finalize()
+        self.assertEqual(len(network.patterns), 2)
+        self.assertEqual(network.plan(1, 2, 0)[0], 1200)
+
+    def test_benchmark(self):
+        result = benchmark_planner(stops=400, routes=40, queries=20)
+        self.assertEqual(result['queries'], 20)
+        self.assertGreater(result['found'], 0)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_planner.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class PlannerIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Route A runs Couva -> Chaguanas on a pattern, route B runs Chaguanas -> Port of Spain from schedule rows
+        start, end = Area("South"), Area("North")
+        cls.route_a = Route("Couva - Chaguanas", 5, start, end)
+        cls.route_b = Route("Chaguanas - POS", 5, start, end)
+        cls.couva = Location("Couva", 10.42, -61.41, LocationType.Terminal)
+        cls.chaguanas = Location("Chaguanas", 10.52, -61.41, LocationType.Terminal)
+        cls.pos = Location("Port of Spain", 10.65, -61.51, LocationType.Terminal)
+        stops_a = [RouteStop(cls.route_a, cls.couva, 0), RouteStop(cls.route_a, cls.chaguanas, 1)]
+        stops_b = [RouteStop(cls.route_b, cls.chaguanas, 0), RouteStop(cls.route_b, cls.pos, 1)]
+
+        daily = ServiceCalendar("Daily")
+        pattern = TripPattern("Half hourly", cls.route_a, daily)
+        pattern.add_stop(stops_a[0], 0)
+        pattern.add_stop(stops_a[1], 20 * 60)
+        pattern.add_frequency(6 * 3600, 20 * 3600, 30 * 60)
+
+        cls.day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        leaves = cls.day + timedelta(hours=7, minutes=30)
+        db.session.add_all([
+            start, end, cls.route_a, cls.route_b, cls.couva, cls.chaguanas, cls.pos, daily, pattern,
+            Schedule(cls.chaguanas, cls.route_b, leaves, leaves),
+            Schedule(cls.pos, cls.route_b, leaves + timedelta(minutes=40), leaves + timedelta(minutes=40)),
+            # A second run of route B later in the day
+            Schedule(cls.chaguanas, cls.route_b, leaves + timedelta(hours=2), leaves + timedelta(hours=2)),
+            Schedule(cls.pos, cls.route_b, leaves + timedelta(hours=2, minutes=40), leaves + timedelta(hours=2, minutes=40))
+        ] + stops_a + stops_b)
+        db.session.commit()
+        planner._networks.clear()
+
+    def test_plan_with_transfer(self):
+        plan = plan_journey(self.couva.id, self.pos.id, self.day + timedelta(hours=6, minutes=45))
+        self.assertEqual(plan['transfers'], 1)
+        self.assertEqual(plan['arrival'], (self.day + timedelta(hours=8, minutes=10)).isoformat())
+        self.assertEqual([leg['route_name'] for leg in plan['legs']], ["Couva - Chaguanas", "Chaguanas - POS"])
+        self.assertEqual(plan['legs'][0]['departure'], (self.day + timedelta(hours=7)).isoformat())
+
+    def test_schedule_rows_split_into_trips(self):
+        plan = plan_journey(self.chaguanas.id, self.pos.id, self.day + timedelta(hours=8))
+        self.assertEqual(plan['arrival'], (self.day + timedelta(hours=10, minutes=10)).isoformat())
+        # Route B only runs towards Port of Spain, its runs do not join into a loop back
+        self.assertIsNone(plan_journey(self.pos.id, self.chaguanas.id, self.day + timedelta(hours=8)))
+
+    def test_plan_api(self):
+        client = current_app.test_client()
+        depart = (self.day + timedelta(hours=6, minutes=45)).isoformat()
+        response = client.get(f'/api/plan?from={self.couva.id}&to={self.chaguanas.id}&depart={depart}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['legs'][0]['to_stop']['name'], "Chaguanas")
+
+        response = client.get(f'/api/plan?from={self.pos.id}&to={self.couva.id}&depart={depart}')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(client.get('/api/plan?from=1').status_code, 400)
@@ -0,0 +1,129 @@
+import os, pytest, tempfile, threading, time, unittest
+from flask import current_app
+from flask_jwt_extended import create_access_token
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import User
+from App.config import config
+from App.profiler import Sampler, collapse
+import App.profiler as profiler
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+'''
+   Unit Tests
+'''
+class SamplerUnitTests(unittest.TestCase):
+
+    def test_collapse(self):
+        def outer():
+            return inner()
+        def inner():
+            import sys
+            return collapse(sys._getframe())
+        stack = outer()
+        frames = stack.split(';')
+        self.assertIn('test_collapse.<locals>.outer (App/tests/test_profiler.py:', frames[-2])
+        self.assertIn('test_collapse.<locals>.inner (', frames[-1])
+
+    def test_samples_one_thread(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        try:
+            sampler = Sampler(0.001, worker.ident).start(0.1)
+            time.sleep(0.2)
+        finally:
+            stop.set()
+            worker.join()
+        self.assertFalse(sampler.running)
+        self.assertGreater(sampler.samples, 10)
+        self.assertTrue(all('busy_loop' in stack for stack in sampler.stacks))
+        line = sampler.collapsed().splitlines()[0]
+        self.assertTrue(line.rsplit(' ', 1)[1].isdigit())
+
+    def test_samples_one_greenlet(self):
+        greenlet = pytest.importorskip('greenlet')
+        def waiting_greenlet():
+            greenlet.getcurrent().parent.switch()
+        target = greenlet.greenlet(waiting_greenlet)
+        target.switch()
+        try:
+            # The thread keeps running other code while the profiled greenlet is switched out
+            sampler = Sampler(0.001, threading.get_ident(), greenlet=target).start(0.05)
+            stop = time.monotonic() + 0.1
+            while time.monotonic() < stop:
+                sum(range(1000))
+        finally:
+            target.switch()
+        self.assertGreater(sampler.samples, 5)
+        self.assertTrue(sampler.stacks)
+        self.assertTrue(all('waiting_greenlet' in stack for stack in sampler.stacks))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_profiler.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class ProfilerIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        db.session.add_all([User("profadmin", "profpass", is_admin=True), User("profuser", "profpass")])
+        db.session.commit()
+
+    def client(self, username):
+        client = current_app.test_client()
+        client.set_cookie('access_token', create_access_token(identity=username))
+        return client
+
+    def test_admin_only(self):
+        self.assertEqual(self.client("profuser").post('/admin/profile?seconds=0.1').status_code, 401)
+        response = self.client("profuser").get('/health', headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile-Samples', response.headers)
+
+    def test_worker_profile(self):
+        client = self.client("profadmin")
+        with tempfile.TemporaryDirectory() as directory:
+            config['PROFILE_DIR'] = directory
+            try:
+                response = client.post('/admin/profile?seconds=0.2&interval_ms=2&wait=1')
+            finally:
+                config.pop('PROFILE_DIR')
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(int(response.headers['X-Profile-Samples']), 10)
+            self.assertTrue(os.path.exists(response.headers['X-Profile-Path']))
+        # The finished profile stays available to later requests
+        self.assertEqual(client.get('/admin/profile').get_data(), response.get_data())
+
+        profiler.start_profile(5)
+        try:
+            self.assertEqual(client.post('/admin/profile?seconds=1').status_code, 409)
+            self.assertEqual(client.get('/admin/profile').status_code, 202)
+        finally:
+            profiler.current_profile().stop()
+
+    def test_profile_limits(self):
+        client = self.client("profadmin")
+        for seconds in ('0', '-1', '121', 'nan'):
+            self.assertEqual(client.post(f'/admin/profile?seconds={seconds}&wait=1').status_code, 400)
+        response = client.post('/admin/profile?seconds=0.05&interval_ms=0')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['interval_ms'], 1)
+        profiler.current_profile().stop()
+
+    def test_request_profile(self):
+        response = self.client("profadmin").get('/api/stops/search?q=a', headers={'X-Profile': '1'})
+        self.assertEqual(response.headers['X-Profile-Status'], '200')
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertGreater(int(response.headers['X-Profile-Samples']), 0)
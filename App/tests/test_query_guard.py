@@ -0,0 +1,102 @@
+import json, pytest, unittest
+from datetime import datetime, timedelta
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, Bus, Journey, JourneyEvent, BoardEvent
+from App.models.User import Driver
+from App.models.BoardEvent import BoardType
+from App.models.Location import LocationType
+from App.query_guard import statement_shape, track_queries, assert_max_queries
+
+'''
+   Unit Tests
+'''
+class QueryGuardUnitTests(unittest.TestCase):
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            statement_shape("SELECT *\n  FROM route WHERE id = 12 AND name = 'it''s' AND stop_id IN (?, ?, ?)"),
+            "SELECT * FROM route WHERE id = ? AND name = ? AND stop_id IN (?)"
+        )
+        self.assertEqual(statement_shape("SELECT * FROM bus WHERE id = %(id_1)s"), statement_shape("SELECT * FROM bus WHERE id = :id_1"))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_query_guard.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class QueryBudgetIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Three routes through the same six stops, and a bus on each between its first two stops
+        north, south = Area("North"), Area("South")
+        cls.stops = [Location(f"Guard Stop {n}", 10.5 + n / 100, -61.3, LocationType.Stop) for n in range(6)]
+        cls.driver = Driver("guarddriver", "guardpass")
+        db.session.add_all([north, south, cls.driver] + cls.stops)
+        cls.routes = []
+        start = datetime.utcnow() - timedelta(minutes=10)
+        for n in range(3):
+            route = Route(f"Guard Route {n}", 5, north, south)
+            for index, stop in enumerate(cls.stops):
+                route.stops.append(RouteStop(route, stop, index))
+            db.session.add(route)
+            cls.routes.append(route)
+            for m in range(2):
+                bus = Bus(f"GRD{n}{m}", cls.driver, route)
+                journey = Journey(cls.driver, route, bus, start)
+                db.session.add_all([bus, journey])
+                db.session.flush()
+                journey.events.append(JourneyEvent(journey, 10.505, -61.3))
+                journey.board_events.append(BoardEvent(journey, BoardType.Enter, 2, route.stops[0], start))
+        db.session.commit()
+        cls.driver_id = cls.driver.id
+        cls.route_id = cls.routes[0].id
+
+    def test_search_stops_budget(self):
+        client = current_app.test_client()
+        with assert_max_queries(4, repeat_threshold=3):
+            response = client.get('/api/stops/search?q=Guard Stop')
+        result = json.loads(response.data)
+        self.assertEqual(len(result), 6)
+        self.assertEqual([route['name'] for route in result[0]['routes']], ["Guard Route 0", "Guard Route 1", "Guard Route 2"])
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+
+    def test_get_buses_budget(self):
+        db.session.remove()
+        location = Location.query.filter_by(name="Guard Stop 1").first()
+        with assert_max_queries(7, repeat_threshold=3):
+            buses = location.getBuses(self.route_id)
+            plates = sorted(info['bus'].plate_num for info in buses)
+        self.assertEqual(plates, ["GRD00", "GRD01"])
+        self.assertEqual(buses[0]['lat'], 10.505)
+
+    def test_driver_journeys_budget(self):
+        db.session.remove()
+        with assert_max_queries(1):
+            journeys = Journey.get_journeys_for_driver(self.driver_id)
+            names = {(journey.route.name, journey.route.start_area.name, journey.route.end_area.name) for journey in journeys}
+        self.assertEqual(len(journeys), 6)
+        self.assertEqual(len(names), 3)
+
+    def test_budget_exceeded(self):
+        db.session.remove()
+        with self.assertRaises(AssertionError) as raised:
+            with assert_max_queries(20, repeat_threshold=3):
+                for route in Route.query.all():
+                    route.start_area.name
+                    [stop.location.name for stop in route.stops]
+        self.assertIn("N+1 candidate", str(raised.exception))
+
+        with track_queries() as outer:
+            current_app.test_client().get('/api/stops/search?q=Guard')
+        self.assertGreater(outer.count, 0)
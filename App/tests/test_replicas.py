@@ -0,0 +1,136 @@
+import json, threading, time, pytest, unittest
+from unittest.mock import patch
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+
+from App.main import create_app
+from App.config import config
+from App.database import db, create_db, replica_bind, get_replica_engines
+from App.models import Route, Area, DataVersion
+from App.replicas import read_only, replica_status, reset_replica_status, healthy, PIN_COOKIE
+from App.versioning import expire_versions
+
+'''
+   Unit Tests
+'''
+class ReplicaUnitTests(unittest.TestCase):
+
+    def test_healthy(self):
+        self.assertFalse(healthy({'reachable': False, 'versions_behind': None, 'seconds': None}))
+        self.assertTrue(healthy({'reachable': True, 'versions_behind': 3, 'seconds': None}))
+        self.assertFalse(healthy({'reachable': True, 'versions_behind': 3, 'seconds': 3600}))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_replicas.db',
+        'SQLALCHEMY_REPLICAS': 'sqlite:///test_replicas_replica.db'
+    })
+    create_db()
+    # Replication would copy the schema, here the replica gets it directly
+    db.metadata.create_all(get_replica_engines()['replica_1'])
+    yield app.test_client()
+    db.drop_all()
+    db.metadata.drop_all(get_replica_engines()['replica_1'])
+
+
+def replicate():
+    """Copy the primary's routes and data versions to the replica, as replication would"""
+    with db.engine.connect() as primary, get_replica_engines()['replica_1'].begin() as replica:
+        for table in (Area.__table__, Route.__table__, DataVersion.__table__):
+            rows = [dict(row._mapping) for row in primary.execute(select(table))]
+            replica.execute(delete(table))
+            if rows:
+                replica.execute(insert(table), rows)
+
+
+class ReplicaIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("North"), Area("South")
+        cls.route = Route("Arima - POS", 5, start, end)
+        db.session.add_all([start, end, cls.route])
+        db.session.commit()
+        cls.route_id = cls.route.id
+        replicate()
+        # Mark the replica's copy so tests can tell which database answered
+        with get_replica_engines()['replica_1'].begin() as replica:
+            replica.execute(update(Route.__table__).values(name="Arima - POS (replica)"))
+
+    def setUp(self):
+        reset_replica_status()
+        expire_versions()
+        db.session.remove()
+
+    def route_name(self, client):
+        return json.loads(client.get(f'/api/routes/{self.route_id}?fields=name').data)['name']
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.route_name(current_app.test_client()), "Arima - POS (replica)")
+        self.assertEqual(Route.query.get(self.route_id).name, "Arima - POS")
+
+    def test_read_only_controller(self):
+        @read_only
+        def route_name():
+            self.assertEqual(replica_bind.get(), 'replica_1')
+            return db.session.execute(select(Route.name).where(Route.id == self.route_id)).scalar()
+        self.assertEqual(route_name(), "Arima - POS (replica)")
+        self.assertIsNone(replica_bind.get())
+
+    def test_lag_is_observable(self):
+        status = replica_status(refresh=True)[0]
+        self.assertEqual((status['bind'], status['reachable'], status['versions_behind']), ('replica_1', True, 0))
+
+        db.session.add(Area("Central"))
+        db.session.commit()
+        status = replica_status(refresh=True)[0]
+        self.assertEqual(status['versions_behind'], 1)
+        response = current_app.test_client().get('/health/db')
+        self.assertEqual(json.loads(response.data)['replicas'][0]['versions_behind'], 1)
+
+        config['REPLICA_MAX_VERSIONS_BEHIND'] = 0
+        try:
+            reset_replica_status()
+            self.assertEqual(self.route_name(current_app.test_client()), "Arima - POS")
+        finally:
+            config.pop('REPLICA_MAX_VERSIONS_BEHIND')
+
+    def test_stale_lag_measured_in_background(self):
+        first = replica_status()[0]
+        measured = threading.Event()
+        def slow_measure(key):
+            measured.wait(5)
+            return dict(first, checked=time.time(), versions_behind=7)
+        config['REPLICA_CHECK_INTERVAL'] = 0
+        try:
+            with patch('App.replicas.measure_lag', side_effect=slow_measure):
+                started = time.perf_counter()
+                # The request gets the last measurement straight away while the probe runs
+                self.assertIs(replica_status()[0], first)
+                self.assertIs(replica_status()[0], first)
+                self.assertLess(time.perf_counter() - started, 1)
+                measured.set()
+                while replica_status()[0] is first:
+                    time.sleep(0.01)
+                self.assertEqual(replica_status()[0]['versions_behind'], 7)
+        finally:
+            config.pop('REPLICA_CHECK_INTERVAL')
+
+    def test_read_your_writes(self):
+        client = current_app.test_client()
+        response = client.post('/api/users', json={'username': 'rider', 'password': 'ridepass'})
+        self.assertEqual(response.status_code, 200)
+        pin = client.get_cookie(PIN_COOKIE)
+        self.assertGreater(float(pin.value), time.time())
+        # The writer reads from the primary, everyone else from the replica
+        self.assertEqual(self.route_name(client), "Arima - POS")
+        self.assertEqual(self.route_name(current_app.test_client()), "Arima - POS (replica)")
+
+        client.set_cookie(PIN_COOKIE, str(int(time.time()) - 1))
+        self.assertEqual(self.route_name(client), "Arima - POS (replica)")
@@ -0,0 +1,73 @@
+import json, pytest, unittest
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, RouteSegment
+from App.models.Location import LocationType, haversine, ROAD_FACTOR, AVG_BUS_SPEED
+from App.controllers.route import (
+    build_segment_matrix,
+    get_route_stops,
+    get_travel_estimate,
+    save_route_geometry
+)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def client():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_route.db',
+                      'OPENROUTE_SERVICE_KEY': ''})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class RouteSegmentIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("Segment Route", 5, start, end)
+        cls.geo_route = Route("Geometry Route", 5, start, end)
+        cls.locations = [
+            Location("A", 10.0, -61.0, LocationType.Terminal),
+            Location("B", 10.1, -61.0, LocationType.Stop),
+            Location("C", 10.2, -61.1, LocationType.Terminal)
+        ]
+        stops = [RouteStop(cls.route, location, index) for index, location in enumerate(cls.locations)]
+        stops += [RouteStop(cls.geo_route, location, index) for index, location in enumerate(cls.locations)]
+        db.session.add_all([start, end, cls.route, cls.geo_route] + cls.locations + stops)
+        db.session.commit()
+
+        directions = {'type': 'FeatureCollection', 'features': [{'properties': {'segments': [
+            {'distance': 12000, 'duration': 900},
+            {'distance': 16000, 'duration': 1200}
+        ]}}]}
+        save_route_geometry(cls.geo_route.id, get_route_stops(cls.geo_route.id), directions)
+        build_segment_matrix()
+
+    def test_fallback_segments(self):
+        a, b, c = self.locations
+        first = haversine(a.lat, a.lng, b.lat, b.lng) * ROAD_FACTOR
+        second = haversine(b.lat, b.lng, c.lat, c.lng) * ROAD_FACTOR
+        segments = RouteSegment.query.filter_by(route_id=self.route.id).order_by(RouteSegment.stop_index).all()
+        self.assertEqual([s.source for s in segments], ['origin', 'fallback', 'fallback'])
+        self.assertAlmostEqual(segments[2].cum_distance, first + second)
+        self.assertAlmostEqual(segments[2].cum_time, (first + second) / AVG_BUS_SPEED)
+
+    def test_prefix_sum_estimate(self):
+        self.assertEqual(get_travel_estimate(self.geo_route.id, 1, 2), (16000, 1200))
+        self.assertEqual(get_travel_estimate(self.geo_route.id, 0, 2), (28000, 2100))
+        self.assertIsNone(get_travel_estimate(self.geo_route.id, 0, 7))
+
+    def test_stored_geometry_served_without_ors(self):
+        client = current_app.test_client()
+        response = client.get(f'/api/route-directions/{self.geo_route.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['features'][0]['properties']['segments'][1]['duration'], 1200)
+
+        response = client.get(f'/api/route-directions/{self.route.id}')
+        self.assertEqual(response.status_code, 500)
@@ -0,0 +1,140 @@
+import csv, json, os, pytest, random, tempfile, unittest
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.config import config
+from App.models import Route, Area, Location, RouteStop
+from App.models.Location import LocationType
+from App.controllers.route import _geometry_legs
+from App.routing import RoadGraph, OfflineRouter, RoutingError, load_graph, synthetic_road_graph, _dijkstra
+from App import ors
+
+SPACING = 0.002
+
+def write_grid(path, size=10):
+    """A size x size grid of two-way 30 km/h streets, plus a one-way street off its corner"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['from_lng', 'from_lat', 'to_lng', 'to_lat', 'speed', 'oneway'])
+        for row in range(size):
+            for col in range(size):
+                lng, lat = -61.5 + col * SPACING, 10.6 + row * SPACING
+                if col + 1 < size:
+                    writer.writerow([lng, lat, lng + SPACING, lat, 30, 0])
+                if row + 1 < size:
+                    writer.writerow([lng, lat, lng, lat + SPACING, 30, 0])
+        writer.writerow([-61.5, 10.6, -61.5 - SPACING, 10.6, 30, 1])
+
+'''
+   Unit Tests
+'''
+class RoadGraphUnitTests(unittest.TestCase):
+
+    def test_alt_matches_dijkstra(self):
+        graph = synthetic_road_graph(30, 30, seed=2).prepare(6)
+        rng = random.Random(0)
+        for _ in range(100):
+            source, target = rng.randrange(len(graph)), rng.randrange(len(graph))
+            with_landmarks, without = graph.route(source, target), graph.route(source, target, landmarks=False)
+            self.assertEqual(with_landmarks is None, without is None)
+            if without:
+                self.assertAlmostEqual(with_landmarks[0], without[0], places=2)
+                self.assertAlmostEqual(graph.table(source, [target])[0][0], without[0], places=2)
+                self.assertEqual((with_landmarks[2][0], with_landmarks[2][-1]), (source, target))
+
+    def test_landmark_bounds_admissible(self):
+        graph = synthetic_road_graph(30, 30, seed=2).prepare(6)
+        rng = random.Random(1)
+        for _ in range(10):
+            source, target = rng.randrange(len(graph)), rng.randrange(len(graph))
+            bound = graph._bound(source, target)
+            to_target = _dijkstra(graph.reverse_first, graph.reverse_head, graph.reverse_seconds, target)
+            # Never above the real time, or ALT can settle a node before its fastest path
+            self.assertEqual([node for node in range(len(graph)) if bound(node) > to_target[node]], [])
+
+    def test_one_way_streets(self):
+        graph = RoadGraph.from_edges([(0, 0, 0.001, 0, 100, 10, True), (0.001, 0, 0.002, 0, 100, 10, False)]).prepare()
+        start, middle, end = (graph.snap(lng, 0) for lng in (0, 0.001, 0.002))
+        self.assertEqual(graph.route(start, end)[:2], (20, 200))
+        self.assertIsNone(graph.route(end, start))
+        self.assertEqual(graph.table(middle, [end, start, middle]), [(10, 100), None, (0, 0)])
+
+    def test_snap_radius(self):
+        graph = synthetic_road_graph(5, 5)
+        self.assertIsNotNone(graph.snap(-61.5 + SPACING * 0.4, 10.6))
+        self.assertIsNone(graph.snap(-61.4, 10.6))
+
+    def test_router_answers_like_ors(self):
+        router = OfflineRouter(synthetic_road_graph(20, 20, seed=1).prepare(4))
+        stops = [[-61.5, 10.6], [-61.49, 10.61], [-61.47, 10.62]]
+        geojson = router.directions(coordinates=stops, profile='driving-car', format='geojson')
+        legs = _geometry_legs(json.dumps(geojson), len(stops))
+        self.assertEqual(len(legs), 2)
+        self.assertTrue(all(meters > 0 and seconds > 0 for meters, seconds in legs))
+        line = geojson['features'][0]['geometry']['coordinates']
+        self.assertEqual((line[0], line[-1]), ([-61.5, 10.6], [-61.47, 10.62]))
+
+        matrix = router.distance_matrix(locations=stops, sources=[0], destinations=[1, 2], metrics=['distance', 'duration'])
+        self.assertEqual([round(value) for value in matrix['distances'][0]], [round(meters) for meters, _ in legs[:1]] + [round(sum(meters for meters, _ in legs))])
+        with self.assertRaises(RoutingError):
+            router.directions([[-61.5, 10.6], [-60.0, 11.0]])
+
+    def test_prepared_graph_reused(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'roads.csv')
+            write_grid(path, 4)
+            graph = load_graph(path, landmarks=3)
+            self.assertEqual((len(graph), len(graph.landmarks)), (17, 3))
+            self.assertTrue(os.path.exists(path + '.prepared'))
+            self.assertEqual(load_graph(path, landmarks=3).landmarks, graph.landmarks)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'roads.csv')
+        write_grid(path)
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_routing.db',
+                          'ROUTING_ENGINE': 'offline', 'ROUTING_GRAPH': path})
+        create_db()
+        yield app.test_client()
+        db.drop_all()
+        for key in ('ROUTING_ENGINE', 'ROUTING_GRAPH'):
+            config.pop(key, None)
+
+
+class RoutingIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Grid West"), Area("Grid East")
+        route = Route("Grid Route", 5, start, end)
+        locations = [Location(f"Grid Stop {index}", 10.6 + index * 2 * SPACING, -61.5 + index * SPACING, LocationType.Stop)
+                     for index in range(4)]
+        stops = [RouteStop(route, location, index) for index, location in enumerate(locations)]
+        db.session.add_all([start, end, route] + locations + stops)
+        db.session.commit()
+        cls.route_id = route.id
+
+    def test_route_directions_without_key(self):
+        client = current_app.test_client()
+        response = client.get(f'/api/route-directions/{self.route_id}')
+        self.assertEqual(response.status_code, 200)
+        feature = json.loads(response.data)['features'][0]
+        self.assertEqual(len(feature['properties']['segments']), 3)
+        # One block east and two north between stops, 600m of 30 km/h streets
+        self.assertAlmostEqual(feature['properties']['segments'][0]['distance'], 3 * SPACING * 111320, delta=20)
+        self.assertAlmostEqual(feature['properties']['segments'][0]['duration'], 3 * SPACING * 111320 / (30 / 3.6), delta=5)
+
+    def test_matrix_rows(self):
+        row = ors.matrix_row([-61.5, 10.6], [[-61.5 + SPACING, 10.6], [-61.5 - SPACING, 10.6]])
+        self.assertEqual(len(row['distances']), 2)
+        self.assertLess(row['durations'][0], 30)
+        # The one-way street leads away from the grid
+        self.assertIsNone(ors.matrix_row([-61.5 - SPACING, 10.6], [[-61.5, 10.6]])['durations'][0])
+        with self.assertRaises(ors.api_error()):
+            ors.matrix_row([-61.0, 11.0], [[-61.5, 10.6]])
@@ -0,0 +1,122 @@
+import pytest, unittest
+from datetime import datetime, date, timedelta
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, Schedule, ServiceCalendar, TripPattern, FrequencyBlock
+from App.models.Location import LocationType
+from App.controllers.schedule import get_stop_timetable, compact_schedules
+
+'''
+   Unit Tests
+'''
+class ServicePatternUnitTests(unittest.TestCase):
+
+    def test_calendar_runs_on(self):
+        weekdays = ServiceCalendar("Weekdays", "1111100", start_date=date(2024, 1, 1))
+        self.assertTrue(weekdays.runs_on(date(2024, 1, 5)))   # Friday
+        self.assertFalse(weekdays.runs_on(date(2024, 1, 6)))  # Saturday
+        self.assertFalse(weekdays.runs_on(date(2023, 12, 29)))
+
+    def test_frequency_block_only_walks_window(self):
+        block = FrequencyBlock(6 * 3600, 10 * 3600, 600)
+        starts = list(block.starts_between(7 * 3600 + 1, 8 * 3600))
+        self.assertEqual(starts[0], 7 * 3600 + 600)
+        self.assertEqual(starts[-1], 8 * 3600)
+        self.assertEqual(len(starts), 6)
+
+    def test_invalid_frequency_block(self):
+        with self.assertRaises(ValueError):
+            FrequencyBlock(3600, 7200, 0)
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_schedule.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class ServicePatternIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("Pattern Route", 5, start, end)
+        cls.stop_a = Location("Stop A", 1.0, 1.0, LocationType.Terminal)
+        cls.stop_b = Location("Stop B", 1.1, 1.1, LocationType.Stop)
+        cls.rs_a = RouteStop(cls.route, cls.stop_a, 0)
+        cls.rs_b = RouteStop(cls.route, cls.stop_b, 1)
+
+        weekdays = ServiceCalendar("Weekdays", "1111100")
+        pattern = TripPattern("Every 15 minutes", cls.route, weekdays)
+        pattern.add_stop(cls.rs_a, 0, 60)
+        pattern.add_stop(cls.rs_b, 20 * 60)
+        pattern.add_frequency(6 * 3600, 22 * 3600, 15 * 60)
+
+        db.session.add_all([start, end, cls.route, cls.stop_a, cls.stop_b, cls.rs_a, cls.rs_b, weekdays, pattern])
+        db.session.commit()
+
+    def test_timetable_expands_window(self):
+        monday = datetime(2024, 1, 8, 7, 0)
+        times = get_stop_timetable(self.stop_b.id, self.route.id, monday, hours=1)
+        self.assertEqual([t.arrivalTime.strftime('%H:%M') for t in times], ['07:05', '07:20', '07:35', '07:50'])
+
+    def test_timetable_respects_calendar(self):
+        saturday = datetime(2024, 1, 13, 7, 0)
+        self.assertEqual(get_stop_timetable(self.stop_b.id, self.route.id, saturday, hours=1), [])
+
+    def test_get_schedule_reads_through_adapter(self):
+        schedule = self.stop_b.getSchedule(self.route.id, datetime(2024, 1, 8, 7, 12))
+        self.assertEqual(schedule.arrivalTime, datetime(2024, 1, 8, 7, 5))
+        self.assertEqual(schedule.departureTime, datetime(2024, 1, 8, 7, 5))
+
+    def test_compact_schedules(self):
+        start, end = Area("Legacy Start"), Area("Legacy End")
+        route = Route("Legacy Route", 5, start, end)
+        first = Location("Legacy A", 2.0, 2.0, LocationType.Terminal)
+        second = Location("Legacy B", 2.1, 2.1, LocationType.Stop)
+        departure = datetime(2024, 1, 8, 9, 30)
+        db.session.add_all([
+            start, end, route, first, second,
+            RouteStop(route, first, 0), RouteStop(route, second, 1),
+            Schedule(first, route, departure, departure + timedelta(minutes=5)),
+            Schedule(second, route, departure + timedelta(minutes=25), departure + timedelta(minutes=27))
+        ])
+        db.session.commit()
+
+        self.assertEqual(compact_schedules(), 1)
+        self.assertEqual(Schedule.query.filter_by(route_id=route.id).count(), 0)
+
+        schedule = second.getSchedule(route.id, datetime(2024, 1, 10, 10, 0))
+        self.assertEqual(schedule.arrivalTime, datetime(2024, 1, 10, 9, 55))
+        self.assertEqual(schedule.departureTime, datetime(2024, 1, 10, 9, 57))
+
+    def test_compact_schedules_trips(self):
+        start, end = Area("Twice Start"), Area("Twice End")
+        route = Route("Twice Route", 5, start, end)
+        first = Location("Twice A", 3.0, 3.0, LocationType.Terminal)
+        second = Location("Twice B", 3.1, 3.1, LocationType.Stop)
+        elsewhere = Location("Not On Route", 3.2, 3.2, LocationType.Stop)
+        rows = []
+        # Two trips on Monday and the morning trip again on Tuesday, plus a row at a location off the route
+        for departure in (datetime(2024, 1, 8, 7, 0), datetime(2024, 1, 8, 17, 0), datetime(2024, 1, 9, 7, 0)):
+            rows += [Schedule(first, route, departure, departure),
+                     Schedule(second, route, departure + timedelta(minutes=20), departure + timedelta(minutes=20))]
+        stray = Schedule(elsewhere, route, datetime(2024, 1, 8, 8, 0), datetime(2024, 1, 8, 8, 0))
+        db.session.add_all([start, end, route, first, second, elsewhere,
+                            RouteStop(route, first, 0), RouteStop(route, second, 1), stray] + rows)
+        db.session.commit()
+
+        compact_schedules()
+        self.assertEqual(Schedule.query.filter_by(route_id=route.id).all(), [stray])
+        pattern, = TripPattern.query.filter_by(route_id=route.id).all()
+        self.assertEqual([(stop.stop_index, stop.arrival_offset) for stop in pattern.stops], [(0, 0), (1, 20 * 60)])
+        self.assertEqual([block.start_time for block in pattern.frequencies], [7 * 3600, 17 * 3600])
+
+        times = get_stop_timetable(second.id, route.id, datetime(2024, 1, 10, 0, 0), hours=24)
+        self.assertEqual([t.arrivalTime.strftime('%H:%M') for t in times], ['07:20', '17:20'])
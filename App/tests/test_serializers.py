@@ -0,0 +1,121 @@
+import json, pytest, unittest
+from flask import current_app
+from sqlalchemy import event
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, Bus, Schedule
+from App.models.User import Driver
+from App.models.Location import LocationType
+from App.serializers import serialize, serialize_many, query_for, parse_fields, get_serializer
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self)
+
+'''
+   Unit Tests
+'''
+class SerializerUnitTests(unittest.TestCase):
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields("id, name,,stops"), ('id', 'name', 'stops'))
+        self.assertIsNone(parse_fields(""))
+
+    def test_location_json(self):
+        location = Location("Couva", 10.42, -61.41, LocationType.Terminal)
+        self.assertEqual(location.get_json()['type'], "Terminal")
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_serializers.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+class SerializerIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        start, end = Area("Start"), Area("End")
+        cls.route = Route("Serialized Route", 5, start, end)
+        driver = Driver("serialdriver", "pass", False, "Serial Driver", "DL9")
+        objects = [start, end, cls.route, driver]
+        for index in range(20):
+            location = Location(f"Stop {index}", 10.0 + index * 0.01, -61.0, LocationType.Stop)
+            objects += [location, RouteStop(cls.route, location, index)]
+            objects.append(Schedule(location, cls.route, db.func.now(), db.func.now()))
+        for index in range(5):
+            objects.append(Bus(f"SER{index:03}", driver, cls.route, 40))
+        db.session.add_all(objects)
+        db.session.commit()
+        cls.route_id = cls.route.id
+
+    def setUp(self):
+        db.session.expunge_all()
+
+    def test_nested_json_does_not_recurse(self):
+        bus = Bus.query.filter_by(plate_num="SER000").first()
+        data = bus.get_json()
+        self.assertEqual(data['route'], {'id': self.route_id, 'name': "Serialized Route", 'cost': 5,
+                                         'start_area_id': data['route']['start_area_id'],
+                                         'end_area_id': data['route']['end_area_id']})
+        schedule = Schedule.query.first()
+        self.assertNotIn('buses', schedule.get_json()['route'])
+
+    def test_deep_route_in_fixed_queries(self):
+        with QueryCounter() as counter:
+            route = query_for(Route, 'deep').filter(Route.id == self.route_id).first()
+            data = serialize(route, 'deep')
+        self.assertEqual(len(data['stops']), 20)
+        self.assertEqual(data['stops'][3]['location']['name'], "Stop 3")
+        self.assertEqual(data['start_area']['name'], "Start")
+        self.assertLessEqual(counter.count, 2)
+
+    def test_field_selection_loads_only_selected(self):
+        with QueryCounter() as counter:
+            routes = query_for(Route, fields=('id', 'buses')).all()
+            data = serialize_many(routes, fields=('id', 'buses'))
+        self.assertEqual(set(data[0]), {'id', 'buses'})
+        self.assertEqual(len(data[0]['buses']), 5)
+        self.assertLessEqual(counter.count, 2)
+
+    def test_payload_sizes(self):
+        client = current_app.test_client()
+        deep = client.get(f'/api/routes/{self.route_id}')
+        shallow = client.get(f'/api/routes/{self.route_id}?shape=shallow')
+        selected = client.get(f'/api/routes/{self.route_id}?fields=id,name')
+        self.assertEqual(json.loads(selected.data), {'id': self.route_id, 'name': "Serialized Route"})
+        self.assertLess(len(selected.data), len(shallow.data))
+        self.assertLess(len(shallow.data), 200)
+        self.assertLess(len(shallow.data) * 10, len(deep.data))
+        self.assertLess(len(deep.data), 4000)
+
+    def test_selection_order_shares_plan(self):
+        serializer = get_serializer(Route)
+        plan = serializer.plan(fields=('name', 'id'))
+        self.assertIs(serializer.plan(fields=('id', 'name', 'id')), plan)
+        self.assertIs(serializer.plan('anything', fields=('id', 'name')), plan)
+        self.assertEqual([entry[0] for entry in plan], ['id', 'name'])
+
+    def test_bad_selection(self):
+        client = current_app.test_client()
+        self.assertEqual(client.get(f'/api/routes/{self.route_id}?fields=password').status_code, 400)
+        self.assertEqual(client.get(f'/api/routes/{self.route_id}?shape=huge').status_code, 400)
+        self.assertEqual(client.get('/api/routes/999').status_code, 404)
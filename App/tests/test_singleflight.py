@@ -0,0 +1,91 @@
+import os, subprocess, sys, threading, time, unittest
+
+from App.singleflight import SingleFlight
+
+GREENLETS = """
+from gevent import monkey
+monkey.patch_all()
+import gevent
+from App.singleflight import SingleFlight
+
+calls = []
+def compute():
+    calls.append(1)
+    gevent.sleep(0.05)
+    return 'shared'
+
+flight = SingleFlight('greenlets')
+results = [job.value for job in gevent.joinall([gevent.spawn(flight.do, 'key', compute) for _ in range(20)])]
+print(len(calls), len(set(results)), results[0])
+"""
+
+'''
+   Unit Tests
+'''
+class SingleFlightUnitTests(unittest.TestCase):
+
+    def test_threads_share_one_computation(self):
+        flight = SingleFlight('threads')
+        calls, results = [], []
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'buses': []}
+        threads = [threading.Thread(target=lambda: results.append(flight.do(('stop', 1), compute))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(result is results[0] for result in results))
+        # Without a reuse window the next caller computes again
+        flight.do(('stop', 1), compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_shared_not_reused(self):
+        flight = SingleFlight('errors', reuse=60)
+        started, release = threading.Event(), threading.Event()
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError('ORS down')
+        errors = []
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.02)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(flight.do('key', lambda: 'recovered'), 'recovered')
+
+    def test_reuse_window(self):
+        calls = []
+        @SingleFlight('reuse', reuse=0.05)
+        def arrivals(stop_id, route_id):
+            calls.append((stop_id, route_id))
+            return len(calls)
+        self.assertEqual(arrivals(1, 2), 1)
+        self.assertEqual(arrivals(1, 2), 1)
+        self.assertEqual(arrivals(1, 3), 2)
+        time.sleep(0.06)
+        self.assertEqual(arrivals(1, 2), 3)
+        arrivals.flight.forget()
+        self.assertEqual(arrivals(1, 3), 4)
+
+    def test_greenlets_share_one_computation(self):
+        # gevent patches threading for the whole process, so this runs in one of its own
+        result = subprocess.run([sys.executable, '-c', GREENLETS], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['1', '1', 'shared'])
@@ -0,0 +1,43 @@
+import os, subprocess, sys, unittest
+
+from App.startup import parse_importtime
+
+'''
+   Unit Tests
+'''
+class StartupUnitTests(unittest.TestCase):
+
+    def test_parse_importtime(self):
+        report = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |     sqlalchemy.sql",
+            "import time:       200 |       3000 |   sqlalchemy",
+            "import time:       300 |       9000 | wsgi",
+            "import time:        50 |        500 |   flask",
+        ])
+        self.assertEqual(parse_importtime(report, depth=1), [(3000, 'sqlalchemy'), (500, 'flask')])
+        self.assertIn((100, 'sqlalchemy.sql'), parse_importtime(report, depth=2))
+
+'''
+    Integration Tests
+'''
+class StartupIntegrationTests(unittest.TestCase):
+
+    def booted_modules(self, **config):
+        env = dict(os.environ, FLASK_SQLALCHEMY_DATABASE_URI='sqlite:///test_startup.db')
+        env.pop('FLASK_RUN_FROM_CLI', None)
+        env.update({f'FLASK_{key}': value for key, value in config.items()})
+        script = "import sys, wsgi; print(' '.join(sys.modules))"
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env,
+                                cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return set(result.stdout.split())
+
+    def test_optional_subsystems_not_imported(self):
+        modules = self.booted_modules()
+        for name in ('openrouteservice', 'flask_uploads', 'flask_migrate', 'pytest'):
+            self.assertNotIn(name, modules)
+        self.assertIn('flask_admin', modules)
+
+    def test_admin_can_be_disabled(self):
+        self.assertNotIn('flask_admin', self.booted_modules(ADMIN_ENABLED='false'))
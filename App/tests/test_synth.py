@@ -0,0 +1,65 @@
+import pytest, unittest
+from datetime import date
+from sqlalchemy import func, select
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Driver, Journey, JourneyEvent, BoardEvent, RouteStop, TripPattern
+from App.controllers.synth import generate_synthetic_data
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_synth.db'})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+
+
+def generate():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    return generate_synthetic_data(seed=7, areas=4, routes=5, stops=(4, 8), buses_per_route=2, days=2,
+                                   trips_per_day=3, ping=60, start=date(2025, 3, 3), chunk=100)
+
+
+class SynthIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.result = generate()
+
+    def test_counts(self):
+        rows = self.result['rows']
+        self.assertEqual((rows['area'], rows['route'], rows['user'], rows['bus'], rows['trip_pattern']), (4, 5, 10, 10, 5))
+        self.assertEqual(rows['journey'], 5 * 2 * 2 * 3)
+        self.assertEqual(JourneyEvent.query.count(), rows['journey_event'])
+        self.assertEqual(self.result['total'], sum(rows.values()))
+
+    def test_rows_are_consistent(self):
+        journey = Journey.query.first()
+        self.assertEqual(journey.status, "Completed")
+        self.assertEqual(journey.current_stop_index, len(journey.route.stops) - 1)
+        self.assertTrue(all(journey.startTime <= event.time <= journey.endTime for event in journey.events))
+        # Everyone who boards gets off by the last stop
+        boarded = sum(event.qty for event in journey.board_events if event.type == "Enter")
+        alighted = sum(event.qty for event in journey.board_events if event.type == "Exit")
+        self.assertEqual(boarded, alighted)
+        self.assertEqual(len(TripPattern.query.first().stops), len(TripPattern.query.first().route.stops))
+        orphans = db.session.execute(select(func.count(BoardEvent.id)).where(~BoardEvent.stop_id.in_(select(RouteStop.id)))).scalar()
+        self.assertEqual(orphans, 0)
+
+    def test_drivers_can_log_in(self):
+        self.assertTrue(Driver.query.first().check_password("pass123"))
+
+    def test_deterministic(self):
+        def fingerprint():
+            return db.session.execute(select(func.count(JourneyEvent.id), func.sum(JourneyEvent.lat),
+                                             func.max(JourneyEvent.time))).one()
+        first = fingerprint()
+        generate()
+        self.assertEqual(fingerprint(), first)
@@ -0,0 +1,150 @@
+import json, os, pytest, tempfile, unittest
+from datetime import datetime, timedelta
+from flask import current_app
+
+from App.main import create_app
+from App.database import db, create_db
+from App.models import Route, Area, Location, RouteStop, Bus, Journey, JourneyEvent
+from App.models.User import Driver
+from App.models.Location import LocationType
+from App.config import config
+from App.tracing import Trace, span, _trace, flush_traces, current_trace_id
+from App import ors
+
+TRACE_FILE = os.path.join(tempfile.mkdtemp(), 'traces.json')
+
+def read_traces():
+    flush_traces()
+    if not os.path.exists(TRACE_FILE):
+        return []
+    with open(TRACE_FILE) as f:
+        return [json.loads(line) for line in f]
+
+'''
+   Unit Tests
+'''
+class SpanUnitTests(unittest.TestCase):
+
+    def test_untraced_is_a_no_op(self):
+        @span()
+        def add(a, b):
+            return a + b
+        self.assertEqual(add(1, 2), 3)
+        with span('outside') as outside:
+            pass
+        self.assertIsNone(current_trace_id())
+        self.assertFalse(hasattr(outside, 'record'))
+
+    def test_nesting(self):
+        trace = Trace()
+        token = _trace.set(trace)
+        try:
+            with span('outer', 'SERVER', route_id=3):
+                with span('inner'):
+                    pass
+                with self.assertRaises(ValueError):
+                    with span('failing'):
+                        raise ValueError("no route")
+        finally:
+            _trace.reset(token)
+        inner, failing, outer = trace.spans
+        self.assertEqual((inner['parentId'], failing['parentId']), (outer['id'], outer['id']))
+        self.assertNotIn('parentId', outer)
+        self.assertEqual(outer['tags'], {'route_id': '3'})
+        self.assertEqual(failing['tags']['error'], "no route")
+        self.assertEqual(len(outer['traceId']), 32)
+        self.assertTrue(all(record['duration'] > 0 for record in trace.spans))
+
+'''
+    Integration Tests
+'''
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_db():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///test_tracing.db',
+                      'TRACING_ENABLED': True, 'TRACE_FILE': TRACE_FILE, 'TRACE_SAMPLE_RATE': 0,
+                      'TRACE_TRUST_B3': True})
+    create_db()
+    yield app.test_client()
+    db.drop_all()
+    for key in ('TRACING_ENABLED', 'TRACE_FILE', 'TRACE_SAMPLE_RATE', 'TRACE_TRUST_B3'):
+        config.pop(key, None)
+
+
+class TracingIntegrationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        driver = Driver("tracedriver", "tracepass")
+        stops = [Location(f"Trace Stop {n}", 10.5 + n / 100, -61.3, LocationType.Stop) for n in range(3)]
+        route = Route("Trace Route", 5, Area("Trace North"), Area("Trace South"))
+        for index, stop in enumerate(stops):
+            route.stops.append(RouteStop(route, stop, index))
+        bus = Bus("TRC1", driver, route)
+        journey = Journey(driver, route, bus, datetime.utcnow() - timedelta(minutes=5))
+        db.session.add_all([driver, route, bus, journey] + stops)
+        db.session.flush()
+        journey.events.append(JourneyEvent(journey, 10.502, -61.3))
+        db.session.commit()
+        cls.stop_id = route.stops[1].id
+        cls.route_id = route.id
+
+    def test_request_trace(self):
+        before = len(read_traces())
+        response = current_app.test_client().get(f'/api/stop/{self.stop_id}/buses?route_id={self.route_id}',
+                                                 headers={'X-B3-Sampled': '1'})
+        self.assertEqual(response.status_code, 200)
+        traces = read_traces()
+        self.assertEqual(len(traces), before + 1)
+        spans = {record['id']: record for record in traces[-1]}
+        self.assertEqual({record['traceId'] for record in spans.values()}, {response.headers['X-B3-TraceId']})
+        by_name = {record['name']: record for record in spans.values()}
+        root = by_name['GET index_views.get_stop_buses']
+        self.assertEqual(root['tags']['http.status_code'], '200')
+
+        # Each span hangs off the one that called it
+        def parent(name):
+            return spans[by_name[name]['parentId']]['name']
+        self.assertEqual(parent('App.views.index.get_stop_buses'), root['name'])
+        self.assertEqual(parent('App.controllers.stop.get_buses'), 'App.views.index.get_stop_buses')
+        self.assertEqual(parent('App.models.Location.Location.getBuses'), 'App.controllers.stop.get_buses')
+        statements = [record for record in spans.values() if record['name'].startswith('sql')]
+        self.assertTrue(statements)
+        self.assertTrue(any(spans[record['parentId']]['name'] == 'App.models.Location.Location.getBuses' for record in statements))
+        self.assertIn('SELECT', statements[0]['tags']['db.statement'])
+
+    def test_head_sampling(self):
+        before = len(read_traces())
+        client = current_app.test_client()
+        client.get('/health', headers={'X-B3-Sampled': '0'})
+        # TRACE_SAMPLE_RATE is 0 here, so undecided requests are not traced either
+        response = client.get('/health')
+        self.assertNotIn('X-B3-TraceId', response.headers)
+        self.assertEqual(len(read_traces()), before)
+
+    def test_untrusted_sampling_header(self):
+        before = len(read_traces())
+        config['TRACE_TRUST_B3'] = False
+        try:
+            response = current_app.test_client().get('/health', headers={'X-B3-Sampled': '1'})
+        finally:
+            config['TRACE_TRUST_B3'] = True
+        self.assertNotIn('X-B3-TraceId', response.headers)
+        self.assertEqual(len(read_traces()), before)
+
+    def test_ors_span(self):
+        class FailingClient:
+            def distance_matrix(self, **kwargs):
+                raise RuntimeError("quota exceeded")
+        trace = Trace('a' * 32)
+        token = _trace.set(trace)
+        ors._clients['failing'] = FailingClient()
+        try:
+            with self.assertRaises(RuntimeError):
+                ors.distance_matrix([[-61.3, 10.5], [-61.4, 10.6]], key='failing')
+        finally:
+            del ors._clients['failing']
+            _trace.reset(token)
+        self.assertEqual(trace.spans[0]['name'], 'ors.distance_matrix')
+        self.assertEqual((trace.spans[0]['kind'], trace.spans[0]['traceId']), ('CLIENT', 'a' * 32))
+        self.assertEqual(trace.spans[0]['tags']['error'], "quota exceeded")
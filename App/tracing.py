@@ -0,0 +1,225 @@
+from App.config import config
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextvars import ContextVar
+from functools import wraps
+from queue import SimpleQueue
+import json
+import logging
+import logging.handlers
+import os
+import random
+import time
+
+SERVICE_NAME = 'nextstop'
+# Fraction of requests traced when the client has not decided, and the longest statement kept in a span
+SAMPLE_RATE = 0.01
+MAX_STATEMENT = 1000
+
+# The trace of the current request when it is sampled, and the innermost open span
+_trace = ContextVar('trace', default=None)
+_span = ContextVar('span', default=None)
+
+# Finished traces are written by a listener thread, never by the request
+_exporter = logging.getLogger('nextstop.traces')
+_exporter.propagate = False
+_listener = None
+
+
+def new_id(bits=64):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+class Trace:
+    """The finished spans of one sampled request, in Zipkin v2 form"""
+
+    def __init__(self, trace_id=None):
+        self.id = trace_id or new_id(128)
+        self.spans = []
+
+
+class span:
+    """
+    A timed span of the current trace, as a context manager or a decorator:
+
+        with span('ors.matrix', kind='CLIENT', locations=12):
+            ...
+
+        @span()
+        def get_buses(stop_id, route_id):
+            ...
+
+    Outside a sampled request it does nothing beyond one context variable lookup.
+    """
+
+    def __init__(self, name=None, kind=None, **tags):
+        self.name = name
+        self.kind = kind
+        self.tags = tags
+        self._token = None
+
+    def __call__(self, function):
+        name = self.name or f'{function.__module__}.{function.__qualname__}'
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return function(*args, **kwargs)
+            with span(name, self.kind, **self.tags):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        trace = _trace.get()
+        if trace is None:
+            return self
+        parent = _span.get()
+        self.record = {
+            'traceId': trace.id,
+            'id': new_id(),
+            'name': self.name,
+            'timestamp': int(time.time() * 1_000_000),
+            'localEndpoint': {'serviceName': SERVICE_NAME}
+        }
+        if parent is not None:
+            self.record['parentId'] = parent.record['id']
+        if self.kind:
+            self.record['kind'] = self.kind
+        self._trace = trace
+        self._started = time.perf_counter()
+        self._token = _span.set(self)
+        return self
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if self._token is None:
+            return False
+        _span.reset(self._token)
+        self._token = None
+        self.record['duration'] = max(1, int((time.perf_counter() - self._started) * 1_000_000))
+        if error is not None:
+            self.tags['error'] = str(error) or kind.__name__
+        if self.tags:
+            self.record['tags'] = {key: str(value) for key, value in self.tags.items()}
+        self._trace.spans.append(self.record)
+        return False
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace.id if trace else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _trace.get() is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    tags = {'db.system': conn.dialect.name, 'db.statement': statement[:MAX_STATEMENT]}
+    statement_span = span(f'sql {operation}'.strip(), 'CLIENT', **tags)
+    conn.info.setdefault('trace_spans', []).append(statement_span.__enter__())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get('trace_spans')
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+def _handle_error(context):
+    spans = context.connection.info.get('trace_spans') if context.connection is not None else None
+    if spans:
+        error = context.original_exception
+        spans.pop().__exit__(type(error), error, None)
+
+
+def _sampled():
+    """
+    Head sampling: sample TRACE_SAMPLE_RATE of requests. The caller's B3 decision is only
+    followed with TRACE_TRUST_B3 set (behind a proxy or mesh that strips it from clients),
+    otherwise anyone could have every request traced and written to disk.
+    """
+    decision = request.headers.get('X-B3-Sampled')
+    if decision is not None and config.get('TRACE_TRUST_B3', False):
+        return decision in ('1', 'true', 'd')
+    return random.random() < config.get('TRACE_SAMPLE_RATE', SAMPLE_RATE)
+
+def _start_request():
+    if not _sampled():
+        return
+    g.trace_token = _trace.set(Trace(request.headers.get('X-B3-TraceId')))
+    root = span(f'{request.method} {request.endpoint or request.path}', 'SERVER',
+                **{'http.method': request.method, 'http.path': request.path})
+    root.__enter__()
+    # A caller's span is the parent of this request's span
+    if request.headers.get('X-B3-SpanId'):
+        root.record['parentId'] = request.headers['X-B3-SpanId']
+    g.trace_span = root
+
+def _finish_request(response):
+    root = g.get('trace_span')
+    if root is not None:
+        root.tag(**{'http.status_code': response.status_code})
+        response.headers['X-B3-TraceId'] = root.record['traceId']
+    return response
+
+def _teardown_request(error=None):
+    root = g.pop('trace_span', None)
+    token = g.pop('trace_token', None)
+    if root is None:
+        return
+    root.__exit__(type(error) if error else None, error, None)
+    trace = _trace.get()
+    _trace.reset(token)
+    _exporter.info(json.dumps(trace.spans))
+
+
+def _restart_listener():
+    # The writer thread does not survive a fork, each worker starts its own
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+os.register_at_fork(after_in_child=_restart_listener)
+
+def setup_tracing(app):
+    """
+    Trace sampled requests: a span for the request, each SQL statement, OpenRouteService call
+    and anything wrapped in `span`. Each finished trace is one line of Zipkin v2 JSON in
+    TRACE_FILE (default instance/traces.json), rotated at TRACE_FILE_BYTES. Test apps only
+    trace with TRACING_ENABLED set, and then only sample at an explicit TRACE_SAMPLE_RATE.
+    """
+    global _listener
+    if not app.config.get('TRACING_ENABLED', not app.testing):
+        return
+    if app.testing:
+        config['TRACE_SAMPLE_RATE'] = app.config.setdefault('TRACE_SAMPLE_RATE', 0)
+    if _listener is not None:
+        _listener.stop()
+    path = app.config.get('TRACE_FILE') or os.path.join(app.instance_path, 'traces.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    output = logging.handlers.RotatingFileHandler(
+        path, maxBytes=app.config.get('TRACE_FILE_BYTES', 10 * 1024 * 1024),
+        backupCount=app.config.get('TRACE_FILE_COUNT', 5), delay=True
+    )
+    queue = SimpleQueue()
+    for old in list(_exporter.handlers):
+        _exporter.removeHandler(old)
+    _exporter.addHandler(logging.handlers.QueueHandler(queue))
+    _exporter.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(queue, output)
+    _listener.start()
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+def flush_traces():
+    """Wait until every finished trace has been written"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+        _listener.start()
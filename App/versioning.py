@@ -0,0 +1,117 @@
+from App.database import db, replica_bind
+from App.models import (
+    DataVersion, Area, Location, Route, RouteStop, Bus, Schedule, RouteSegment, RouteGeometry,
+    ServiceCalendar, TripPattern, PatternStop, FrequencyBlock
+)
+from App.config import config
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from itertools import chain
+import time
+
+# Read-mostly tables whose changes invalidate cached responses
+VERSIONED_MODELS = (
+    Area, Location, Route, RouteStop, Bus, Schedule, RouteSegment, RouteGeometry,
+    ServiceCalendar, TripPattern, PatternStop, FrequencyBlock
+)
+VERSIONED_TABLES = frozenset(model.__table__.name for model in VERSIONED_MODELS)
+
+
+def bump_versions(connection, tables):
+    """Increment the counters of the given tables on a connection, inside its transaction"""
+    table = DataVersion.__table__
+    rows = [{'name': name, 'version': 1} for name in sorted(tables)]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(rows)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.name], set_={'version': table.c.version + 1}))
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        connection.execute(insert(table).values(rows).on_duplicate_key_update(version=table.c.version + 1))
+    else:
+        for row in rows:
+            changed = connection.execute(update(table).where(table.c.name == row['name']).values(
+                version=table.c.version + 1)).rowcount
+            if not changed:
+                connection.execute(table.insert().values(row))
+
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+def _before_flush(session, flush_context, instances):
+    tables = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(type(obj), '__table__', None)
+        if table is None or table.name not in VERSIONED_TABLES:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        tables.add(table.name)
+    if tables:
+        session.info['flush_tables'] = tables
+
+def _after_flush(session, flush_context):
+    tables = session.info.pop('flush_tables', None)
+    if tables:
+        bump_versions(session.connection(), tables)
+        _touched(session).update(tables)
+
+def _do_orm_execute(state):
+    # Bulk query.update() and query.delete() skip the flush
+    if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+        return None
+    name = state.bind_mapper.local_table.name
+    if name not in VERSIONED_TABLES:
+        return None
+    result = state.invoke_statement()
+    bump_versions(state.session.connection(), {name})
+    _touched(state.session).add(name)
+    return result
+
+def _after_commit(session):
+    if session.info.pop('touched_tables', None):
+        expire_versions()
+
+def _after_rollback(session):
+    session.info.pop('touched_tables', None)
+    session.info.pop('flush_tables', None)
+
+
+# Counters and when they were read, per bind: replicas may be behind the primary
+_versions = {}
+
+def expire_versions():
+    """Make the next get_versions call read the counters again"""
+    _versions.clear()
+
+def get_versions(tables=None):
+    """
+    Current counters of the given versioned tables (all of them by default) as a tuple.
+    Each worker reads the counters at most once per DATA_VERSION_TTL seconds and straight
+    after its own commits, so changes made by other workers show within that window.
+    """
+    now = time.monotonic()
+    bind = replica_bind.get()
+    read, versions = _versions.get(bind, (None, None))
+    if read is None or now - read >= config.get('DATA_VERSION_TTL', 1.0):
+        table = DataVersion.__table__
+        versions = dict(db.session.execute(select(table.c.name, table.c.version)).all())
+        _versions[bind] = (now, versions)
+    return tuple(versions.get(name, 0) for name in sorted(tables or VERSIONED_TABLES))
+
+
+def setup_versioning(app=None):
+    """Register the session hooks that bump the data versions"""
+    if event.contains(Session, 'before_flush', _before_flush):
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
@@ -1,37 +1,43 @@
-from flask import flash, redirect, request, url_for, Blueprint, render_template, jsonify
-from flask_admin.contrib.sqla import ModelView
-from flask_jwt_extended import jwt_required, current_user, unset_jwt_cookies, set_access_cookies, get_jwt_identity
-from flask_admin import Admin
+from flask import flash, redirect, request, url_for, Blueprint, render_template, jsonify, g, Response
+from flask_jwt_extended import jwt_required, current_user, unset_jwt_cookies, set_access_cookies, get_jwt_identity, verify_jwt_in_request
 from App.models import db, User, Bus
 from App.database import db as app_db
+from App.profiler import INTERVAL, start_profile, current_profile, start_request_profile
 from flask_jwt_extended.exceptions import NoAuthorizationError, InvalidHeaderError, JWTExtendedException
 from datetime import datetime
+import os
+import time
 
-class AdminView(ModelView):
+def setup_admin(app):
+    # Flask-Admin is imported here so it costs nothing when ADMIN_ENABLED is off
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
 
-    @jwt_required()
-    def is_accessible(self):
-        return current_user is not None
+    class AdminView(ModelView):
 
-    def inaccessible_callback(self, name, **kwargs):
-        # redirect to login page if user doesn't have access
-        flash("Login to access admin")
-        return redirect(url_for('index_page', next=request.url))
+        @jwt_required()
+        def is_accessible(self):
+            return current_user is not None
+
+        def inaccessible_callback(self, name, **kwargs):
+            # redirect to login page if user doesn't have access
+            flash("Login to access admin")
+            return redirect(url_for('index_page', next=request.url))
 
-def setup_admin(app):
     admin = Admin(app, name='FlaskMVC', template_mode='bootstrap3')
     admin.add_view(AdminView(User, db.session))
 
 admin_views = Blueprint('admin_views', __name__, template_folder='../templates')
 
+def current_admin():
+    """The user of the verified JWT when they are an admin, otherwise None"""
+    user = User.query.filter_by(username=get_jwt_identity()).first()
+    return user if user and user.is_admin else None
+
 @admin_views.route('/admin')
 @jwt_required()
 def admin_index():
-    # Check if the user is an admin
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
-    
-    if not user or not user.is_admin:
+    if not current_admin():
         return render_template('401.html', error_message="Unauthorized"), 401
     
     return render_template('admin/index.html')
@@ -39,11 +45,7 @@ def admin_index():
 @admin_views.route('/admin/create-bus', methods=['GET', 'POST'])
 @jwt_required()
 def create_bus():
-    # Check if the user is an admin
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username).first()
-    
-    if not user or not user.is_admin:
+    if not current_admin():
         return render_template('401.html', error_message="Unauthorized"), 401
     
     if request.method == 'POST':
@@ -69,4 +71,75 @@ def create_bus():
         return redirect(url_for('admin_views.admin_index'))
     
     # GET request - show the form
-    return render_template('admin/create_bus.html')
\ No newline at end of file
+    return render_template('admin/create_bus.html')
+
+@admin_views.route('/admin/profile', methods=['POST'])
+@jwt_required()
+def start_worker_profile():
+    """Sample this worker's stacks for ?seconds=N; with ?wait=1 answer with the profile when done"""
+    if not current_admin():
+        return render_template('401.html', error_message="Unauthorized"), 401
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = request.args.get('interval_ms', INTERVAL * 1000, type=float) / 1000
+    try:
+        sampler = start_profile(seconds, interval)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if sampler is None:
+        return jsonify(error="A profile is already running in this worker", pid=os.getpid()), 409
+    if request.args.get('wait'):
+        while sampler.running:
+            time.sleep(0.1)
+        return profile_response(sampler)
+    return jsonify(pid=os.getpid(), seconds=seconds, interval_ms=sampler.interval * 1000), 202
+
+@admin_views.route('/admin/profile', methods=['GET'])
+@jwt_required()
+def get_worker_profile():
+    """The collapsed stacks of this worker's running or last profile"""
+    if not current_admin():
+        return render_template('401.html', error_message="Unauthorized"), 401
+    sampler = current_profile()
+    if sampler is None:
+        return jsonify(error="This worker has not been profiled", pid=os.getpid()), 404
+    if sampler.running:
+        return jsonify(pid=os.getpid(), running=True, samples=sampler.samples), 202
+    return profile_response(sampler)
+
+def profile_response(sampler, status=None):
+    response = Response(sampler.collapsed(), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(sampler.samples)
+    response.headers['X-Profile-Pid'] = str(os.getpid())
+    if sampler.path:
+        response.headers['X-Profile-Path'] = sampler.path
+    if status is not None:
+        response.headers['X-Profile-Status'] = str(status)
+    return response
+
+
+@admin_views.before_app_request
+def profile_request():
+    """An admin sending X-Profile gets the request's collapsed stacks instead of its response"""
+    if 'X-Profile' not in request.headers:
+        return
+    try:
+        verify_jwt_in_request(optional=True)
+        if get_jwt_identity() is None or not current_admin():
+            return
+    except Exception:
+        # A missing or bad token just means the request is not profiled
+        return
+    g.request_profile = start_request_profile()
+
+@admin_views.after_app_request
+def finish_request_profile(response):
+    sampler = g.pop('request_profile', None)
+    if sampler is None:
+        return response
+    return profile_response(sampler.stop(), response.status_code)
+
+@admin_views.teardown_app_request
+def stop_request_profile(error=None):
+    sampler = g.pop('request_profile', None)
+    if sampler is not None:
+        sampler.stop()
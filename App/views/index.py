@@ -1,19 +1,36 @@
 from flask import Blueprint, redirect, render_template, request, send_from_directory, jsonify, url_for, Response
 from App.controllers import create_user, initialize, get_all_routes
+from App.controllers.route import get_route_stops, get_route_geometry, save_route_geometry, route_stops_key
+from App.controllers.planner import plan_journey
+from App.controllers.isochrone import get_isochrones, DEFAULT_BANDS
+from App.serializers import serialize, parse_fields, query_for
+from App.json_provider import RawJSON
+from App.http_cache import conditional
+from App.fragments import render_fragment
+from App.replicas import read_only, replica_status
 from App.models import Route, RouteStop, Location
-import openrouteservice
+from App import ors
 from App.config import config
-import requests
+from App.database import db, check_database, pool_status
+from App.log import get_logger
+from App.tracing import span
+from App.singleflight import SingleFlight
+from datetime import datetime
 from sqlalchemy import or_
 
+log = get_logger(__name__)
+
 index_views = Blueprint('index_views', __name__, template_folder='../templates')
 
+# Visitors opening a route before its geometry is stored share one OpenRouteService call
+directions_flight = SingleFlight('directions', reuse=5.0)
+
 @index_views.route('/', methods=['GET'])
+@read_only
 def index_page():
-    routes = get_all_routes()
-    stops = Location.query.all()
-    # No URL generation here - just pass the basic data
-    return render_template('index.html', routes=routes, stops=stops)
+    # The route list is shared by every visitor, only the layout's auth context is per request
+    route_list = render_fragment('fragments/route_list.html', lambda: {'routes': get_all_routes()})
+    return render_template('index.html', route_list=route_list)
 
 @index_views.route('/preview/<int:route_id>', methods=['GET'])
 def preview_route_page(route_id):
@@ -29,50 +46,35 @@ def init():
 def health_check():
     return jsonify({'status':'healthy'})
 
+@index_views.route('/health/db', methods=['GET'])
+def database_health_check():
+    """Database round trip latency and connection pool usage"""
+    try:
+        latency = check_database()
+    except Exception as e:
+        return jsonify({'status': 'unavailable', 'error': str(e), 'pool': pool_status()}), 503
+    return jsonify({'status': 'healthy', 'latency_ms': round(latency, 2), 'pool': pool_status(),
+                    'replicas': replica_status()})
+
 @index_views.route('/api/routes/<int:route_id>', methods=['GET'])
+@read_only
+@conditional('route', 'area', 'route_stop', 'location', 'bus', 'schedule')
 def get_route_api(route_id):
-    route = Route.query.get(route_id)
-    
+    """Route details, `?shape=shallow|deep` (default deep) or an explicit `?fields=` selection"""
+    shape = request.args.get('shape', 'deep')
+    fields = parse_fields(request.args.get('fields'))
+    try:
+        route = query_for(Route, shape, fields).filter(Route.id == route_id).first()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     if not route:
         return jsonify({'error': 'Route not found'}), 404
-    
-    # Get all stops for this route
-    stops = RouteStop.query.filter_by(route_id=route_id).order_by(RouteStop.stop_index).all()
-    
-    # Format the response
-    response = {
-        'id': route.id,
-        'name': route.name,
-        'start_area': {
-            'id': route.start_area.id,
-            'name': route.start_area.name
-        },
-        'end_area': {
-            'id': route.end_area.id,
-            'name': route.end_area.name
-        },
-        'cost': route.cost,
-        'stops': []
-    }
-    
-    # Add stop details
-    for stop in stops:
-        stop_data = {
-            'id': stop.id,
-            'stop_index': stop.stop_index,
-            'location': {
-                'id': stop.location.id,
-                'name': stop.location.name,
-                'lat': stop.location.lat,
-                'lng': stop.location.lng,
-                'type': stop.location.type
-            }
-        }
-        response['stops'].append(stop_data)
-    
-    return jsonify(response)
+
+    return jsonify(serialize(route, shape, fields))
 
 @index_views.route('/api/route-directions/<int:route_id>', methods=['GET'])
+@conditional('route_stop', 'location', 'route_geometry')
 def get_route_directions(route_id):
     """Get realistic driving directions for a route using OpenRouteService"""
     try:
@@ -81,10 +83,15 @@ def get_route_directions(route_id):
         if not route:
             return jsonify({'error': 'Route not found'}), 404
         
-        stops = RouteStop.query.filter_by(route_id=route_id).order_by(RouteStop.stop_index).all()
+        stops = get_route_stops(route_id)
         if not stops or len(stops) < 2:
             return jsonify({'error': 'Route has insufficient stops'}), 400
         
+        # Serve the stored geometry while the route's stops are unchanged
+        geojson = get_route_geometry(route_id, stops)
+        if geojson:
+            return jsonify(RawJSON(geojson))
+        
         # Extract coordinates for OpenRouteService (format: [[lng, lat], [lng, lat], ...])
         coordinates = []
         for stop in stops:
@@ -93,36 +100,33 @@ def get_route_directions(route_id):
         # Get API key
         ors_api_key = config.get('OPENROUTE_SERVICE_KEY', '')
         
-        # Check if API key is valid
-        if not ors_api_key:
+        # Check if API key is valid, unless the offline routing engine answers instead
+        if not ors.available(ors_api_key):
             return jsonify({'error': 'OpenRouteService API key not configured'}), 500
         
-        # Initialize client
-        client = openrouteservice.Client(key=ors_api_key)
-        
         # Get directions
         try:
-            directions = client.directions(
-                coordinates=coordinates,
-                profile='driving-car',
-                format='geojson',
-                optimize_waypoints=False,
-                preference='recommended'
+            # Store the geometry for later requests and the segment matrix, then return it
+            geojson = directions_flight.do(
+                (route_id, route_stops_key(stops)),
+                lambda: save_route_geometry(route_id, stops, ors.directions(coordinates, ors_api_key))
             )
+            return jsonify(RawJSON(geojson))
             
-            # Return the GeoJSON response
-            return jsonify(directions)
-            
-        except openrouteservice.exceptions.ApiError as e:
-            print(f"OpenRouteService API error: {str(e)}")
-            # Fallback to direct lines if API fails
-            return jsonify({'error': 'Failed to get directions from OpenRouteService', 'fallback': True}), 200
+        except ors.api_error() as e:
+            log.warning("OpenRouteService API error: %s", e, route_id=route_id)
+            # Fallback to direct lines if API fails, without letting clients keep the fallback
+            response = jsonify({'error': 'Failed to get directions from OpenRouteService', 'fallback': True})
+            response.cache_control.no_store = True
+            return response
             
     except Exception as e:
-        print(f"Error getting route directions: {str(e)}")
+        log.exception("Error getting route directions", route_id=route_id)
         return jsonify({'error': str(e)}), 500
 
 @index_views.route('/api/stops/search', methods=['GET'])
+@read_only
+@conditional('location', 'route_stop', 'route')
 def search_stops():
     """Search for stops by name and get their associated routes"""
     query = request.args.get('q', '')
@@ -142,22 +146,23 @@ def search_stops():
         # Otherwise return all matching stops
         stops = Location.query.filter(Location.name.ilike(f'%{query}%')).all()
     
+    # Routes that use the matching stops, in one query
+    routes_by_stop = {}
+    if stops:
+        route_stops = db.session.query(RouteStop.location_id, RouteStop.stop_index, Route.id, Route.name).join(
+            Route, Route.id == RouteStop.route_id
+        ).filter(RouteStop.location_id.in_([stop.id for stop in stops])).order_by(RouteStop.id).all()
+        for location_id, stop_index, id, name in route_stops:
+            routes_by_stop.setdefault(location_id, []).append({
+                'id': id,
+                'name': name,
+                'stop_index': stop_index
+            })
+
     # Format the response with route information
     result = []
     for stop in stops:
-        # Get all routes that use this stop
-        route_stops = RouteStop.query.filter_by(location_id=stop.id).all()
-        routes = []
-        
-        for route_stop in route_stops:
-            route = Route.query.get(route_stop.route_id)
-            if route:
-                routes.append({
-                    'id': route.id,
-                    'name': route.name,
-                    'stop_index': route_stop.stop_index
-                })
-        
+        routes = routes_by_stop.get(stop.id, [])
         result.append({
             'id': stop.id,
             'name': stop.name,
@@ -170,35 +175,62 @@ def search_stops():
     return jsonify(result)
 
 @index_views.route('/api/stop/<int:stop_id>/buses', methods=['GET'])
+@read_only
+@span()
 def get_stop_buses(stop_id):
     """Get buses approaching a stop"""
-    from App.controllers.stop import get_buses
+    from App.controllers.stop import get_arrivals
     
     route_id = request.args.get('route_id', type=int)
     if not route_id:
         return jsonify({'error': 'Route ID is required'}), 400
     
     try:
-        buses = get_buses(stop_id, route_id)
-        
-        # Format the response
-        result = []
-        for bus_info in buses:
-            result.append({
-                'journey_id': bus_info['journey'].id,
-                'bus_id': bus_info['bus'].id,
-                'plate_num': bus_info['bus'].plate_num,
-                'distance': bus_info['distance'],
-                'duration_seconds': bus_info['duration_seconds'],
-                'estimated_arrival': bus_info['estimated_arrival'],
-                'available_seats': bus_info['bus'].get_available_seats()
-            })
-        
-        return jsonify(result)
+        return jsonify(get_arrivals(stop_id, route_id))
     except Exception as e:
-        print(f"Error getting buses for stop: {str(e)}")
+        log.exception("Error getting buses for stop", stop_id=stop_id)
         return jsonify({'error': str(e)}), 500
 
+@index_views.route('/api/plan', methods=['GET'])
+def plan_trip():
+    """Plan a journey between two stops, possibly changing routes"""
+    origin_id = request.args.get('from', type=int)
+    target_id = request.args.get('to', type=int)
+    if not origin_id or not target_id:
+        return jsonify({'error': 'From and to stop IDs are required'}), 400
+
+    depart = request.args.get('depart')
+    try:
+        depart = datetime.fromisoformat(depart) if depart else None
+    except ValueError:
+        return jsonify({'error': 'Departure time must be an ISO date and time'}), 400
+
+    plan = plan_journey(origin_id, target_id, depart)
+    if not plan:
+        return jsonify({'error': 'No journey found'}), 404
+    return jsonify(plan)
+
+@index_views.route('/api/isochrone', methods=['GET'])
+def get_isochrone():
+    """Stops reachable from one or more stops within each time band"""
+    stop_ids = request.args.getlist('stop', type=int)
+    if not stop_ids:
+        return jsonify({'error': 'Stop ID is required'}), 400
+
+    bands = request.args.get('bands')
+    try:
+        bands = [int(minutes) for minutes in bands.split(',')] if bands else list(DEFAULT_BANDS)
+    except ValueError:
+        return jsonify({'error': 'Bands must be comma separated minutes'}), 400
+    if not bands or min(bands) <= 0 or max(bands) > 240:
+        return jsonify({'error': 'Bands must be between 1 and 240 minutes'}), 400
+
+    if not Location.query.filter(Location.id.in_(stop_ids)).count():
+        return jsonify({'error': 'Stop not found'}), 404
+
+    hull = request.args.get('hull', '0').lower() in ('1', 'true', 'yes')
+    return jsonify(get_isochrones(stop_ids, bands, hull))
+
 @index_views.route('/api/ors-status', methods=['GET'])
 def check_ors_status():
     """Check the status of the OpenRouteService API key"""
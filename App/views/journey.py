@@ -16,8 +16,12 @@ from App.controllers.journey import (
     get_journey_progress
 )
 from App.controllers.route import get_all_routes
+from App.controllers.eta import estimate_next_stop
 from App.models import Journey, Bus, Route, RouteStop, User, Driver
 from App.database import db
+from App.log import get_logger
+
+log = get_logger(__name__)
 
 journey_views = Blueprint('journey_views', __name__, template_folder='../templates')
 
@@ -56,7 +60,7 @@ def driver_journeys_page():
         
         return render_template('driver_journeys.html', journeys=journeys, driver_bus=driver_bus, available_buses=available_buses)
     except Exception as e:
-        print(f"Error in driver_journeys_page: {str(e)}")
+        log.exception("Error in driver_journeys_page")
         flash('An error occurred while loading journeys')
         return render_template('driver_journeys.html', journeys=[])
 
@@ -151,13 +155,11 @@ def journey_progress_page(journey_id):
     eta_time = "End of route"
     eta_distance = "0"
     
-    if next_stop:
-        # In a real app, this would use a mapping service
-        # For demo purposes, we'll generate some mock data
-        import random
-        eta_minutes = random.randint(5, 20)
-        eta_time = f"{eta_minutes} minutes"
-        eta_distance = f"{random.randint(1, 10)}.{random.randint(1, 9)}"
+    if next_stop and current_stop:
+        # Estimated in-process from journey history, no mapping service round trip
+        distance, seconds = estimate_next_stop(journey, current_stop, next_stop)
+        eta_time = f"{max(1, round(seconds / 60))} minutes"
+        eta_distance = f"{distance / 1000:.1f}"
     
     return render_template('journey_progress.html', 
                           journey=journey,
@@ -214,7 +216,7 @@ def create_board_event():
         
         return redirect(url_for('journey_views.journey_progress_page', journey_id=journey_id))
     except Exception as e:
-        print(f"Error in create_board_event: {str(e)}")
+        log.exception("Error in create_board_event")
         flash('An error occurred while processing the boarding event')
         return redirect(url_for('journey_views.driver_journeys_page'))
 
@@ -386,7 +388,7 @@ def journey_stats_page(journey_id):
                                       console_log=console_log)
         except Exception as stats_error:
             error_msg = f"Error getting journey stats: {str(stats_error)}"
-            print(error_msg)
+            log.exception("Error getting journey stats", journey_id=journey_id)
             # Add console logging script with detailed error
             console_log = f"""
             <script>
@@ -399,6 +401,9 @@ def journey_stats_page(journey_id):
                                   journey=journey, 
                                   console_log=console_log)
         
+        # get_journey_stats shares its result with concurrent requests, fill in a copy of it
+        stats = dict(stats, stop_delays=[dict(delay) for delay in stats.get('stop_delays') or []])
+
         # Ensure all required fields are present to avoid template errors
         required_fields = ['journey_id', 'route_name', 'start_time', 'end_time', 
                           'duration', 'total_passengers', 'revenue', 'stop_delays']
@@ -435,7 +440,7 @@ def journey_stats_page(journey_id):
                               console_log=console_log)
     except Exception as e:
         error_msg = f"Error in journey_stats_page: {str(e)}"
-        print(error_msg)
+        log.exception("Error in journey_stats_page", journey_id=journey_id)
         # Add console logging script with detailed error
         console_log = f"""
         <script>
@@ -443,7 +448,7 @@ def journey_stats_page(journey_id):
         </script>
         """
         error_msg = f"Error in journey_stats_page: {str(e)}"
-        print(error_msg)
+        log.exception("Error in journey_stats_page", journey_id=journey_id)
         # Add console logging script with detailed error
         console_log = f"""
         <script>
@@ -493,6 +498,6 @@ def assign_bus_to_driver():
         flash(f'Bus {bus.plate_num} has been assigned to you')
         return redirect(url_for('journey_views.driver_journeys_page'))
     except Exception as e:
-        print(f"Error in assign_bus_to_driver: {str(e)}")
+        log.exception("Error in assign_bus_to_driver")
         flash('An error occurred while assigning the bus')
         return redirect(url_for('journey_views.driver_journeys_page')) 
\ No newline at end of file
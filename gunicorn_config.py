@@ -1,19 +1,89 @@
 # gunicorn_config.py
+import gc
 import multiprocessing
+import os
+
+# Preload the app in the master so workers share its code and warmed caches copy-on-write.
+# Set GUNICORN_PRELOAD=0 to have every worker import the app itself.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Use the 'gevent' worker type for async performance.
+worker_class = 'gevent'
+
+if preload_app and worker_class == 'gevent':
+    # The app is imported before the workers patch, so patch in the master first
+    from gevent import monkey
+    monkey.patch_all()
 
 # The socket to bind.
-# "0.0.0.0" to bind to all interfaces. 8000 is the port number.
+# "0.0.0.0" to bind to all interfaces. 8080 is the port number.
 bind = "0.0.0.0:8080"
 
-# The number of worker processes for handling requests.
-workers = 4
+# State shared by the workers lives in the app's instance folder, not a shared temporary
+# directory other users can write to
+instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
 
-# Use the 'gevent' worker type for async performance.
-worker_class = 'gevent'
+# Workers write their metrics here so /metrics adds up every worker. Each bound port has its
+# own directory, and its files of a previous run are removed so counters start from zero.
+metrics_dir = os.environ.setdefault('FLASK_METRICS_DIR', os.path.join(instance_path, f"metrics-{bind.rsplit(':', 1)[-1]}"))
+os.makedirs(metrics_dir, mode=0o700, exist_ok=True)
+for name in os.listdir(metrics_dir):
+    if name.endswith('.json'):
+        os.remove(os.path.join(metrics_dir, name))
+
+# The cache store shared by the workers starts empty too, entries may predate a migration
+cache_path = os.environ.setdefault('FLASK_CACHE_PATH', os.path.join(instance_path, 'cache.sqlite'))
+for suffix in ('', '-wal', '-shm'):
+    if os.path.exists(cache_path + suffix):
+        os.remove(cache_path + suffix)
+
+
+def available_memory_mb():
+    """Memory limit of the container (cgroup v2 or v1), or the host's available memory"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # Unlimited cgroups report 'max' or a huge number
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+def default_workers():
+    """Workers per CPU, capped by how many worker memory budgets fit in the available memory"""
+    by_cpu = multiprocessing.cpu_count() * int(os.environ.get('WORKERS_PER_CPU', 2))
+    memory = available_memory_mb()
+    if memory is None:
+        return max(1, by_cpu)
+    by_memory = memory // int(os.environ.get('WORKER_MEMORY_MB', 160))
+    return max(1, min(by_cpu, by_memory))
+
+# The number of worker processes for handling requests.
+workers = int(os.environ.get('WEB_CONCURRENCY', 0)) or default_workers()
 
 # Log level
 loglevel = 'info'
 
 # Where to log to
 accesslog = '-'  # '-' means log to stdout
-errorlog = '-'  # '-' means log to stderr
\ No newline at end of file
+errorlog = '-'  # '-' means log to stderr
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from App.deploy import warm_shared_state
+    warmed = warm_shared_state(server.app.wsgi())
+    # Move everything allocated so far out of the collector's reach, so collections in the
+    # workers do not write to (and un-share) the pages inherited from the master
+    gc.freeze()
+    server.log.info(f"Warmed {', '.join(warmed)} and froze {gc.get_freeze_count()} objects before forking")
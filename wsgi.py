@@ -1,4 +1,4 @@
-import click, pytest, sys
+import click, os, sys
 from flask import Flask
 from flask.cli import with_appcontext, AppGroup
 from datetime import datetime, timedelta
@@ -6,12 +6,27 @@ from App.database import db, get_migrate
 from App.models import User, Driver, Area, Location, LocationType, Route, RouteStop, Bus, Journey, JourneyEvent, BoardEvent, BoardType, Schedule
 from App.main import create_app
 from App.controllers import ( create_user, get_all_users_json, get_all_users, initialize )
+from App.controllers.schedule import compact_schedules
+from App.controllers.eta import train_eta_model, backtest_eta_model
+from App.controllers.route import build_segment_matrix
+from App.controllers.planner import benchmark_planner
+from App.controllers.route import get_route_stops, get_route_geometry
+from App.json_provider import benchmark_encoders, loads
+from App.http_cache import benchmark_index_flow
+from App.startup import benchmark_startup
+from App.deploy import benchmark_memory
+from App.controllers.synth import generate_synthetic_data
+from App.benchmarks import SCALES, run_suite, save_results, load_results, compare_results, format_report
+from App.metrics import benchmark_metrics_overhead
+from App.routing import load_graph, benchmark_routing
 
 
 # This commands file allow you to create convenient CLI commands for testing controllers
 
 app = create_app()
-migrate = get_migrate(app)
+# Flask-Migrate (and alembic) is only needed for the flask db commands, not in app workers
+if os.environ.get('FLASK_RUN_FROM_CLI'):
+    migrate = get_migrate(app)
 
 # This command creates and initializes the database
 @app.cli.command("init", help="Creates and initializes the database")
@@ -652,6 +667,202 @@ def seed_data_command():
     #     for bus in buses3:
     #         print(f"Bus: {bus['bus'].plate_num}, Distance: {bus['distance']}m, ETA: {bus['estimated_arrival']}")
 
+@seed_cli.command("synth", help="Generates a synthetic network and days of journeys at scale")
+@click.option("--seed", default=0, help="Random seed, the same seed and sizes give the same data")
+@click.option("--areas", default=20, help="Number of areas, each with a terminal")
+@click.option("--routes", default=100, help="Number of routes")
+@click.option("--min-stops", default=8, help="Fewest stops on a route")
+@click.option("--max-stops", default=30, help="Most stops on a route")
+@click.option("--buses", default=3, help="Buses (and drivers) per route")
+@click.option("--days", default=7, help="Days of journeys")
+@click.option("--trips", default=6, help="Trips per bus per day")
+@click.option("--ping", default=30, help="Seconds between GPS events of a journey")
+@click.option("--start", default="2025-01-06", help="First day of journeys (YYYY-MM-DD)")
+@click.option("--active", default=1, help="Buses per route with a journey in progress")
+@click.option("--chunk", default=5000, help="Rows per bulk insert")
+@click.option("--append", is_flag=True, help="Add to the existing data instead of recreating the database")
+def seed_synth_command(seed, areas, routes, min_stops, max_stops, buses, days, trips, ping, start, active, chunk, append):
+    if not append:
+        db.drop_all()
+        db.create_all()
+    result = generate_synthetic_data(
+        seed, areas, routes, (min_stops, max_stops), buses, days, trips, ping,
+        datetime.strptime(start, '%Y-%m-%d').date(), chunk, active=active
+    )
+    for table, count in result['rows'].items():
+        print(f'{table}: {count}')
+    print(f"{result['total']} rows in {result['seconds']:.1f}s ({result['total'] / result['seconds']:.0f} rows/s)")
+
+'''
+Schedule Commands
+'''
+schedule_cli = AppGroup('schedule', help='Schedule object commands')
+
+@schedule_cli.command("compact", help="Converts per-trip schedule rows into recurring trip patterns")
+@click.argument("days", default="1111111")
+def compact_schedules_command(days):
+    count = compact_schedules(days)
+    print(f'{count} route schedule(s) compacted into trip patterns')
+
+app.cli.add_command(schedule_cli)
+
+'''
+Route Commands
+'''
+route_cli = AppGroup('route', help='Route object commands')
+
+@route_cli.command("segments", help="Computes the stop-to-stop travel time matrix of every route")
+def build_segments_command():
+    count = build_segment_matrix()
+    print(f'{count} route segment(s) stored')
+
+@route_cli.command("graph", help="Prepares the road graph of an extract (.pbf or edge list .csv) for the offline routing engine")
+@click.argument("path", default=None, required=False)
+@click.option("--landmarks", default=8, help="Landmarks for ALT searches")
+def prepare_graph_command(path, landmarks):
+    path = path or app.config.get('ROUTING_GRAPH')
+    if not path:
+        print('Pass an extract or configure ROUTING_GRAPH')
+        return
+    graph = load_graph(path, landmarks)
+    print(f'{len(graph)} nodes, {len(graph.head)} arcs and {len(graph.landmarks)} landmarks in {path}.prepared')
+
+app.cli.add_command(route_cli)
+
+'''
+ETA Commands
+'''
+eta_cli = AppGroup('eta', help='ETA model commands')
+
+@eta_cli.command("train", help="Trains the ETA model from completed journeys")
+@click.option("--path", default=None, help="Where to store the model (defaults to ETA_MODEL_PATH)")
+def train_eta_command(path):
+    model = train_eta_model(path)
+    print(f'ETA model trained on {len(model.segments)} segment(s)')
+
+@eta_cli.command("backtest", help="Reports the ETA model error on held-out journeys")
+@click.option("--holdout", default=0.2, help="Fraction of journeys held out for testing")
+@click.option("--seed", default=0, help="Seed for the train/test split")
+def backtest_eta_command(holdout, seed):
+    result = backtest_eta_model(holdout, seed)
+    print(f"Trained on {result['train_journeys']} journeys, tested on {result['test_journeys']} ({result['segments']} segments)")
+    if result['mae_seconds'] is None:
+        print('No held-out segments to evaluate')
+        return
+    print(f"Mean absolute error: {result['mae_seconds']:.1f}s (fixed-speed baseline: {result['baseline_mae_seconds']:.1f}s)")
+
+app.cli.add_command(eta_cli)
+
+'''
+Benchmark Commands
+'''
+bench_cli = AppGroup('bench', help='Benchmark commands')
+
+@bench_cli.command("planner", help="Times journey planner queries on a synthetic network")
+@click.option("--stops", default=2000, help="Number of stops in the synthetic network")
+@click.option("--routes", default=200, help="Number of routes in the synthetic network")
+@click.option("--queries", default=200, help="Number of random queries to time")
+@click.option("--seed", default=0, help="Seed for the network and queries")
+def bench_planner_command(stops, routes, queries, seed):
+    result = benchmark_planner(stops, routes, queries, seed)
+    print(f"{result['stops']} stops, {result['patterns']} patterns, {result['trips']} trips built in {result['build_ms']:.0f}ms")
+    print(f"{result['found']}/{result['queries']} journeys found")
+    print(f"p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, max {result['max_ms']:.1f}ms")
+
+@bench_cli.command("routing", help="Times offline shortest path queries on a synthetic street grid, with and without landmarks")
+@click.option("--size", default=100, help="Streets per side of the grid")
+@click.option("--queries", default=200, help="Number of random queries to time")
+@click.option("--landmarks", default=8, help="Landmarks for ALT searches")
+@click.option("--seed", default=0, help="Seed for the grid and queries")
+def bench_routing_command(size, queries, landmarks, seed):
+    result = benchmark_routing(size, size, queries, landmarks, seed)
+    print(f"{result['nodes']} nodes, {result['arcs']} arcs prepared in {result['prepare_ms']:.0f}ms")
+    print(f"ALT p50 {result['alt_p50_ms']:.1f}ms, p95 {result['alt_p95_ms']:.1f}ms")
+    print(f"Dijkstra p50 {result['dijkstra_p50_ms']:.1f}ms, p95 {result['dijkstra_p95_ms']:.1f}ms")
+
+@bench_cli.command("json", help="Times encoding a route's directions GeoJSON with each JSON encoder")
+@click.argument("route_id", type=int)
+@click.option("--iterations", default=50, help="Encodes per encoder")
+def bench_json_command(route_id, iterations):
+    stops = get_route_stops(route_id)
+    geojson = get_route_geometry(route_id, stops) if stops else None
+    if not geojson:
+        print(f'Route {route_id} has no stored directions, fetch /api/route-directions/{route_id} first')
+        return
+    result = benchmark_encoders(loads(geojson), iterations)
+    print(f"{result.pop('bytes') / 1024:.0f} KiB GeoJSON for {len(stops)} stops")
+    for name, ms in result.items():
+        print(f"{name}: {ms:.3f}ms per response")
+
+@bench_cli.command("http", help="Measures bytes and latency of the index page requests with and without HTTP caching")
+@click.argument("route_id", type=int)
+@click.option("--query", default="a", help="Stop search text")
+@click.option("--repeats", default=10, help="Requests per URL and mode")
+def bench_http_command(route_id, query, repeats):
+    results = benchmark_index_flow(app.test_client(), route_id, query, repeats)
+    for url, modes in results.items():
+        print(url)
+        for mode, result in modes.items():
+            print(f"  {mode:<12} {result['status']} {result['bytes']:>9} bytes {result['ms']:8.2f}ms")
+
+@bench_cli.command("startup", help="Measures the cold boot time of one app worker and its slowest imports")
+@click.option("--runs", default=5, help="Number of fresh interpreters to boot")
+@click.option("--top", default=15, help="Number of slowest imports to list")
+@click.option("--no-admin", is_flag=True, help="Boot with ADMIN_ENABLED off")
+def bench_startup_command(runs, top, no_admin):
+    result = benchmark_startup(runs, top, {'ADMIN_ENABLED': 'false'} if no_admin else None)
+    print(f"Worker boot over {result['runs']} runs: min {result['min_ms']:.0f}ms, median {result['median_ms']:.0f}ms, max {result['max_ms']:.0f}ms")
+    print("Slowest imports:")
+    for name, ms in result['imports']:
+        print(f"  {ms:8.1f}ms {name}")
+
+@bench_cli.command("memory", help="Measures per-worker RSS and USS of gunicorn with and without preloading")
+@click.option("--workers", default=2, help="Number of gunicorn workers")
+@click.option("--requests", default=20, help="Rounds of warm-up requests")
+def bench_memory_command(workers, requests):
+    for preload in (False, True):
+        result = benchmark_memory(workers, preload, requests)
+        print(f"preload={'on' if preload else 'off'}: {result['workers']} workers, "
+              f"mean RSS {result['mean_rss_kb'] / 1024:.1f} MiB, mean USS {result['mean_uss_kb'] / 1024:.1f} MiB, "
+              f"total PSS with master {result['total_pss_kb'] / 1024:.1f} MiB")
+
+@bench_cli.command("suite", help="Times the hot model and view paths on synthetic datasets and writes the results as JSON")
+@click.option("--scale", "scales", multiple=True, default=["small"], type=click.Choice(list(SCALES)), help="Dataset scale, repeatable")
+@click.option("--iterations", default=30, help="Timed calls per case")
+@click.option("--seed", default=0, help="Seed for the datasets and cases")
+@click.option("--output", default="bench.json", help="Where to write the results")
+def bench_suite_command(scales, iterations, seed, output):
+    results = run_suite(scales, iterations, seed)
+    save_results(results, output)
+    for scale, result in results['scales'].items():
+        print(f"{scale}: {result['rows']} rows generated in {result['generate_s']:.1f}s")
+        for case, metrics in result['cases'].items():
+            print(f"  {case:<28} p50 {metrics['p50_ms']:7.2f} ms  p95 {metrics['p95_ms']:7.2f} ms  "
+                  f"{metrics['queries']:6.1f} queries  peak {metrics['peak_kb']:8.1f} KiB")
+    print(f"Results written to {output}")
+
+@bench_cli.command("compare", help="Reports metric changes between two benchmark result files")
+@click.argument("baseline")
+@click.argument("current")
+@click.option("--threshold", default=0.2, help="Relative change that counts as a regression")
+def bench_compare_command(baseline, current, threshold):
+    rows = compare_results(load_results(baseline), load_results(current), threshold)
+    print(format_report(rows))
+    if any(row['status'] == 'regression' for row in rows):
+        sys.exit(1)
+
+@bench_cli.command("metrics", help="Measures the request latency overhead of recording metrics")
+@click.argument("route_id", type=int)
+@click.option("--rounds", default=20, help="Rounds with metrics off and on")
+@click.option("--requests", default=50, help="Requests per round")
+def bench_metrics_command(route_id, rounds, requests):
+    urls = [f'/api/routes/{route_id}', '/api/stops/search?q=a', '/health/db']
+    result = benchmark_metrics_overhead(app.test_client(), urls, rounds, requests)
+    print(f"{result['requests']} requests per mode: off {result['off_ms']:.3f}ms, on {result['on_ms']:.3f}ms, "
+          f"overhead {result['overhead'] * 100:+.2f}%")
+
+app.cli.add_command(bench_cli)
+
 '''
 User Commands
 '''
@@ -691,6 +902,7 @@ test = AppGroup('test', help='Testing commands')
 @test.command("user", help="Run User tests")
 @click.argument("type", default="all")
 def user_tests_command(type):
+    import pytest
     if type == "unit":
         sys.exit(pytest.main(["-k", "UserUnitTests"]))
     elif type == "int":
@@ -701,6 +913,7 @@ def user_tests_command(type):
 @test.command("journey", help="Run Journey tests")
 @click.argument("type", default="all")
 def journey_tests_command(type):
+    import pytest
     if type == "unit":
         sys.exit(pytest.main(["-k", "JourneyUnitTests"]))
     elif type == "int":